@@ -0,0 +1,331 @@
+"""Vision compliance analysis pipeline shared by the app and the batch CLI.
+
+Covers image preprocessing, the prompt and OpenAI request, decoding the
+response into an ``AnalysisResult``, storing the image in Supabase storage
+and shaping the result into an ``analysis_results`` row.
+"""
+import base64
+import json
+import logging
+from datetime import datetime
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from pydantic import ValidationError
+
+from analysis_result import decode_multi_response, decode_result
+
+logger = logging.getLogger(__name__)
+
+VISION_MODEL = "gpt-4o"
+# Cheaper, faster model tried first when routing is enabled
+FAST_VISION_MODEL = "gpt-4o-mini"
+
+DEFAULT_ROUTING_CONFIG = {
+    'enabled': True,
+    'fast_model': FAST_VISION_MODEL,
+    'full_model': VISION_MODEL,
+    # Fast-model answers below this self-reported confidence go to the full model
+    'min_confidence': 0.7,
+    'escalate_statuses': ["Unable to determine"],
+    'escalate_severities': ["Critical", "Major"],
+}
+
+# Longest image side sent to the model; the API downsamples larger images anyway
+MAX_IMAGE_SIDE = 2048
+
+IMAGE_BUCKET = "images"
+IMAGE_FOLDER = "cafeteria_images"
+
+# Times a response that fails validation is asked for again
+DECODE_RETRIES = 1
+
+IMAGE_LINKS_COLUMN = 'upload_links (images)'
+INLINE_IMAGE_PREFIX = "data:image"
+
+# Unique column identifying where an imported or batch-analyzed row came from
+IMPORT_KEY_COLUMN = 'import_key'
+
+
+class InlineImageError(ValueError):
+    """Raised when a row would store image bytes instead of a storage URL."""
+
+
+ANALYSIS_INSTRUCTIONS = """
+    INSTRUCTIONS:
+    1. Assess image quality (e.g., too dark, too blurry) and note its impact on your evaluation.
+    2. If the question explicitly requires a blank, empty, or clean area (e.g., "Take a blank photo if not applicable" or "Is the area clear?") and the image shows this, mark as "Yes" (compliant).
+    3. Dark or blurry images are compliant ONLY if:
+       - The question requires documentation of an empty, vacant, or clear area, AND
+       - Quality issues do not prevent confirming compliance.
+    4. Otherwise, dark or blurry images without context are non-compliant ("No").
+"""
+
+RESULT_FIELDS = """
+    - "criteria_met": "Yes" (compliant), "No" (non-compliant), or "Unable to determine" (quality prevents assessment)
+    - "explanation": 2-3 sentences explaining your assessment
+    - "improvements": Actionable recommendations if issues are found (empty string if none)
+    - "severity": "Critical" (immediate health risk), "Major" (significant violation), "Minor" (small issue), or "None" (compliant)
+    - "image_quality_issues": List of issues (e.g., ["too_dark", "too_blurry"], ["none"] if no issues)
+    - "quality_assessment": Brief comment on how image quality affected your evaluation
+    - "tags": List of 3-5 descriptive tags (e.g., kitchen, storage, cleanliness, etc.)
+    - "confidence": Number from 0 to 1 for how confident you are in "criteria_met"
+"""
+
+
+def _quality_note_text(quality_note):
+    if not quality_note:
+        return ""
+    return f"""
+    {quality_note} Use these measurements when assessing image quality.
+    """
+
+
+# Construct analysis prompt, optionally with local image quality measurements
+def build_analysis_prompt(question, quality_note=None):
+    prompt = f"""
+    You are a food safety manager analyzing a cafeteria image for compliance with food safety standards.
+    Question to evaluate: {question}
+{ANALYSIS_INSTRUCTIONS}
+    OUTPUT:
+    Return a JSON object with:{RESULT_FIELDS}    """
+    return prompt + _quality_note_text(quality_note)
+
+
+# Construct one prompt covering several questions about the same image
+def build_multi_question_prompt(questions, quality_note=None):
+    numbered = "\n".join(f"    Q{number}: {question}" for number, question in enumerate(questions, 1))
+    prompt = f"""
+    You are a food safety manager analyzing a cafeteria image for compliance with food safety standards.
+    Evaluate each of these questions about the same image independently:
+{numbered}
+{ANALYSIS_INSTRUCTIONS}
+    OUTPUT:
+    Return a JSON object with a "results" list holding one object per question, in question order. Each object has:
+    - "question_number": The question's number (1 for Q1, 2 for Q2, ...){RESULT_FIELDS}    """
+    return prompt + _quality_note_text(quality_note)
+
+
+# Convert a PIL image to base64-encoded PNG
+def encode_image_png(image):
+    buffered = BytesIO()
+    image.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode()
+
+
+# Load, orient and downscale an image file and return its PNG bytes.
+# Module-level so it can run on a process pool.
+def prepare_image(path, max_side=MAX_IMAGE_SIDE):
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((max_side, max_side))
+        buffered = BytesIO()
+        image.save(buffered, format="PNG")
+        return buffered.getvalue()
+
+
+def _request_content(client, img_base64, prompt, model):
+    response = client.chat.completions.create(
+        model=model,
+        messages=[{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url",
+                 "image_url": {"url": f"data:image/png;base64,{img_base64}"}
+                }
+            ]
+        }],
+        response_format={"type": "json_object"}
+    )
+    return response.choices[0].message.content
+
+
+def _describe_validation_error(error):
+    return "; ".join(f"{'.'.join(str(part) for part in detail['loc']) or 'response'}: {detail['msg']}"
+                     for detail in error.errors()[:3])
+
+
+# Request and decode a response, asking again when it fails validation.
+# Raises ValueError when every attempt was malformed.
+def _request_decoded(client, img_base64, prompt, model, decode):
+    for attempt in range(DECODE_RETRIES + 1):
+        content = _request_content(client, img_base64, prompt, model)
+        try:
+            return decode(content)
+        except ValidationError as e:
+            reason = _describe_validation_error(e)
+            if attempt == DECODE_RETRIES:
+                raise ValueError(f"malformed response from {model}: {reason}") from None
+            logger.warning(f"Malformed response from {model} ({reason}); asking again")
+
+
+# Send one image and question to the vision model and return an AnalysisResult
+def request_analysis(client, img_base64, question, model=VISION_MODEL, quality_note=None):
+    return _request_decoded(client, img_base64, build_analysis_prompt(question, quality_note), model,
+                            decode_result)
+
+
+# Send one image with several questions in a single request and return one result per question.
+# Raises ValueError when the response doesn't hold a usable result for every question.
+def request_multi_analysis(client, img_base64, questions, model=VISION_MODEL, quality_note=None):
+    results = _request_decoded(client, img_base64, build_multi_question_prompt(questions, quality_note), model,
+                               decode_multi_response)
+    if len(results) != len(questions):
+        raise ValueError(f"expected {len(questions)} results, got {len(results)}")
+    numbers = [result.question_number for result in results]
+    if all(number is not None for number in numbers):
+        if sorted(numbers) != list(range(1, len(questions) + 1)):
+            raise ValueError(f"unexpected question numbers {numbers}")
+        results = sorted(results, key=lambda result: result.question_number)
+    return results
+
+
+def routing_config(overrides=None):
+    config = dict(DEFAULT_ROUTING_CONFIG)
+    config.update({key: value for key, value in (overrides or {}).items() if key in config})
+    return config
+
+
+# Why a fast-model result should be re-checked by the full model, or None
+def escalation_reason(result, config):
+    if result.criteria_met in config['escalate_statuses']:
+        return f"criteria_met {result.criteria_met}"
+    if result.severity in config['escalate_severities']:
+        return f"severity {result.severity}"
+    if result.confidence is None:
+        return "no confidence reported"
+    if result.confidence < config['min_confidence']:
+        return f"confidence {result.confidence:.2f}"
+    return None
+
+
+def _answered_by(result, model, tier, reason=None):
+    result.model = model
+    result.model_tier = tier
+    result.escalation_reason = reason
+    return result
+
+
+def request_routed_analysis(client, img_base64, question, config=None, quality_note=None):
+    """Ask the fast model first and escalate to the full model when needed.
+
+    The result records the answering model in ``model`` and ``model_tier``
+    ("fast" or "full"), and why it was escalated in ``escalation_reason``.
+    """
+    config = config or DEFAULT_ROUTING_CONFIG
+    reason = None
+    if config['enabled']:
+        try:
+            result = request_analysis(client, img_base64, question, config['fast_model'], quality_note)
+            reason = escalation_reason(result, config)
+        except Exception as e:
+            reason = f"fast model failed: {e}"
+        if reason is None:
+            return _answered_by(result, config['fast_model'], "fast")
+        logger.info(f"Escalating to {config['full_model']}: {reason}")
+
+    result = request_analysis(client, img_base64, question, config['full_model'], quality_note)
+    return _answered_by(result, config['full_model'], "full", reason)
+
+
+def request_question_set(client, img_base64, questions, config=None, quality_note=None):
+    """Answer several questions about one image, sharing the image across one request per model.
+
+    Fast-model answers that need escalation are re-asked together in one
+    full-model request. When a multi-question response is malformed, every
+    question is asked on its own instead.
+    """
+    config = config or DEFAULT_ROUTING_CONFIG
+    if len(questions) == 1:
+        return [request_routed_analysis(client, img_base64, questions[0], config, quality_note)]
+
+    try:
+        first_model = config['fast_model'] if config['enabled'] else config['full_model']
+        results = request_multi_analysis(client, img_base64, questions, first_model, quality_note)
+        escalations = {}
+        for position, result in enumerate(results):
+            reason = escalation_reason(result, config) if config['enabled'] else None
+            if reason:
+                escalations[position] = reason
+            else:
+                _answered_by(result, first_model, "fast" if config['enabled'] else "full")
+        if escalations:
+            logger.info(f"Escalating {len(escalations)} of {len(questions)} questions to {config['full_model']}")
+            full_results = request_multi_analysis(client, img_base64, [questions[p] for p in escalations],
+                                                  config['full_model'], quality_note)
+            for (position, reason), result in zip(escalations.items(), full_results):
+                results[position] = _answered_by(result, config['full_model'], "full", reason)
+        return results
+    except ValueError as e:
+        logger.warning(f"Multi-question response unusable ({e}); asking each question separately")
+        return [request_routed_analysis(client, img_base64, question, config, quality_note)
+                for question in questions]
+
+
+# Upload image bytes to Supabase storage and return the public URL
+def upload_image(client, image_data, file_name, bucket=IMAGE_BUCKET, folder=IMAGE_FOLDER,
+                 content_type="image/png"):
+    # Create the bucket if it doesn't exist
+    try:
+        client.storage.create_bucket(bucket, {"public": True})
+    except Exception as e:
+        if "already exists" not in str(e):
+            raise e
+
+    file_path = f"{folder}/{file_name}"
+    client.storage.from_(bucket).upload(
+        path=file_path,
+        file=image_data,
+        file_options={"content-type": content_type}
+    )
+    return client.storage.from_(bucket).get_public_url(file_path)
+
+
+def is_inline_image(value):
+    return isinstance(value, str) and value.lstrip().startswith(INLINE_IMAGE_PREFIX)
+
+
+# Split a data:image/...;base64 URI into its content type and decoded bytes
+def decode_inline_image(value):
+    header, _, data = value.strip().partition(',')
+    content_type = header[len("data:"):].split(';')[0] or "image/png"
+    return content_type, base64.b64decode(data)
+
+
+# Images must live in storage; rows only hold their URLs
+def reject_inline_images(rows):
+    for row in rows:
+        if is_inline_image(row.get(IMAGE_LINKS_COLUMN)):
+            raise InlineImageError(
+                f"{IMAGE_LINKS_COLUMN} holds inline image data; upload the image to storage and store its URL")
+
+
+# Shape an AnalysisResult into an analysis_results row
+def build_analysis_row(result, cafeteria_name, question, image_url=None, analysis_date=None):
+    return {
+        'question': question,
+        IMAGE_LINKS_COLUMN: json.dumps([image_url]) if image_url else None,
+        'answer_type': 'boolean',
+        'cafeteria name': cafeteria_name,
+        **result.to_columns(),
+        **result.model_columns(),
+        'analysis_date': analysis_date or datetime.now().date().isoformat(),
+    }
+
+
+# Insert analysis rows in one request and return the stored rows
+def insert_analysis_rows(client, rows, table='analysis_results'):
+    reject_inline_images(rows)
+    response = client.table(table).insert(rows).execute()
+    return response.data or []
+
+
+# Upsert analysis rows on their import key, so writing the same rows again
+# after a retry or a crash overwrites them instead of duplicating them
+def upsert_analysis_rows(client, rows, table='analysis_results'):
+    reject_inline_images(rows)
+    if any(not row.get(IMPORT_KEY_COLUMN) for row in rows):
+        raise ValueError(f"Rows need an {IMPORT_KEY_COLUMN} to be upserted")
+    response = client.table(table).upsert(rows, on_conflict=IMPORT_KEY_COLUMN).execute()
+    return response.data or []
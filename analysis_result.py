@@ -0,0 +1,152 @@
+"""Typed vision analysis result and its decoder.
+
+The model answers with a JSON object whose list fields (``tags``,
+``image_quality_issues``) sometimes arrive as comma-joined strings and whose
+``improvements`` sometimes arrives as a list. ``decode_result`` validates
+the raw response with a compiled pydantic validator and normalizes those
+fields once, so every consumer reads the same shapes from an
+``AnalysisResult``: lists are lists, text is text, and "no quality issues"
+is an empty list.
+"""
+from dataclasses import asdict, dataclass, field
+from typing import Annotated, Optional
+
+from pydantic import BeforeValidator, TypeAdapter
+
+COMPLIANCE_STATUSES = ("Yes", "No", "Unable to determine")
+SEVERITY_LEVELS = ("Critical", "Major", "Minor", "None")
+
+
+def _split_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list):
+        return value
+    # "none" means an empty list, however the model spells it
+    return [item.strip() for item in value
+            if isinstance(item, str) and item.strip() and item.strip().lower() != 'none']
+
+
+def _join_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "\n".join(str(item).strip() for item in value if str(item).strip())
+    return value
+
+
+def _choice(choices, default=None):
+    lookup = {choice.lower(): choice for choice in choices}
+
+    def normalize(value):
+        if value is None and default is not None:
+            return default
+        if isinstance(value, str) and value.strip().lower() in lookup:
+            return lookup[value.strip().lower()]
+        raise ValueError(f"expected one of {', '.join(choices)}, got {value!r}")
+    return normalize
+
+
+def _confidence(value):
+    # Unusable confidences count as unreported; percentages are scaled to 0-1
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if value > 1:
+        value /= 100
+    return value if 0 <= value <= 1 else None
+
+
+TextList = Annotated[list[str], BeforeValidator(_split_list)]
+Text = Annotated[str, BeforeValidator(_join_text)]
+
+
+@dataclass(slots=True)
+class AnalysisResult:
+    criteria_met: Annotated[str, BeforeValidator(_choice(COMPLIANCE_STATUSES))]
+    explanation: Text = ""
+    improvements: Text = ""
+    severity: Annotated[str, BeforeValidator(_choice(SEVERITY_LEVELS, default="None"))] = "None"
+    image_quality_issues: TextList = field(default_factory=list)
+    quality_assessment: Text = ""
+    tags: TextList = field(default_factory=list)
+    confidence: Annotated[Optional[float], BeforeValidator(_confidence)] = None
+    # Set by the pipeline, not the model
+    model: Optional[str] = None
+    model_tier: Optional[str] = None
+    escalation_reason: Optional[str] = None
+
+    def to_dict(self):
+        return asdict(self)
+
+    def to_columns(self):
+        # The result's analysis_results / feedback columns
+        return {
+            'compliance_status': self.criteria_met,
+            'explanation': self.explanation,
+            'improvement_suggestions': self.improvements,
+            'severity_level': self.severity,
+            'image_quality_issues': ', '.join(self.image_quality_issues) or 'none',
+            'quality_assessment': self.quality_assessment,
+            'tags': ', '.join(self.tags),
+        }
+
+    def model_columns(self):
+        # Which model answered; analysis_results has these columns, feedback doesn't
+        return {
+            'model': self.model,
+            'model_tier': self.model_tier,
+            'escalation_reason': self.escalation_reason,
+        }
+
+
+@dataclass(slots=True)
+class NumberedResult(AnalysisResult):
+    question_number: Optional[int] = None
+
+
+@dataclass(slots=True)
+class MultiQuestionResponse:
+    results: list[NumberedResult]
+
+
+_RESULT = TypeAdapter(AnalysisResult)
+_MULTI_RESPONSE = TypeAdapter(MultiQuestionResponse)
+
+
+def decode_result(content):
+    """Validate a model response (JSON text) into an ``AnalysisResult``.
+
+    Raises ``pydantic.ValidationError`` (a ``ValueError``) when the response
+    is not JSON or lacks a valid ``criteria_met``.
+    """
+    return _RESULT.validate_json(content)
+
+
+def decode_multi_response(content):
+    """Validate a multi-question response into a list of ``NumberedResult``."""
+    return _MULTI_RESPONSE.validate_json(content).results
+
+
+def result_from_dict(data):
+    # Results stored as JSON objects, e.g. in the near-duplicate index
+    return _RESULT.validate_python(data)
+
+
+def result_from_columns(row):
+    # Results stored as analysis_results columns; the inverse of to_columns and model_columns
+    return _RESULT.validate_python({
+        'criteria_met': row.get('compliance_status'),
+        'explanation': row.get('explanation'),
+        'improvements': row.get('improvement_suggestions'),
+        'severity': row.get('severity_level'),
+        'image_quality_issues': row.get('image_quality_issues'),
+        'quality_assessment': row.get('quality_assessment'),
+        'tags': row.get('tags'),
+        'model': row.get('model'),
+        'model_tier': row.get('model_tier'),
+        'escalation_reason': row.get('escalation_reason'),
+    })
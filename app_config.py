@@ -0,0 +1,41 @@
+"""Settings and clients for the command-line tools.
+
+The Streamlit app reads ``st.secrets``; the CLIs read the same
+``.streamlit/secrets.toml`` file directly, with environment variables
+taking precedence so they can run on machines without the secrets file.
+"""
+import os
+import tomllib
+
+from supabase import create_client
+
+SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+
+# Environment variable overrides for secrets entries
+ENV_OVERRIDES = {
+    ("supabase", "url"): "SUPABASE_URL",
+    ("supabase", "key"): "SUPABASE_KEY",
+    ("openai", "api_key"): "OPENAI_API_KEY",
+}
+
+
+def load_secrets(path=SECRETS_PATH):
+    secrets = {}
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            secrets = tomllib.load(f)
+
+    for (section, key), env_name in ENV_OVERRIDES.items():
+        if os.environ.get(env_name):
+            secrets.setdefault(section, {})[key] = os.environ[env_name]
+    return secrets
+
+
+def create_supabase_client(secrets=None):
+    secrets = secrets if secrets is not None else load_secrets()
+    try:
+        return create_client(secrets["supabase"]["url"], secrets["supabase"]["key"])
+    except KeyError:
+        raise SystemExit(
+            f"Supabase credentials missing: set SUPABASE_URL and SUPABASE_KEY or create {SECRETS_PATH}"
+        )
@@ -0,0 +1,169 @@
+"""Add the photos already stored in ``analysis_results`` to the near-duplicate index.
+
+The app and the batch CLI hash the photos they analyze. This job covers the
+photos saved before that: it pages through ``analysis_results``, downloads
+each row's image (from Supabase storage, any other URL, or an inline data
+URI) on a thread pool, hashes it and appends one entry per row to the index
+file. Rows already in the index are skipped: by id, by image URL and
+question for entries written without an id (batch runs), and, one row per
+entry, by an identical hash and question for older app entries that have
+neither. It can be stopped and re-run at any time. Stop the app or restart it afterwards, since
+every app process keeps its own copy of the index in memory.
+
+    python backfill_image_hashes.py --workers 8
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import unquote
+
+import requests
+from pydantic import ValidationError
+
+import dashboard_data
+from analysis_pipeline import IMAGE_LINKS_COLUMN, decode_inline_image, is_inline_image
+from analysis_result import result_from_columns
+from duplicate_index import DuplicateIndex, duplicate_config, image_file_dhash, make_entry, normalize_question
+from record_renderer import image_link
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'analysis_results'
+DEFAULT_WORKERS = 8
+MAX_ATTEMPTS = 3
+DOWNLOAD_TIMEOUT = 30
+STORAGE_URL_MARKER = "/storage/v1/object/public/"
+
+
+def _with_retries(fn, description):
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            logger.warning(f"{description} failed (attempt {attempt}): {e}")
+            time.sleep(2 ** attempt)
+
+
+def indexed_keys(path):
+    """What the index file already covers: row ids, ``(image URL, question)`` pairs,
+    and a count of the entries with neither per ``(hash, question)``."""
+    ids, links, unlinked = set(), set(), Counter()
+    try:
+        with open(path, "rb") as f:
+            for line in f:
+                if line.endswith(b"\n") and len(line) > 17:
+                    entry = json.loads(line[17:])
+                    question = normalize_question(entry.get('question'))
+                    if entry.get('id') is not None:
+                        ids.add(entry['id'])
+                    elif entry.get('image_url'):
+                        links.add((entry['image_url'], question))
+                    else:
+                        unlinked[(int(line[:16], 16), question)] += 1
+    except FileNotFoundError:
+        pass
+    return ids, links, unlinked
+
+
+def fetch_image(client, link):
+    """Bytes of the image at ``link``; Supabase storage links are read through the client."""
+    if is_inline_image(link):
+        return decode_inline_image(link)[1]
+    if STORAGE_URL_MARKER in link:
+        bucket, _, path = link.split(STORAGE_URL_MARKER, 1)[1].partition('/')
+        return client.storage.from_(bucket).download(unquote(path))
+    response = requests.get(link, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    return response.content
+
+
+def backfill_image_hashes(client, index, table=TABLE_NAME, workers=DEFAULT_WORKERS):
+    """Hash the stored image of every row missing from ``index``; returns counts.
+
+    Rows sharing one image, like the answers of a multi-question analysis,
+    download and hash it once.
+    """
+    counts = {'rows': 0, 'indexed': 0, 'already_indexed': 0, 'no_image': 0, 'failed': 0}
+    records = dashboard_data.fetch_all_records(client, table)
+    counts['rows'] = len(records)
+    done_ids, done_links, unlinked = indexed_keys(index.path)
+
+    rows_by_link = {}
+    for record in records:
+        link = image_link(record.get(IMAGE_LINKS_COLUMN))
+        if record.get('id') in done_ids or (link, normalize_question(record.get('question'))) in done_links:
+            counts['already_indexed'] += 1
+            continue
+        if link is None:
+            counts['no_image'] += 1
+            continue
+        rows_by_link.setdefault(link, []).append(record)
+    logger.info(f"{len(records)} rows: {len(rows_by_link)} images to hash, {counts['already_indexed']} rows "
+                f"indexed already, {counts['no_image']} without an image")
+
+    def hash_link(link):
+        data = _with_retries(lambda: fetch_image(client, link), f"Download of {link[:80]}")
+        return image_file_dhash(BytesIO(data))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [(link, pool.submit(hash_link, link)) for link in rows_by_link]
+        for position, (link, future) in enumerate(futures, start=1):
+            rows = rows_by_link[link]
+            try:
+                image_hash = future.result()
+            except Exception as e:
+                logger.error(f"Could not hash the image of rows {[row.get('id') for row in rows]}: {e}")
+                counts['failed'] += len(rows)
+                continue
+            for row in rows:
+                # Entries the app wrote before it stored ids stand in for one row each
+                key = (image_hash, normalize_question(row.get('question')))
+                if unlinked[key]:
+                    unlinked[key] -= 1
+                    counts['already_indexed'] += 1
+                    continue
+                try:
+                    result = result_from_columns(row)
+                except ValidationError as e:
+                    logger.warning(f"Skipping row {row.get('id')}: {e.error_count()} validation errors")
+                    counts['failed'] += 1
+                    continue
+                # Inline images are not kept in the index; the panel shows no thumbnail for them
+                index.add(image_hash, make_entry(result, row.get('cafeteria name'), row.get('question'),
+                                                 row.get('analysis_date'),
+                                                 image_url=None if is_inline_image(link) else link,
+                                                 analysis_id=row.get('id')))
+                counts['indexed'] += 1
+            if position % 500 == 0:
+                logger.info(f"{position}/{len(futures)} images hashed")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="concurrent image downloads")
+    parser.add_argument("--index", help="index file (default: the [duplicates] index_path setting)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from app_config import create_supabase_client, load_secrets
+
+    secrets = load_secrets()
+    index = DuplicateIndex(args.index or duplicate_config(secrets.get("duplicates"))['index_path'])
+    start = time.perf_counter()
+    counts = backfill_image_hashes(create_supabase_client(secrets), index, workers=args.workers)
+    logger.info(f"Finished in {time.perf_counter() - start:.1f}s: {counts['indexed']} rows indexed, "
+                f"{counts['already_indexed']} indexed already, {counts['no_image']} without an image, "
+                f"{counts['failed']} failed")
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""Headless batch compliance analysis of inspection photos.
+
+Takes either a directory of images (the cafeteria comes from ``--cafeteria``
+or each image's parent folder, the question from ``--question``) or a
+manifest (CSV or JSON lines with ``cafeteria``, ``question`` and ``image``
+columns, image paths relative to the manifest). Images are preprocessed on a
+process pool, analysis requests are sent concurrently under a rate limit,
+and every result is appended to a local JSONL checkpoint before being
+upserted into ``analysis_results`` in batches, keyed on the job (cafeteria,
+question and image path) in the ``import_key`` column. Photos are checked
+locally for exposure and blur first; with ``mode = "reject"`` in the
+``[quality]`` secrets section, failing photos are recorded without a model
+call. Analyzed photos are added to the app's near-duplicate index. Model
+calls, uploads and inserts back off on 429s and pause after repeated
+failures (see ``resilience.py``). Re-running the same command after a crash
+skips finished work: analyzed-but-not-inserted results are inserted without calling the
+model again, and rows that landed before the crash are overwritten rather
+than duplicated.
+
+    python batch_analyze.py --dir photos/2025-04-07 --question "Is the area clear?"
+    python batch_analyze.py --manifest overnight.csv --workers 8 --rpm 300
+"""
+import argparse
+import base64
+import csv
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from analysis_pipeline import (
+    IMPORT_KEY_COLUMN,
+    build_analysis_row,
+    prepare_image,
+    request_routed_analysis,
+    routing_config,
+    upload_image,
+    upsert_analysis_rows,
+)
+from duplicate_index import DuplicateIndex, duplicate_config, image_file_dhash, make_entry
+from image_quality import (
+    describe_quality,
+    measure_quality_file,
+    merge_quality_issues,
+    quality_config,
+    rejected_result,
+    should_reject,
+)
+from resilience import DependencyUnavailable, build_dependency, guard_openai_client, limits_config
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+DEFAULT_WORKERS = 4
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_INSERT_BATCH = 50
+MAX_ATTEMPTS = 3
+
+
+def job_id(cafeteria, question, image_path):
+    key = f"{cafeteria}|{question}|{os.path.abspath(image_path)}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def jobs_from_directory(directory, question, cafeteria=None):
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            name_for_job = cafeteria or os.path.basename(os.path.dirname(path))
+            yield {'cafeteria': name_for_job, 'question': question, 'image': path}
+
+
+def jobs_from_manifest(manifest_path):
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, newline="") as f:
+        if manifest_path.endswith((".jsonl", ".json")):
+            entries = (json.loads(line) for line in f if line.strip())
+        else:
+            entries = csv.DictReader(f)
+        for entry in entries:
+            image = entry['image']
+            if not os.path.isabs(image):
+                image = os.path.join(base_dir, image)
+            yield {'cafeteria': entry['cafeteria'].strip(), 'question': entry['question'].strip(), 'image': image}
+
+
+class BatchCheckpoint:
+    """Append-only JSONL log of analyzed and inserted jobs."""
+
+    def __init__(self, path):
+        self.path = path
+        self.analyzed = {}
+        self.inserted = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if entry['event'] == 'analyzed':
+                        self.analyzed[entry['job_id']] = entry['row']
+                    elif entry['event'] == 'inserted':
+                        self.inserted.update(entry['job_ids'])
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+
+    def pending_inserts(self):
+        return {job: row for job, row in self.analyzed.items() if job not in self.inserted}
+
+    def _append(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def record_analyzed(self, job, row):
+        self._append({'event': 'analyzed', 'job_id': job, 'row': row})
+        self.analyzed[job] = row
+
+    def record_inserted(self, jobs):
+        self._append({'event': 'inserted', 'job_ids': jobs})
+        self.inserted.update(jobs)
+
+    def close(self):
+        self._file.close()
+
+
+def _with_retries(fn, description):
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            logger.warning(f"{description} failed (attempt {attempt}): {e}")
+            # An open circuit breaker says how long the dependency needs
+            retry_after = (e.retry_after or 0) if isinstance(e, DependencyUnavailable) else 0
+            time.sleep(max(2 ** attempt, retry_after))
+
+
+# Preprocess an image, measure its quality and hash it in the same worker
+# process. Module-level so it can run on a process pool.
+def prepare_and_check(path, quality_settings):
+    return prepare_image(path), measure_quality_file(path, quality_settings), image_file_dhash(path)
+
+
+def analyze_job(openai_client, supabase_client, dependencies, job, image_data, upload=True,
+                quality_report=None, quality_settings=None, image_hash=None, duplicate_index=None,
+                routing_settings=None):
+    if quality_report and should_reject(quality_report, quality_settings):
+        logger.info(f"{job['image']} rejected by local quality check: {', '.join(quality_report['issues'])}")
+        result = rejected_result(quality_report)
+    else:
+        img_base64 = base64.b64encode(image_data).decode()
+        quality_note = describe_quality(quality_report) if quality_report else None
+        result = _with_retries(
+            lambda: request_routed_analysis(openai_client, img_base64, job['question'], routing_settings,
+                                            quality_note=quality_note),
+            f"Analysis of {job['image']}")
+        logger.info(f"{job['image']} answered by {result.model}")
+        if quality_report:
+            result = merge_quality_issues(result, quality_report)
+
+    image_url = None
+    if upload:
+        stem = os.path.splitext(os.path.basename(job['image']))[0]
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_name = f"{job['cafeteria'].replace(' ', '_')}_{stem}_{timestamp}.png"
+        image_url = _with_retries(lambda: dependencies['storage'].call(upload_image, supabase_client,
+                                                                      image_data, file_name),
+                                  f"Upload of {job['image']}")
+    row = build_analysis_row(result, job['cafeteria'], job['question'], image_url)
+    if duplicate_index is not None and image_hash is not None:
+        duplicate_index.add(image_hash, make_entry(result, job['cafeteria'], job['question'],
+                                                   row['analysis_date'], image_url))
+    return row
+
+
+def run_batch(jobs, openai_client, supabase_client, checkpoint_path, workers=DEFAULT_WORKERS,
+              requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, insert_batch=DEFAULT_INSERT_BATCH,
+              preprocess_workers=None, upload=True, quality_settings=None, duplicate_index=None,
+              routing_settings=None, limits=None):
+    """Analyze ``jobs``, insert the results and return analyzed/inserted/failed counts.
+
+    Model calls, uploads and inserts go through adaptive limiters and circuit
+    breakers configured by ``limits`` (see ``resilience.limits_config``);
+    ``requests_per_minute`` and ``workers`` cap the OpenAI limiter.
+    """
+    quality_settings = quality_settings or quality_config()
+    checkpoint = BatchCheckpoint(checkpoint_path)
+    settings = limits_config(limits)
+    settings['openai'] = dict(settings['openai'], rate_per_second=requests_per_minute / 60.0, burst=workers,
+                              max_concurrency=workers)
+    dependencies = {name: build_dependency(name, dependency_settings)
+                    for name, dependency_settings in settings.items()}
+    # Escalations to the full model go through the limiter too
+    openai_client = guard_openai_client(openai_client, dependencies['openai'])
+    to_insert = checkpoint.pending_inserts()
+    counts = {'analyzed': 0, 'inserted': 0, 'failed': 0}
+
+    def flush_inserts(force=False):
+        while to_insert and (force or len(to_insert) >= insert_batch):
+            batch_jobs = list(to_insert)[:insert_batch]
+            # Keyed on the job id, so a write that timed out but landed, or one
+            # repeated after a crash, overwrites its row instead of adding another
+            rows = [dict(to_insert[job], **{IMPORT_KEY_COLUMN: job}) for job in batch_jobs]
+            _with_retries(lambda: dependencies['supabase'].call(upsert_analysis_rows, supabase_client, rows),
+                          f"Insert of {len(rows)} rows")
+            checkpoint.record_inserted(batch_jobs)
+            for job in batch_jobs:
+                del to_insert[job]
+            counts['inserted'] += len(rows)
+            logger.info(f"Inserted {counts['inserted']} rows")
+
+    # Results left over from a crashed run go in first
+    flush_inserts(force=True)
+
+    max_in_flight = workers * 2
+    try:
+        with ProcessPoolExecutor(max_workers=preprocess_workers) as process_pool, \
+                ThreadPoolExecutor(max_workers=workers) as request_pool:
+            preprocessing = {}
+            requests_in_flight = {}
+
+            def collect(done):
+                for future in done:
+                    if future in preprocessing:
+                        job = preprocessing.pop(future)
+                        try:
+                            image_data, quality_report, image_hash = future.result()
+                        except Exception as e:
+                            logger.error(f"Could not read {job['image']}: {e}")
+                            counts['failed'] += 1
+                            continue
+                        analysis = request_pool.submit(analyze_job, openai_client, supabase_client,
+                                                       dependencies, job, image_data, upload,
+                                                       quality_report, quality_settings, image_hash,
+                                                       duplicate_index, routing_settings)
+                        requests_in_flight[analysis] = job
+                    else:
+                        job = requests_in_flight.pop(future)
+                        try:
+                            row = future.result()
+                        except Exception as e:
+                            logger.error(f"Analysis of {job['image']} failed: {e}")
+                            counts['failed'] += 1
+                            continue
+                        checkpoint.record_analyzed(job['id'], row)
+                        to_insert[job['id']] = row
+                        counts['analyzed'] += 1
+                flush_inserts()
+
+            for job in jobs:
+                job['id'] = job_id(job['cafeteria'], job['question'], job['image'])
+                if job['id'] in checkpoint.analyzed:
+                    continue
+                preprocessing[process_pool.submit(prepare_and_check, job['image'], quality_settings)] = job
+                while len(preprocessing) + len(requests_in_flight) >= max_in_flight:
+                    done, _ = wait(list(preprocessing) + list(requests_in_flight), return_when=FIRST_COMPLETED)
+                    collect(done)
+
+            while preprocessing or requests_in_flight:
+                done, _ = wait(list(preprocessing) + list(requests_in_flight), return_when=FIRST_COMPLETED)
+                collect(done)
+
+        flush_inserts(force=True)
+    finally:
+        checkpoint.close()
+
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="directory of inspection photos")
+    source.add_argument("--manifest", help="CSV or JSONL with cafeteria, question and image columns")
+    parser.add_argument("--question", help="question to ask about every image (with --dir)")
+    parser.add_argument("--cafeteria", help="cafeteria for every image (default: the image's folder name)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="concurrent analysis requests")
+    parser.add_argument("--rpm", type=int, default=DEFAULT_REQUESTS_PER_MINUTE, help="max requests per minute")
+    parser.add_argument("--insert-batch", type=int, default=DEFAULT_INSERT_BATCH, help="rows per Supabase insert")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <dir or manifest>.analysis.jsonl)")
+    parser.add_argument("--no-upload", action="store_true", help="don't store images in Supabase storage")
+    args = parser.parse_args(argv)
+
+    if args.dir and not args.question:
+        parser.error("--question is required with --dir")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from openai import OpenAI
+
+    from app_config import create_supabase_client, load_secrets
+
+    secrets = load_secrets()
+    source_path = (args.dir or args.manifest).rstrip(os.sep)
+    checkpoint_path = args.checkpoint or f"{source_path}.analysis.jsonl"
+    jobs = (jobs_from_directory(args.dir, args.question, args.cafeteria) if args.dir
+            else jobs_from_manifest(args.manifest))
+
+    start = time.perf_counter()
+    counts = run_batch(
+        jobs,
+        OpenAI(api_key=secrets["openai"]["api_key"]),
+        create_supabase_client(secrets),
+        checkpoint_path,
+        workers=args.workers,
+        requests_per_minute=args.rpm,
+        insert_batch=args.insert_batch,
+        upload=not args.no_upload,
+        quality_settings=quality_config(secrets.get("quality")),
+        duplicate_index=DuplicateIndex(duplicate_config(secrets.get("duplicates"))['index_path']),
+        routing_settings=routing_config(secrets.get("routing")),
+        limits=secrets.get("limits"),
+    )
+    logger.info(f"Finished in {time.perf_counter() - start:.1f}s: {counts['analyzed']} analyzed, "
+                f"{counts['inserted']} inserted, {counts['failed']} failed (checkpoint: {checkpoint_path})")
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""Rerun time and options sent by the restaurant filter as cafeterias grow.
+
+Runs the Individual Records filter row in an ``AppTest`` session two ways:
+the previous widgets (a selectbox of every restaurant, and compliance and
+severity options from ``unique()`` and ``sorted()`` on each rerun) and the
+typeahead picker over the snapshot's dimension dictionaries, with and
+without a search typed into the picker. The time is that of the widget
+code inside the script, without AppTest's own per-run overhead:
+
+    python -m benchmarks.bench_filter_widgets --cafeterias 100 1000 10000
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+import dashboard_data
+from benchmarks.synthetic_data import generate_analysis_results
+from dataset_store import DatasetSnapshot
+from dimensions import build_dimensions
+
+# Snapshot and frame read by the scripts below; set before each AppTest run
+CURRENT = {}
+
+SELECTBOX_SCRIPT = """
+import time
+import streamlit as st
+from benchmarks.bench_filter_widgets import CURRENT
+
+start = time.perf_counter()
+df = CURRENT['df']
+st.selectbox("Restaurant", ["All"] + sorted(df['cafeteria name'].unique()))
+st.selectbox("Compliance Status", ["All"] + sorted(df['compliance_status'].dropna().unique().tolist()))
+st.selectbox("Severity Level", ["All"] + sorted(df['severity_level'].dropna().unique().tolist()))
+CURRENT['elapsed'] = time.perf_counter() - start
+"""
+
+PICKER_SCRIPT = """
+import time
+from benchmarks.bench_filter_widgets import CURRENT
+from dimensions import render_dimension_select, render_restaurant_picker
+
+start = time.perf_counter()
+dimensions = CURRENT['snapshot'].dimensions
+render_restaurant_picker(dimensions['cafeteria name'], "Restaurant", key="restaurant")
+render_dimension_select(dimensions['compliance_status'], "Compliance Status", key="compliance")
+render_dimension_select(dimensions['severity_level'], "Severity Level", key="severity")
+CURRENT['elapsed'] = time.perf_counter() - start
+"""
+
+
+def measure(script, repeat, search=None):
+    times = []
+    for _ in range(repeat):
+        app = AppTest.from_string(script, default_timeout=120)
+        if search is not None:
+            app.session_state["restaurant_search"] = search
+        app.run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].value)
+        times.append(CURRENT['elapsed'])
+    options = sum(len(selectbox.options) for selectbox in app.selectbox)
+    return float(np.median(times)), options
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cafeterias", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--rows-per-cafeteria", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    # The scripts import CURRENT from this module, also when it runs as __main__
+    sys.modules.setdefault("benchmarks.bench_filter_widgets", sys.modules[__name__])
+    print(f"{'cafeterias':>10} {'widgets':<16} {'dict ms':>8} {'widgets ms':>10} {'options':>8}")
+    for n in args.cafeterias:
+        records = generate_analysis_results(n * args.rows_per_cafeteria, n_cafeterias=n)
+        CURRENT['snapshot'] = DatasetSnapshot(records)
+        CURRENT['df'] = dashboard_data.records_to_frame(records)
+        # One-off cost per snapshot of the dimension dictionaries
+        start = time.perf_counter()
+        build_dimensions(CURRENT['snapshot'].table)
+        build = time.perf_counter() - start
+        # Build the prefix index before timing, as the first search in the process would
+        CURRENT['snapshot'].dimensions['cafeteria name'].search("a")
+        runs = [("selectbox", SELECTBOX_SCRIPT, None), ("picker", PICKER_SCRIPT, None),
+                ("picker_search", PICKER_SCRIPT, "block a")]
+        for label, script, search in runs:
+            elapsed, options = measure(script, args.repeat, search)
+            build_ms = f"{build * 1000:.1f}" if label == "picker" else "-"
+            print(f"{n:>10} {label:<16} {build_ms:>8} {elapsed * 1000:>10.2f} {options:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
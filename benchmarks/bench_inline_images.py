@@ -0,0 +1,68 @@
+"""Table payload and load time before and after migrating inline images.
+
+Seeds the in-process Supabase stand-in with rows of which a fraction store
+base64 data-URI images, loads the dataset the way the dashboard does, runs
+``migrate_inline_images`` and loads it again:
+
+    python -m benchmarks.bench_inline_images --rows 20000 --inline-fraction 0.05
+
+The stand-in has no bandwidth limit, so an estimated transfer time at
+``--bandwidth-mbps`` is printed next to the measured load time.
+"""
+import argparse
+import sys
+import time
+
+import dashboard_data
+from benchmarks.fakes import FakeSupabase
+from benchmarks.synthetic_data import generate_analysis_results
+from dataset_store import DatasetSnapshot
+from migrate_inline_images import migrate_inline_images
+
+
+def measure_load(supabase, bandwidth_mbps):
+    sent_before = supabase.bytes_sent
+    start = time.perf_counter()
+    snapshot = DatasetSnapshot(dashboard_data.fetch_all_records(supabase, 'analysis_results'))
+    elapsed = time.perf_counter() - start
+    payload = supabase.bytes_sent - sent_before
+    return {
+        'payload_mb': payload / 1e6,
+        'load_s': elapsed,
+        'transfer_s': payload * 8 / (bandwidth_mbps * 1e6),
+        'dataset_mb': snapshot.nbytes / 1e6,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--inline-fraction", type=float, default=0.05, help="share of rows with inline images")
+    parser.add_argument("--image-side", type=int, default=256, help="side of the inline PNGs in pixels")
+    parser.add_argument("--supabase-latency-ms", type=float, default=20.0, help="added latency per Supabase request")
+    parser.add_argument("--bandwidth-mbps", type=float, default=100.0, help="link speed for the transfer estimate")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    records = generate_analysis_results(args.rows, n_cafeterias=200, inline_image_fraction=args.inline_fraction,
+                                        inline_image_side=args.image_side)
+    supabase = FakeSupabase({'analysis_results': records}, latency=args.supabase_latency_ms / 1000,
+                            not_null={'analysis_results': ['cafeteria name', 'question']})
+
+    before = measure_load(supabase, args.bandwidth_mbps)
+    start = time.perf_counter()
+    counts = migrate_inline_images(supabase, workers=args.workers)
+    migration_s = time.perf_counter() - start
+    after = measure_load(supabase, args.bandwidth_mbps)
+
+    print(f"Migrated {counts['migrated']} rows ({counts['inline_bytes'] / 1e6:.1f} MB inline) "
+          f"in {migration_s:.1f}s, {counts['failed']} failed")
+    print(f"{'':<8} {'payload MB':>11} {'load s':>8} {'transfer s':>11} {'dataset MB':>11}")
+    for label, result in (("before", before), ("after", after)):
+        print(f"{label:<8} {result['payload_mb']:>11.1f} {result['load_s']:>8.2f} "
+              f"{result['transfer_s']:>11.2f} {result['dataset_mb']:>11.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+"""Load test: N concurrent sessions navigating the full dashboard app.
+
+Each session is an ``AppTest`` of ``vision_analysis_app.py`` driven from its
+own thread, so the sessions share one process and its ``st.cache_resource``
+state the way browser sessions share a Streamlit server. Supabase and OpenAI
+are the in-process fakes. Every round a session:
+
+* opens the Overview, then Restaurant Analysis with a searched restaurant,
+* filters Individual Records and turns a page,
+* submits a photo in the Visual Analyzer every ``--analyze-every`` rounds.
+
+Each action is one rerun. The report gives rerun latency percentiles,
+reruns per second and peak RSS per session count; each count runs in a fresh
+subprocess so peak RSS is comparable:
+
+    python -m benchmarks.bench_load --sessions 1 5 10 --rounds 3
+    python -m benchmarks.bench_load --sessions 10 --save load_baseline
+    python -m benchmarks.bench_load --sessions 10 --compare load_baseline --max-p95-ms 2000
+
+``--compare`` checks the median rerun time per session count against a
+saved run; ``--max-p95-ms`` and ``--max-rss-mb`` fail the run outright.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from io import BytesIO
+from unittest import mock
+
+import numpy as np
+
+from benchmarks.bench_sessions import current_rss_mb, peak_rss_mb
+from benchmarks.fakes import FakeOpenAI, FakeSupabase
+from benchmarks.harness import DEFAULT_TOLERANCE, compare_results, load_results, save_results
+from benchmarks.synthetic_data import QUESTIONS, generate_analysis_results, generate_image
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "vision_analysis_app.py")
+ANALYZE_BUTTON = "FormSubmitter:vision_input_form-Analyze Compliance"
+
+
+class SessionUploads:
+    """Photo each session has in its uploader, handed out by the patched ``st.file_uploader``."""
+
+    def __init__(self, photos):
+        self.photos = photos
+        self.current = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def next_photo(self, session):
+        # A new photo for the session's next submission
+        with self._lock:
+            self.current[session] = self.photos[self._next % len(self.photos)]
+            self._next += 1
+
+    def patched_uploader(self, original):
+        import streamlit as st
+
+        def file_uploader(label, *args, **kwargs):
+            if not label.startswith("Upload Cafeteria"):
+                return original(label, *args, **kwargs)
+            photo = self.current.get(st.session_state.get("load_test_session"))
+            return BytesIO(photo) if photo is not None else None
+        return file_uploader
+
+
+@contextmanager
+def shared_server_state():
+    """Make concurrent ``AppTest`` runs share what one Streamlit server shares.
+
+    Each ``AppTest.run`` installs a stand-in ``Runtime`` and clears it when
+    it finishes, which fails any other session's run still in progress, and
+    compiles the script into a fresh ``ScriptCache``, which concurrent
+    compiles of the same file do not survive on every Python version. Here
+    ``Runtime.instance`` keeps returning the last runtime a run set up, and
+    every run gets the same script cache, so the app compiles once.
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    pinned = {}
+    script_cache = ScriptCache()
+
+    def instance(cls):
+        if cls._instance is not None:
+            pinned['runtime'] = cls._instance
+        if 'runtime' not in pinned:
+            raise RuntimeError("Runtime hasn't been created!")
+        return pinned['runtime']
+
+    def exists(cls):
+        return cls._instance is not None or 'runtime' in pinned
+
+    with mock.patch.multiple(Runtime, instance=classmethod(instance), exists=classmethod(exists)), \
+            mock.patch('streamlit.testing.v1.app_test.ScriptCache', return_value=script_cache), \
+            mock.patch('streamlit.testing.v1.local_script_runner.ScriptCache', return_value=script_cache):
+        yield
+
+
+def make_photos(count, seed):
+    photos = []
+    for n in range(count):
+        buffer = BytesIO()
+        generate_image(seed=seed + n, size=(640, 480)).save(buffer, format="JPEG", quality=85)
+        photos.append(buffer.getvalue())
+    return photos
+
+
+def run_session(number, args, uploads, restaurants, latencies, errors, lock, barrier):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP_PATH, default_timeout=args.timeout_s)
+    app.session_state["load_test_session"] = number
+
+    def rerun(action, step):
+        start = time.perf_counter()
+        step()
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append((action, elapsed))
+            errors.extend(f"{action}: {exception.value}" for exception in app.exception)
+        time.sleep(args.think_ms / 1000)
+
+    barrier.wait()
+    try:
+        navigate(app, number, args, uploads, restaurants, rerun)
+    except Exception as e:
+        # A widget the script expected was missing; the session stops here
+        with lock:
+            errors.append(f"session {number}: {type(e).__name__}: {e}")
+
+
+def navigate(app, number, args, uploads, restaurants, rerun):
+    rng = random.Random(args.seed + number)
+    rerun("open", app.run)
+    for round_number in range(args.rounds):
+        nav = app.radio(key="dashboard_nav")
+        rerun("overview", lambda: nav.set_value("Overview").run())
+        rerun("restaurant_analysis", lambda: app.radio(key="dashboard_nav").set_value("Restaurant Analysis").run())
+
+        # Auditors type a distinctive word of the name, e.g. its number
+        restaurant = rng.choice(restaurants)
+        words = restaurant.split()
+        search = words[1] if len(words) > 1 else restaurant
+        rerun("restaurant_search",
+              lambda: app.text_input(key="analysis_restaurant_search").set_value(search).run())
+        rerun("restaurant_select", lambda: app.selectbox(key="analysis_restaurant").set_value(restaurant).run())
+
+        rerun("individual_records", lambda: app.radio(key="dashboard_nav").set_value("Individual Records").run())
+        rerun("records_filter", lambda: app.selectbox(key="records_compliance").set_value("No").run())
+        if any(widget.key == "records_page" for widget in app.number_input):
+            rerun("records_page", lambda: app.number_input(key="records_page").increment().run())
+
+        if args.analyze_every and round_number % args.analyze_every == 0:
+            uploads.next_photo(number)
+            [widget for widget in app.text_input if widget.label == "Cafeteria Name"][0].set_value(restaurant)
+            [widget for widget in app.text_area if widget.label == "Assessment Question"][0].set_value(
+                rng.choice(QUESTIONS))
+            rerun("analyze", lambda: app.button(key=ANALYZE_BUTTON).click().run())
+
+
+def run_load(args):
+    records = generate_analysis_results(args.rows, n_cafeterias=args.cafeterias, seed=args.seed)
+    restaurants = sorted({record['cafeteria name'] for record in records})
+    supabase = FakeSupabase({'analysis_results': records}, latency=args.supabase_latency_ms / 1000)
+    openai = FakeOpenAI(latency=args.openai_latency_ms / 1000, seed=args.seed)
+    photos = make_photos(args.sessions * max(1, args.rounds), args.seed)
+    uploads = SessionUploads(photos)
+    del records
+
+    import streamlit
+    from streamlit import config
+    from streamlit.runtime.secrets import Secrets
+
+    # AppTest swaps the global st.secrets and config during each run, which
+    # concurrent runs would undo for each other; set them once for all sessions
+    # (see shared_server_state for the rest)
+    secrets = Secrets()
+    secrets._secrets = {
+        'supabase': {'url': "https://fake.supabase.co", 'key': "load-test"},
+        'openai': {'api_key': "load-test"},
+        'duplicates': {'index_path': os.path.join(args.workdir, "image_hash_index.tsv")},
+        'drift': {'state_path': os.path.join(args.workdir, "drift_state.json")},
+    }
+    streamlit.secrets = secrets
+    config.set_option("global.appTest", True)
+
+    baseline_rss = current_rss_mb()
+    latencies, errors = [], []
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.sessions)
+    with mock.patch('supabase.create_client', return_value=supabase), \
+            mock.patch('openai.OpenAI', return_value=openai), \
+            mock.patch('streamlit.file_uploader', uploads.patched_uploader(streamlit.file_uploader)), \
+            shared_server_state():
+        threads = [threading.Thread(target=run_session,
+                                    args=(n, args, uploads, restaurants, latencies, errors, lock, barrier))
+                   for n in range(args.sessions)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    seconds = np.array([latency for _, latency in latencies])
+    by_action = {}
+    for action, latency in latencies:
+        by_action.setdefault(action, []).append(latency)
+    return {
+        'sessions': args.sessions,
+        'reruns': len(seconds),
+        'reruns_per_s': len(seconds) / elapsed,
+        'median_s': float(np.percentile(seconds, 50)),
+        'p95_s': float(np.percentile(seconds, 95)),
+        'p99_s': float(np.percentile(seconds, 99)),
+        'max_s': float(seconds.max()),
+        'baseline_rss_mb': baseline_rss,
+        'peak_rss_mb': peak_rss_mb(),
+        'openai_requests': openai.request_count,
+        'errors': errors[:5],
+        'error_count': len(errors),
+        'actions': {action: float(np.percentile(values, 95)) for action, values in sorted(by_action.items())},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10], help="concurrent sessions per run")
+    parser.add_argument("--rounds", type=int, default=3, help="navigation rounds per session")
+    parser.add_argument("--rows", type=int, default=20000, help="synthetic analysis_results rows")
+    parser.add_argument("--cafeterias", type=int, default=200, help="distinct cafeteria names")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pause after each rerun")
+    parser.add_argument("--analyze-every", type=int, default=1,
+                        help="submit a photo every N rounds (0 for none)")
+    parser.add_argument("--supabase-latency-ms", type=float, default=0.0, help="added latency per Supabase request")
+    parser.add_argument("--openai-latency-ms", type=float, default=200.0, help="added latency per OpenAI request")
+    parser.add_argument("--timeout-s", type=float, default=120.0, help="longest a single rerun may take")
+    parser.add_argument("--actions", action="store_true", help="also print the p95 of each action")
+    parser.add_argument("--save", help="store results under benchmarks/results/<name>.json (or a path)")
+    parser.add_argument("--compare", help="baseline results to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="median ratio above which a session count counts as a regression")
+    parser.add_argument("--max-p95-ms", type=float, help="fail when any run's p95 rerun time is above this")
+    parser.add_argument("--max-rss-mb", type=float, help="fail when any run's peak RSS is above this")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        args.sessions = args.sessions[0]
+        print(json.dumps(run_load(args)))
+        return 0
+
+    child_args = [
+        "--rounds", str(args.rounds), "--rows", str(args.rows), "--cafeterias", str(args.cafeterias),
+        "--seed", str(args.seed), "--think-ms", str(args.think_ms), "--analyze-every", str(args.analyze_every),
+        "--supabase-latency-ms", str(args.supabase_latency_ms), "--openai-latency-ms", str(args.openai_latency_ms),
+        "--timeout-s", str(args.timeout_s),
+    ]
+    results, failures = {}, []
+    print(f"{'sessions':>8} {'reruns':>7} {'reruns/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'base RSS MB':>12} {'peak RSS MB':>12} {'errors':>7}")
+    for sessions in args.sessions:
+        with tempfile.TemporaryDirectory() as workdir:
+            # Each run starts with an empty near-duplicate index and drift state of its own
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_load", "--child", "--sessions", str(sessions),
+                 "--workdir", workdir, *child_args],
+                check=True, capture_output=True, text=True,
+            ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results[f"load.sessions_{sessions}"] = result
+        print(f"{sessions:>8} {result['reruns']:>7} {result['reruns_per_s']:>9.1f} {result['median_s'] * 1000:>8.0f} "
+              f"{result['p95_s'] * 1000:>8.0f} {result['p99_s'] * 1000:>8.0f} {result['max_s'] * 1000:>8.0f} "
+              f"{result['baseline_rss_mb']:>12.0f} {result['peak_rss_mb']:>12.0f} {result['error_count']:>7}")
+        if args.actions:
+            for action, p95 in result['actions'].items():
+                print(f"{'':>8} {action:<24} p95 {p95 * 1000:>8.0f} ms")
+        for error in result['errors']:
+            print(f"{'':>8} error: {error}")
+        if result['error_count']:
+            failures.append(f"{sessions} sessions: {result['error_count']} exceptions")
+        if args.max_p95_ms is not None and result['p95_s'] * 1000 > args.max_p95_ms:
+            failures.append(f"{sessions} sessions: p95 {result['p95_s'] * 1000:.0f} ms > {args.max_p95_ms:.0f} ms")
+        if args.max_rss_mb is not None and result['peak_rss_mb'] > args.max_rss_mb:
+            failures.append(f"{sessions} sessions: peak RSS {result['peak_rss_mb']:.0f} MB > {args.max_rss_mb:.0f} MB")
+
+    meta = {k: v for k, v in vars(args).items() if k not in ("save", "compare", "child", "workdir")}
+    if args.save:
+        save_results(args.save, results, meta)
+    if args.compare:
+        failures += compare_results(results, load_results(args.compare), args.tolerance)
+    if failures:
+        print(f"\nLoad test failed: {'; '.join(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""Tokens, upload size and latency per question: one request per question vs one per image.
+
+Runs the real ``openai`` client against ``FakeOpenAIServer`` so the base64
+image really crosses the HTTP connection on every request:
+
+    python -m benchmarks.bench_multi_question --questions 5 --openai-latency-ms 3000
+"""
+import argparse
+import sys
+import time
+
+from openai import OpenAI
+
+from analysis_pipeline import encode_image_png, request_question_set, request_routed_analysis, routing_config
+from benchmarks.fakes import FakeOpenAI, FakeOpenAIServer
+from benchmarks.synthetic_data import QUESTIONS, generate_image
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=5, help="checklist questions per image")
+    parser.add_argument("--images", type=int, default=5)
+    parser.add_argument("--openai-latency-ms", type=float, default=0.0, help="added latency per OpenAI request")
+    parser.add_argument("--routing", action="store_true", help="use fast/full model routing (default: full model only)")
+    args = parser.parse_args(argv)
+
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.questions)]
+    config = routing_config({'enabled': args.routing})
+    fake = FakeOpenAI(latency=args.openai_latency_ms / 1000)
+
+    modes = {
+        "per_question": lambda client, img: [request_routed_analysis(client, img, q, config) for q in questions],
+        "single_call": lambda client, img: request_question_set(client, img, questions, config),
+    }
+
+    print(f"{args.images} images x {args.questions} questions")
+    print(f"{'mode':<14} {'requests':>9} {'prompt tok/q':>13} {'completion tok/q':>17} {'upload MB/q':>12} {'s/q':>8}")
+    with FakeOpenAIServer(fake) as server:
+        client = OpenAI(api_key="benchmark", base_url=server.url)
+        images = [encode_image_png(generate_image(seed)) for seed in range(args.images)]
+        for mode, run in modes.items():
+            requests_before, prompt_before, completion_before = (fake.request_count, fake.prompt_tokens,
+                                                                 fake.completion_tokens)
+            start = time.perf_counter()
+            for img_base64 in images:
+                run(client, img_base64)
+            elapsed = time.perf_counter() - start
+            requests = fake.request_count - requests_before
+            answered = args.images * args.questions
+            upload_mb = requests / args.images * sum(len(img) for img in images) / 1e6
+            print(f"{mode:<14} {requests:>9} {(fake.prompt_tokens - prompt_before) / answered:>13.0f} "
+                  f"{(fake.completion_tokens - completion_before) / answered:>17.0f} "
+                  f"{upload_mb / answered:>12.2f} {elapsed / answered:>8.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Rerun time and Streamlit message count of the Individual Records list.
+
+Runs the record list in an ``AppTest`` session two ways: the previous
+per-record layout (an expander with columns, subheaders and one markdown
+element per field) and the paged HTML renderer in ``record_renderer``, cold
+and with its page cache warm. Each element or layout block the script emits
+is one delta message to the browser:
+
+    python -m benchmarks.bench_records_view --records 50 300 1000
+
+The previous layout also downloaded every record's image on the server; the
+benchmark leaves that out, so its times are a lower bound.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+import dashboard_data
+from benchmarks.synthetic_data import generate_analysis_results
+
+# Frame rendered by the scripts below; set before each AppTest run
+CURRENT = {}
+
+PER_RECORD_SCRIPT = """
+import pandas as pd
+import streamlit as st
+from benchmarks.bench_records_view import CURRENT
+
+for idx, row in CURRENT['df'].iterrows():
+    question_preview = row['question']
+    if len(question_preview) > 60:
+        question_preview = question_preview[:60] + "..."
+    with st.expander(f"{row['cafeteria name']} - {question_preview}"):
+        cols = st.columns([1, 2])
+        with cols[0]:
+            st.subheader("Image")
+            st.info("No image available")
+        with cols[1]:
+            st.subheader("Analysis Results")
+            status_color = "green" if row['compliance_status'] == 'Yes' else "red" if row['compliance_status'] == 'No' else "orange"
+            st.markdown(f"**Compliance Status:** <span style='color:{status_color};'>{row['compliance_status']}</span>", unsafe_allow_html=True)
+            if pd.notna(row['severity_level']):
+                st.markdown(f"**Severity Level:** {row['severity_level']}", unsafe_allow_html=True)
+            st.markdown(f"**Question:** {row['question']}")
+            for column in ('explanation', 'improvement_suggestions', 'image_quality_issues', 'quality_assessment'):
+                if pd.notna(row[column]):
+                    st.markdown(f"**{column}:** {row[column]}")
+            if pd.notna(row['tags']):
+                st.markdown("**Tags:**")
+                tags_html = ""
+                for tag in [tag.strip() for tag in row['tags'].split(',')]:
+                    tags_html += f'<span class="tag-pill">{tag}</span>'
+                st.markdown(tags_html, unsafe_allow_html=True)
+            if pd.notna(row['analysis_date']):
+                st.markdown(f"**Analysis Date:** {row['analysis_date']}")
+"""
+
+PAGED_SCRIPT = """
+from benchmarks.bench_records_view import CURRENT
+from record_renderer import render_records
+
+render_records(CURRENT['df'], CURRENT['cache_key'])
+"""
+
+
+def count_deltas(node):
+    children = getattr(node, "children", {}) or {}
+    return 1 + sum(count_deltas(child) for child in children.values())
+
+
+def measure(script, repeat):
+    times, deltas = [], 0
+    for _ in range(repeat):
+        app = AppTest.from_string(script, default_timeout=120)
+        start = time.perf_counter()
+        app.run()
+        times.append(time.perf_counter() - start)
+        if app.exception:
+            raise RuntimeError(app.exception[0].value)
+        # The root and its main/sidebar containers are not deltas
+        deltas = count_deltas(app._tree) - 1 - len(app._tree.children)
+    return float(np.median(times)), deltas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, nargs="+", default=[50, 300, 1000], help="records in the filtered list")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    # The scripts import CURRENT from this module, also when it runs as __main__
+    sys.modules.setdefault("benchmarks.bench_records_view", sys.modules[__name__])
+    print(f"{'records':>8} {'layout':<16} {'rerun ms':>9} {'messages':>9}")
+    for n in args.records:
+        CURRENT['df'] = dashboard_data.records_to_frame(generate_analysis_results(n, n_cafeterias=50))
+        runs = [("per_record", PER_RECORD_SCRIPT, None)]
+        # A fresh key renders on the first run; the warm run reuses the cached page
+        runs += [("paged_cold", PAGED_SCRIPT, ("bench", n, time.time())), ("paged_cached", PAGED_SCRIPT, None)]
+        for layout, script, cache_key in runs:
+            if cache_key is not None:
+                CURRENT['cache_key'] = cache_key
+            elapsed, deltas = measure(script, 1 if layout == "paged_cold" else args.repeat)
+            print(f"{n:>8} {layout:<16} {elapsed * 1000:>9.1f} {deltas:>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""Host memory and Supabase requests for several app replicas on one host.
+
+Each replica is a separate process with its own ``DatasetStore``, like one
+Streamlit process behind a load balancer. The replicas load the dataset
+together, then refresh it together a few times, each refresh with new rows,
+and render a dashboard rerun after every load. ``per_process`` replicas
+each page through Supabase and hold their own copy. ``shared`` replicas use
+the host-level shared cache (``shared_dataset.py``), where one of them
+fetches per refresh and all of them map the published Arrow file.
+
+Host memory is the sum of the replicas' proportional set sizes (PSS), which
+counts pages shared between them once:
+
+    python -m benchmarks.bench_replicas --replicas 4 --rows 100000
+"""
+import argparse
+import gc
+import multiprocessing
+import shutil
+import sys
+import tempfile
+import time
+
+import dashboard_data
+from benchmarks.fakes import FakeSupabase
+from benchmarks.synthetic_data import generate_analysis_results
+from dataset_store import DatasetStore
+from shared_dataset import SharedDatasetCache
+
+MODES = ("per_process", "shared")
+
+# New inspections added before each refresh
+ROWS_PER_REFRESH = 500
+
+
+def memory_mb():
+    # Resident and proportional set size of this process
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0][:-1].lower()] = int(parts[1]) / 1e3
+    return values
+
+
+def simulated_rerun(snapshot):
+    df = snapshot.view()
+    dashboard_data.compliance_counts(df)
+    dashboard_data.severity_counts(df)
+    dashboard_data.top_tags(df, 10)
+    dashboard_data.filter_records(df, compliance="No")
+    dashboard_data.restaurant_stats(snapshot.restaurant_slice(snapshot.restaurants()[0]))
+    snapshot.comparison
+
+
+def replica(mode, rows, refreshes, latency, cache_dir, barrier, results):
+    requests = [0]
+
+    def fetcher(round_number):
+        def fetch():
+            supabase = FakeSupabase(
+                {'analysis_results': generate_analysis_results(rows + round_number * ROWS_PER_REFRESH,
+                                                               n_cafeterias=200)},
+                latency=latency)
+            records = dashboard_data.fetch_all_records(supabase, 'analysis_results')
+            requests[0] += supabase.request_count
+            return records
+        return fetch
+
+    store = DatasetStore(SharedDatasetCache(cache_dir) if mode == "shared" else None)
+    load_seconds = []
+    for round_number in range(refreshes + 1):
+        barrier.wait()
+        start = time.perf_counter()
+        if round_number == 0:
+            snapshot = store.get(fetcher(round_number))
+        else:
+            snapshot = store.refresh(fetcher(round_number))
+        load_seconds.append(time.perf_counter() - start)
+        simulated_rerun(snapshot)
+
+    # Measure while every replica still holds its current snapshot
+    del snapshot
+    gc.collect()
+    barrier.wait()
+    results.put(dict(memory_mb(), requests=requests[0], load_seconds=load_seconds,
+                     rows=store.snapshot.table.num_rows))
+    barrier.wait()
+
+
+def run_replicas(mode, replicas, rows, refreshes, latency):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(replicas)
+    results = context.Queue()
+    cache_dir = tempfile.mkdtemp(dir="/dev/shm" if mode == "shared" else None, prefix="bench_replicas_")
+    try:
+        processes = [context.Process(target=replica,
+                                     args=(mode, rows, refreshes, latency, cache_dir, barrier, results))
+                     for _ in range(replicas)]
+        for process in processes:
+            process.start()
+        measured = [results.get() for _ in range(replicas)]
+        for process in processes:
+            process.join()
+        cache_mb = SharedDatasetCache(cache_dir).nbytes() / 1e6 if mode == "shared" else 0.0
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return {
+        'mode': mode,
+        'replicas': replicas,
+        'rows': measured[0]['rows'],
+        'pss_mb': sum(m['pss'] for m in measured),
+        'rss_mb': sum(m['rss'] for m in measured),
+        'cache_mb': cache_mb,
+        'requests': sum(m['requests'] for m in measured),
+        'first_load_s': max(m['load_seconds'][0] for m in measured),
+        'refresh_s': max(max(m['load_seconds'][1:], default=0.0) for m in measured),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=100000, help="synthetic analysis_results rows")
+    parser.add_argument("--refreshes", type=int, default=2, help="refreshes after the first load")
+    parser.add_argument("--supabase-latency-ms", type=float, default=20.0, help="latency per Supabase request")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args(argv)
+
+    print(f"{'mode':<12} {'replicas':>8} {'rows':>8} {'host PSS MB':>12} {'sum RSS MB':>11} {'shm MB':>7} "
+          f"{'requests':>9} {'first load s':>13} {'refresh s':>10}")
+    for mode in args.modes:
+        result = run_replicas(mode, args.replicas, args.rows, args.refreshes, args.supabase_latency_ms / 1000)
+        print(f"{mode:<12} {result['replicas']:>8} {result['rows']:>8} {result['pss_mb']:>12.0f} "
+              f"{result['rss_mb']:>11.0f} {result['cache_mb']:>7.0f} {result['requests']:>9} "
+              f"{result['first_load_s']:>13.1f} {result['refresh_s']:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
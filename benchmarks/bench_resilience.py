@@ -0,0 +1,233 @@
+"""Concurrent sessions against an overloaded or failing OpenAI stand-in, with and without the shared limiter.
+
+First, a deterministic check of the breaker and limiter: the breaker opens
+after ``failure_threshold`` failures, stays closed under 429s and is not
+closed by a throttled probe, and the limiter window shrinks under 429s and
+grows back. Then each session thread sends analysis requests back to back,
+like users submitting photos. Two scenarios run against ``FakeOpenAI`` with
+a ``FaultInjector``:
+
+* ``overload``: the service answers 429 above ``--capacity`` concurrent
+  requests. Without a limiter every session keeps sending; with one the
+  AIMD window settles near the capacity.
+* ``outage``: the service fails every request for ``--outage-s`` seconds.
+  Failing requests take ``--failure-latency-ms``. Without a breaker every
+  request waits for its error; with one the sessions fail fast until a
+  probe succeeds.
+
+The command exits with 1 when a check fails, when the guarded overload run
+opened the breaker, or when the guarded outage run did not open it and
+close it again.
+
+    python -m benchmarks.bench_resilience --sessions 32 --capacity 8
+    python -m benchmarks.bench_resilience --http  # real openai client over HTTP
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+
+import numpy as np
+from openai import OpenAI
+
+from analysis_pipeline import encode_image_png, request_analysis
+from benchmarks.fakes import FakeAPIError, FakeOpenAI, FakeOpenAIServer, FaultInjector
+from benchmarks.synthetic_data import QUESTIONS, generate_image
+from resilience import (
+    AdaptiveLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    Dependency,
+    DependencyUnavailable,
+    guard_openai_client,
+)
+
+
+def check_dependency(failure_threshold=5, max_concurrency=16, reset_timeout=0.2):
+    """Drive one ``Dependency`` through 429s, failures and recovery; returns the failed checks."""
+    dependency = Dependency("openai", AdaptiveLimiter(1000.0, burst=1000, max_concurrency=max_concurrency),
+                            CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout))
+    breaker, limiter = dependency.breaker, dependency.limiter
+    failures = []
+
+    def status(code):
+        def call():
+            raise FakeAPIError(code, "injected")
+        return call
+
+    def attempt(fn, times=1):
+        for _ in range(times):
+            try:
+                dependency.call(fn)
+            except Exception:
+                pass
+
+    attempt(status(429), failure_threshold * 4)
+    if breaker.state != "closed" or breaker.failures:
+        failures.append(f"breaker {breaker.state} with {breaker.failures} failures after 429s")
+    if limiter.limit >= max_concurrency:
+        failures.append(f"window {limiter.limit:.1f} did not shrink under 429s")
+
+    shrunk = limiter.limit
+    attempt(lambda: None, max_concurrency ** 2 * 2)
+    if int(limiter.limit) != max_concurrency:
+        failures.append(f"window grew from {shrunk:.1f} to {limiter.limit:.1f}, not back to {max_concurrency}")
+
+    attempt(status(503), failure_threshold - 1)
+    attempt(status(429))
+    if breaker.state != "closed":
+        failures.append(f"breaker opened after {failure_threshold - 1} failures")
+    attempt(status(503))
+    if breaker.state != "open" or breaker.opened != 1:
+        failures.append(f"breaker {breaker.state} after {failure_threshold} failures")
+    try:
+        dependency.call(lambda: None)
+        failures.append("open breaker let a call through")
+    except CircuitOpenError:
+        pass
+
+    time.sleep(reset_timeout * 1.5)
+    attempt(status(429))
+    if breaker.state != "half_open":
+        failures.append(f"throttled probe left the breaker {breaker.state}, not half_open")
+    attempt(lambda: None)
+    if breaker.state != "closed":
+        failures.append(f"successful probe left the breaker {breaker.state}")
+
+    try:
+        dependency.call(_interrupt)
+    except KeyboardInterrupt:
+        pass
+    if limiter.in_flight:
+        failures.append(f"{limiter.in_flight} limiter slots leaked by an interrupted call")
+    return failures
+
+
+def _interrupt():
+    raise KeyboardInterrupt
+
+
+def run_sessions(client, img_base64, sessions, duration, retry_pause, faults=None, outage=None):
+    """Run ``sessions`` threads for ``duration`` seconds and return per-request outcomes."""
+    outcomes = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def session(number):
+        i = 0
+        while time.perf_counter() - start < duration:
+            question = QUESTIONS[(number + i) % len(QUESTIONS)]
+            i += 1
+            request_start = time.perf_counter()
+            try:
+                request_analysis(client, img_base64, question)
+                outcome = "ok"
+            except DependencyUnavailable:
+                outcome = "fast_fail"
+            except Exception:
+                outcome = "error"
+            with lock:
+                outcomes.append((outcome, time.perf_counter() - request_start))
+            if outcome != "ok":
+                # The user reads the error before trying again
+                time.sleep(retry_pause)
+
+    def toggle_outage():
+        outage_start, outage_end = outage
+        time.sleep(outage_start)
+        faults.down = True
+        time.sleep(outage_end - outage_start)
+        faults.down = False
+
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(sessions)]
+    if outage:
+        threads.append(threading.Thread(target=toggle_outage))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes, time.perf_counter() - start
+
+
+def summarize(label, outcomes, elapsed, faults, dependency=None):
+    ok = [seconds for outcome, seconds in outcomes if outcome == "ok"]
+    failed = [seconds for outcome, seconds in outcomes if outcome != "ok"]
+    fast_fail = sum(outcome == "fast_fail" for outcome, _ in outcomes)
+    limit = f"{int(dependency.limiter.limit)}" if dependency else "-"
+    opened = f"{dependency.breaker.opened}" if dependency else "-"
+    print(f"{label:<20} {len(ok) / elapsed:>7.1f} {len(failed):>7} {fast_fail:>9} "
+          f"{faults.throttled:>6} {faults.failed:>8} {faults.peak_in_flight:>6} "
+          f"{np.percentile(ok, 95) if ok else 0:>7.2f} {np.mean(failed) if failed else 0:>9.2f} "
+          f"{limit:>6} {opened:>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=32, help="concurrent sessions sending requests")
+    parser.add_argument("--capacity", type=int, default=8, help="concurrent requests served before 429s")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="service time per request")
+    parser.add_argument("--duration-s", type=float, default=6.0, help="length of each run")
+    parser.add_argument("--outage-s", type=float, default=3.0, help="length of the outage in the outage scenario")
+    parser.add_argument("--failure-latency-ms", type=float, default=1000.0, help="time a failing request takes")
+    parser.add_argument("--retry-pause-ms", type=float, default=200.0, help="pause before a session retries")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="limiter's starting and largest window")
+    parser.add_argument("--rate", type=float, default=200.0, help="limiter's requests per second")
+    parser.add_argument("--http", action="store_true", help="use the real openai client against FakeOpenAIServer")
+    args = parser.parse_args(argv)
+
+    # The breaker logs every failure; the table is the interesting output here
+    logging.getLogger("resilience").setLevel(logging.ERROR)
+    img_base64 = encode_image_png(generate_image(0))
+    outage = ((args.duration_s - args.outage_s) / 2, (args.duration_s + args.outage_s) / 2)
+    scenarios = [
+        ("overload", lambda: FaultInjector(capacity=args.capacity), None),
+        ("outage", lambda: FaultInjector(failure_latency=args.failure_latency_ms / 1000), outage),
+    ]
+
+    failures = check_dependency()
+    print(f"Breaker and limiter checks: {'failed' if failures else 'passed'}")
+
+    print(f"{args.sessions} sessions, {args.latency_ms:.0f} ms per request, {args.duration_s:g}s per run")
+    print(f"{'run':<20} {'ok/s':>7} {'errors':>7} {'fast fail':>9} {'429s':>6} {'5xx sent':>8} {'peak':>6} "
+          f"{'p95 ok':>7} {'mean err':>9} {'window':>6} {'opened':>7}")
+    for scenario, make_faults, scenario_outage in scenarios:
+        for guarded in (False, True):
+            faults = make_faults()
+            fake = FakeOpenAI(latency=args.latency_ms / 1000, faults=faults)
+            dependency = None
+            with FakeOpenAIServer(fake) as server:
+                if args.http:
+                    # No client-side retries, so every 429 reaches the limiter
+                    client = OpenAI(api_key="benchmark", base_url=server.url, max_retries=0)
+                else:
+                    client = fake
+                if guarded:
+                    dependency = Dependency(
+                        "openai",
+                        AdaptiveLimiter(args.rate, burst=args.sessions, max_concurrency=args.max_concurrency),
+                        CircuitBreaker(failure_threshold=5, reset_timeout=0.5),
+                    )
+                    client = guard_openai_client(client, dependency)
+                outcomes, elapsed = run_sessions(client, img_base64, args.sessions, args.duration_s,
+                                                 args.retry_pause_ms / 1000, faults, scenario_outage)
+            label = f"{scenario}/{'guarded' if guarded else 'unguarded'}"
+            summarize(label, outcomes, elapsed, faults, dependency)
+            if dependency is None:
+                continue
+            if scenario == "overload" and dependency.breaker.opened:
+                failures.append(f"{label}: 429s opened the breaker {dependency.breaker.opened} times")
+            if scenario == "outage" and not (dependency.breaker.opened and dependency.breaker.state == "closed"):
+                failures.append(f"{label}: breaker opened {dependency.breaker.opened} times and ended "
+                                f"{dependency.breaker.state}")
+            if dependency.limiter.in_flight:
+                failures.append(f"{label}: {dependency.limiter.in_flight} limiter slots still held")
+
+    if failures:
+        print(f"\nResilience check failed: {'; '.join(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
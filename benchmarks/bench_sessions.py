@@ -0,0 +1,126 @@
+"""Memory and rerun latency for N concurrent sessions reading the dataset.
+
+Compares the old ``@st.cache_data`` behaviour, where every call unpickles a
+private copy of the DataFrame, with the shared ``DatasetStore`` snapshot.
+Each configuration runs in a fresh subprocess so peak RSS is comparable:
+
+    python -m benchmarks.bench_sessions --rows 100000 --sessions 1 10 50
+"""
+import argparse
+import json
+import pickle
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+import dashboard_data
+from benchmarks.synthetic_data import generate_analysis_results
+from dataset_store import DatasetStore
+
+MODES = ("cache_data", "shared_store")
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * resource.getpagesize() / 1e6
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def simulated_rerun(df):
+    dashboard_data.compliance_counts(df)
+    dashboard_data.severity_counts(df)
+    dashboard_data.top_tags(df, 10)
+    dashboard_data.filter_records(df, compliance="No")
+
+
+def run_sessions(mode, rows, sessions, reruns):
+    records = generate_analysis_results(rows, n_cafeterias=200)
+
+    if mode == "cache_data":
+        # st.cache_data keeps the pickled frame and unpickles it on every call
+        pickled = pickle.dumps(dashboard_data.records_to_frame(records))
+        del records
+
+        def load():
+            return pickle.loads(pickled)
+    else:
+        store = DatasetStore()
+        store.get(lambda: records)
+        del records
+
+        def load():
+            return store.get(None).view()
+
+    baseline_rss = current_rss_mb()
+    barrier = threading.Barrier(sessions)
+    latencies = []
+    lock = threading.Lock()
+
+    def session():
+        for _ in range(reruns):
+            barrier.wait()
+            start = time.perf_counter()
+            df = load()
+            simulated_rerun(df)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+            # Hold the frame until every session has rendered, as concurrent reruns do
+            barrier.wait()
+            del df
+
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'mode': mode,
+        'sessions': sessions,
+        'baseline_rss_mb': baseline_rss,
+        'peak_rss_mb': peak_rss_mb(),
+        'rerun_p50_ms': np.percentile(latencies, 50) * 1000,
+        'rerun_p95_ms': np.percentile(latencies, 95) * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--reruns", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_sessions(args.modes[0], args.rows, args.sessions[0], args.reruns)))
+        return 0
+
+    print(f"{'mode':<14} {'sessions':>8} {'base RSS MB':>12} {'peak RSS MB':>12} {'p50 ms':>10} {'p95 ms':>10}")
+    for mode in args.modes:
+        for sessions in args.sessions:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_sessions", "--child",
+                 "--modes", mode, "--sessions", str(sessions),
+                 "--rows", str(args.rows), "--reruns", str(args.reruns)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:<14} {sessions:>8} {result['baseline_rss_mb']:>12.0f} {result['peak_rss_mb']:>12.0f} "
+                  f"{result['rerun_p50_ms']:>10.1f} {result['rerun_p95_ms']:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""Offline evaluation of fast/full vision model routing.
+
+Replays stored inspections through ``request_routed_analysis`` against a
+mock OpenAI client and reports latency, cost and agreement with the stored
+answers for full-model-only, fast-model-only and routed runs at several
+confidence thresholds:
+
+    python -m benchmarks.eval_routing --records exports/analysis_results.csv
+    python -m benchmarks.eval_routing --rows 5000 --thresholds 0.6 0.7 0.8
+
+The mock answers with the stored result for the full model. The fast model
+answers easy inspections (compliant, no Critical/Major severity) correctly
+with probability ``--fast-accuracy-easy`` and the others with
+``--fast-accuracy-hard``, reporting lower confidence on hard ones. Latency
+is sampled rather than slept, so thousands of inspections replay in seconds.
+"""
+import argparse
+import base64
+import random
+import sys
+
+import numpy as np
+import pandas as pd
+
+from analysis_pipeline import routing_config, request_routed_analysis
+from benchmarks.fakes import FakeOpenAI
+from benchmarks.synthetic_data import generate_analysis_results
+
+# USD per million input/output tokens; override to match current pricing. The
+# mock counts image tokens the same for every model, while some small models
+# bill images at a higher token count, so image-heavy costs may be understated.
+PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+def load_inspections(path=None, rows=2000, seed=0):
+    if path is None:
+        return generate_analysis_results(rows, seed=seed)
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path)
+    elif path.endswith(".xlsx"):
+        df = pd.read_excel(path)
+    else:
+        df = pd.read_csv(path)
+    df = df.dropna(subset=['question', 'compliance_status'])
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def _is_easy(record):
+    return record['compliance_status'] == "Yes" and record.get('severity_level') not in ("Critical", "Major")
+
+
+class ReplayOpenAI(FakeOpenAI):
+    """Mock client answering from stored inspections and logging each call.
+
+    The image placeholder sent with each request carries the inspection's
+    position in ``records``.
+    """
+
+    def __init__(self, records, latencies, fast_model, accuracy_easy, accuracy_hard, seed=0):
+        super().__init__(responder=self._answer, seed=seed)
+        self.records = records
+        self.latencies = latencies
+        self.fast_model = fast_model
+        self.accuracy_easy = accuracy_easy
+        self.accuracy_hard = accuracy_hard
+        self.calls = []
+        self._answer_rng = random.Random(seed)
+
+    def _record_for(self, messages):
+        url = messages[0]['content'][1]['image_url']['url']
+        return self.records[int(base64.b64decode(url.split(',', 1)[1]))]
+
+    def _answer(self, model, messages):
+        record = self._record_for(messages)
+        status, severity = record['compliance_status'], record.get('severity_level') or "None"
+        confidence = self._answer_rng.uniform(0.8, 0.99)
+        if model == self.fast_model:
+            easy = _is_easy(record)
+            accuracy = self.accuracy_easy if easy else self.accuracy_hard
+            confidence = self._answer_rng.uniform(0.75, 0.98) if easy else self._answer_rng.uniform(0.4, 0.9)
+            if self._answer_rng.random() > accuracy:
+                status = "No" if status == "Yes" else "Yes"
+                severity = "Minor" if status == "No" else "None"
+                confidence *= 0.85
+        return {
+            'criteria_met': status,
+            'explanation': record.get('explanation') or "",
+            'improvements': record.get('improvement_suggestions') or "",
+            'severity': severity,
+            'image_quality_issues': ["none"],
+            'quality_assessment': record.get('quality_assessment') or "",
+            'tags': [tag.strip() for tag in (record.get('tags') or "").split(',') if tag.strip()],
+            'confidence': round(confidence, 2),
+        }
+
+    def create(self, model, messages, **kwargs):
+        response = super().create(model, messages, **kwargs)
+        mean = self.latencies[model]
+        self.calls.append({
+            'model': model,
+            # Log-normal around the mean, like real request latencies
+            'latency_s': mean * self._answer_rng.lognormvariate(-0.045, 0.3),
+            'prompt_tokens': response.usage.prompt_tokens,
+            'completion_tokens': response.usage.completion_tokens,
+        })
+        return response
+
+
+def run_strategy(records, config, args):
+    client = ReplayOpenAI(records, {config['fast_model']: args.fast_latency, config['full_model']: args.full_latency},
+                          config['fast_model'], args.fast_accuracy_easy, args.fast_accuracy_hard, seed=args.seed)
+    latencies, agree, missed, tiers = [], 0, 0, {'fast': 0, 'full': 0}
+    for position, record in enumerate(records):
+        first_call = len(client.calls)
+        placeholder = base64.b64encode(str(position).encode()).decode()
+        result = request_routed_analysis(client, placeholder, record['question'], config)
+        latencies.append(sum(call['latency_s'] for call in client.calls[first_call:]))
+        tiers[result.model_tier] += 1
+        agree += result.criteria_met == record['compliance_status']
+        missed += record['compliance_status'] == "No" and result.criteria_met == "Yes"
+
+    cost = sum(call['prompt_tokens'] * PRICES[call['model']][0] + call['completion_tokens'] * PRICES[call['model']][1]
+               for call in client.calls) / 1e6
+    n = len(records)
+    return {
+        'mean_latency_s': float(np.mean(latencies)),
+        'p95_latency_s': float(np.percentile(latencies, 95)),
+        'cost_per_1000': cost / n * 1000,
+        'full_tier': tiers['full'] / n,
+        'agreement': agree / n,
+        'missed_non_compliance': missed / n,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", help="CSV, Parquet or Excel export of analysis_results (default: synthetic)")
+    parser.add_argument("--rows", type=int, default=2000, help="synthetic inspections when --records is not given")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.6, 0.7, 0.8, 0.9])
+    parser.add_argument("--fast-latency", type=float, default=2.5, help="mean fast-model seconds per request")
+    parser.add_argument("--full-latency", type=float, default=6.0, help="mean full-model seconds per request")
+    parser.add_argument("--fast-accuracy-easy", type=float, default=0.97)
+    parser.add_argument("--fast-accuracy-hard", type=float, default=0.75)
+    args = parser.parse_args(argv)
+
+    records = load_inspections(args.records, args.rows, args.seed)
+    base = routing_config()
+    runs = [
+        ("full_only", dict(base, enabled=False)),
+        ("fast_only", dict(base, min_confidence=0.0, escalate_statuses=[], escalate_severities=[])),
+    ] + [(f"routed@{threshold:g}", dict(base, min_confidence=threshold)) for threshold in args.thresholds]
+
+    print(f"{len(records)} inspections")
+    print(f"{'strategy':<14} {'mean s':>7} {'p95 s':>7} {'$/1000':>8} {'full tier':>10} {'agreement':>10} {'missed No':>10}")
+    for name, config in runs:
+        result = run_strategy(records, config, args)
+        print(f"{name:<14} {result['mean_latency_s']:>7.2f} {result['p95_latency_s']:>7.2f} "
+              f"{result['cost_per_1000']:>8.2f} {result['full_tier']:>10.1%} {result['agreement']:>10.1%} "
+              f"{result['missed_non_compliance']:>10.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
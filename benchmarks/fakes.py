@@ -0,0 +1,438 @@
+"""In-process stand-ins for the Supabase client and the OpenAI API.
+
+``FakeSupabase`` implements the subset of the supabase-py table and storage
+API the app uses. ``FakeOpenAI`` mirrors ``client.chat.completions.create``
+and ``FakeOpenAIServer`` serves the same responses over an OpenAI-compatible
+HTTP endpoint, so the real ``openai`` client can be pointed at it with
+``base_url``. All of them add a configurable latency per request, and can
+take a ``FaultInjector`` that answers 429 above a concurrency capacity or
+fails requests like an unhealthy service.
+"""
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from benchmarks.synthetic_data import generate_analysis_result_json
+
+# Rough token accounting used by the fake model responses
+TEXT_CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 765
+
+# Numbered questions in a multi-question analysis prompt
+QUESTION_LINE = re.compile(r"^\s*Q(\d+):", re.MULTILINE)
+
+
+class FakeAPIError(Exception):
+    """Error carrying an HTTP ``status_code``, like the real clients' API errors."""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"Error code: {status_code} - {message}")
+        self.status_code = status_code
+
+
+class FaultInjector:
+    """Makes a fake behave like a loaded or failing service.
+
+    Requests beyond ``capacity`` concurrent ones are answered with 429, a
+    share ``error_rate`` of the others fails with 503, and while ``down`` is
+    set every request fails with 503. Failing requests take
+    ``failure_latency`` seconds, like a gateway timing out.
+    """
+
+    def __init__(self, capacity=None, error_rate=0.0, failure_latency=0.0, seed=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.failure_latency = failure_latency
+        self.down = False
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.served = 0
+        self.throttled = 0
+        self.failed = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def request(self):
+        with self._lock:
+            failing = self.down or self._rng.random() < self.error_rate
+            if failing:
+                self.failed += 1
+        if failing:
+            time.sleep(self.failure_latency)
+            raise FakeAPIError(503, "Service unavailable")
+        with self._lock:
+            if self.capacity is not None and self.in_flight >= self.capacity:
+                self.throttled += 1
+                raise FakeAPIError(429, "Rate limit reached, please slow down")
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.served += 1
+
+
+def _injected(faults):
+    return faults.request() if faults is not None else nullcontext()
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    """Chainable query builder over one in-memory table."""
+
+    def __init__(self, client, table_name):
+        self._client = client
+        self._table_name = table_name
+        self._op = "select"
+        self._payload = None
+        self._on_conflict = "id"
+        self._filters = []
+        self._range = None
+        self._order = None
+        self._limit = None
+        self._count = None
+        self._columns = None
+
+    def select(self, columns="*", count=None):
+        self._op = "select"
+        self._count = count
+        if columns != "*":
+            self._columns = [column.strip().strip('"') for column in columns.split(",")]
+        return self
+
+    def insert(self, rows):
+        self._op = "insert"
+        self._payload = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict="id"):
+        self._op = "upsert"
+        self._payload = rows if isinstance(rows, list) else [rows]
+        self._on_conflict = on_conflict
+        return self
+
+    def update(self, values):
+        self._op = "update"
+        self._payload = values
+        return self
+
+    def eq(self, column, value):
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def like(self, column, pattern):
+        prefix = pattern.rstrip("%")
+        self._filters.append(lambda row: isinstance(row.get(column), str) and row[column].startswith(prefix))
+        return self
+
+    def order(self, column, desc=False):
+        self._order = (column, desc)
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def execute(self):
+        return self._client._execute(self)
+
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def upload(self, path, file, file_options=None):
+        return self._client._storage_call("upload", self._name, path, file)
+
+    def download(self, path):
+        return self._client._storage_call("download", self._name, path)
+
+    def get_public_url(self, path):
+        return f"{self._client.url}/storage/v1/object/public/{self._name}/{path}"
+
+
+class FakeStorage:
+    def __init__(self, client):
+        self._client = client
+
+    def create_bucket(self, name, options=None):
+        return self._client._storage_call("create_bucket", name)
+
+    def list_buckets(self):
+        return self._client._storage_call("list_buckets")
+
+    def from_(self, name):
+        return FakeBucket(self._client, name)
+
+
+class FakeSupabase:
+    """Thread-safe in-memory stand-in for ``supabase.create_client(...)``."""
+
+    def __init__(self, tables=None, latency=0.0, url="https://fake.supabase.co", faults=None, not_null=None):
+        self.url = url
+        self.latency = latency
+        self.faults = faults
+        # Table -> NOT NULL columns without a default, checked on every
+        # inserted or upserted row before conflicts are resolved, like Postgres
+        self.not_null = not_null or {}
+        self.tables = {name: list(rows) for name, rows in (tables or {}).items()}
+        self.buckets = {}
+        self.storage = FakeStorage(self)
+        self.request_count = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def _sleep(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _execute(self, query):
+        with _injected(self.faults):
+            self._sleep()
+        with self._lock:
+            self.request_count += 1
+            rows = self.tables.setdefault(query._table_name, [])
+
+            if query._op in ("insert", "upsert"):
+                result = self._write_rows(rows, query)
+            elif query._op == "update":
+                result = []
+                for row in rows:
+                    if all(f(row) for f in query._filters):
+                        row.update(query._payload)
+                        result.append(row)
+            else:
+                result = [row for row in rows if all(f(row) for f in query._filters)]
+                if query._order:
+                    column, desc = query._order
+                    result.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+                if query._range:
+                    start, end = query._range
+                    result = result[start:end + 1]
+                if query._limit is not None:
+                    result = result[:query._limit]
+                if query._columns:
+                    result = [{column: row.get(column) for column in query._columns} for row in result]
+
+            # Round-trip through JSON like the real client does
+            payload = json.dumps(result, default=str)
+            self.bytes_sent += len(payload)
+            count = len(result) if query._count else None
+        return FakeResponse(json.loads(payload), count=count)
+
+    def _write_rows(self, rows, query):
+        for new_row in query._payload:
+            for column in self.not_null.get(query._table_name, ()):
+                if new_row.get(column) is None:
+                    raise FakeAPIError(400, f'null value in column "{column}" violates not-null constraint')
+        next_id = max((row.get('id') or 0 for row in rows), default=0) + 1
+        if query._op == "upsert":
+            keys = query._on_conflict.split(",")
+            existing = {tuple(row.get(k) for k in keys): row for row in rows}
+        else:
+            existing = {}
+
+        written = []
+        for new_row in query._payload:
+            new_row = dict(new_row)
+            if query._op == "upsert":
+                key = tuple(new_row.get(k) for k in keys)
+                if key in existing:
+                    existing[key].update(new_row)
+                    written.append(existing[key])
+                    continue
+            if new_row.get('id') is None:
+                new_row['id'] = next_id
+                next_id += 1
+            rows.append(new_row)
+            written.append(new_row)
+        return written
+
+    def _storage_call(self, op, bucket=None, path=None, data=None):
+        with _injected(self.faults):
+            self._sleep()
+        with self._lock:
+            self.request_count += 1
+            if op == "create_bucket":
+                if bucket in self.buckets:
+                    raise Exception(f"Bucket {bucket} already exists")
+                self.buckets[bucket] = {}
+                return {"name": bucket}
+            if op == "list_buckets":
+                return [{"name": name} for name in self.buckets]
+            objects = self.buckets.setdefault(bucket, {})
+            if op == "upload":
+                objects[path] = bytes(data)
+                return {"Key": f"{bucket}/{path}"}
+            if op == "download":
+                return objects[path]
+        raise ValueError(f"Unknown storage operation {op}")
+
+
+def _count_tokens(messages):
+    text_chars = 0
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            text_chars += len(content)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                text_chars += len(part["text"])
+            elif part.get("type") == "image_url":
+                images += 1
+    return text_chars // TEXT_CHARS_PER_TOKEN + images * IMAGE_TOKENS
+
+
+class FakeOpenAI:
+    """Stand-in for ``OpenAI(api_key=...)`` exposing ``chat.completions.create``.
+
+    ``latency`` is seconds per request, or a dict of model name to seconds.
+    ``responder(model, messages)`` returns the JSON object the model answers
+    with; by default a random but well-formed analysis result, or a
+    ``results`` list of them for multi-question prompts.
+    """
+
+    def __init__(self, latency=0.0, responder=None, seed=0, faults=None):
+        self.latency = latency
+        self.responder = responder
+        self.faults = faults
+        self.request_count = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _latency_for(self, model):
+        if isinstance(self.latency, dict):
+            return self.latency.get(model, 0.0)
+        return self.latency
+
+    def _default_answer(self, messages):
+        text = messages[0]["content"][0]["text"] if isinstance(messages[0]["content"], list) else ""
+        questions = len(QUESTION_LINE.findall(text))
+        if not questions:
+            return generate_analysis_result_json(self._rng)
+        return {'results': [dict(generate_analysis_result_json(self._rng), question_number=number)
+                            for number in range(1, questions + 1)]}
+
+    def respond(self, model, messages):
+        with self._lock:
+            if self.responder is not None:
+                answer = self.responder(model, messages)
+            else:
+                answer = self._default_answer(messages)
+        content = answer if isinstance(answer, str) else json.dumps(answer)
+        prompt_tokens = _count_tokens(messages)
+        completion_tokens = len(content) // TEXT_CHARS_PER_TOKEN
+        with self._lock:
+            self.request_count += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+        return content, prompt_tokens, completion_tokens
+
+    def create(self, model, messages, **kwargs):
+        delay = self._latency_for(model)
+        with _injected(self.faults):
+            if delay:
+                time.sleep(delay)
+        content, prompt_tokens, completion_tokens = self.respond(model, messages)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
+
+
+class FakeOpenAIServer:
+    """Serve ``FakeOpenAI`` responses at ``<url>/chat/completions`` over HTTP."""
+
+    def __init__(self, fake=None, host="127.0.0.1", port=0):
+        self.fake = fake or FakeOpenAI()
+        fake = self.fake
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length))
+                try:
+                    completion = fake.create(request["model"], request["messages"])
+                except FakeAPIError as e:
+                    body = json.dumps({"error": {"message": str(e), "type": "fake_error"}}).encode()
+                    self.send_response(e.status_code)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                body = json.dumps({
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": completion.model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": completion.choices[0].message.content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": vars(completion.usage),
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self._server.server_address[1]}/v1"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,82 @@
+"""Timing, result storage and regression comparison shared by the benchmarks."""
+import json
+import os
+import platform
+import statistics
+import time
+from datetime import datetime
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# A benchmark is flagged when its median is this many times the baseline's
+DEFAULT_TOLERANCE = 1.25
+
+
+def measure(fn, repeat=5, warmup=1):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {
+        'median_s': statistics.median(timings),
+        'min_s': min(timings),
+        'max_s': max(timings),
+        'repeat': repeat,
+    }
+
+
+def run_suite(benchmarks, repeat=5, warmup=1, only=None):
+    results = {}
+    for name, fn in benchmarks:
+        if only and not any(pattern in name for pattern in only):
+            continue
+        results[name] = measure(fn, repeat=repeat, warmup=warmup)
+        print(f"{name:<40} median {results[name]['median_s'] * 1000:10.2f} ms"
+              f"   min {results[name]['min_s'] * 1000:10.2f} ms")
+    return results
+
+
+def results_path(name):
+    if os.path.sep in name or name.endswith(".json"):
+        return name
+    return os.path.join(RESULTS_DIR, f"{name}.json")
+
+
+def save_results(name, results, meta):
+    path = results_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    document = {
+        'meta': dict(meta, python=platform.python_version(), machine=platform.machine(),
+                     created=datetime.now().isoformat(timespec='seconds')),
+        'results': results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    print(f"Saved results to {path}")
+    return path
+
+
+def load_results(name):
+    with open(results_path(name)) as f:
+        return json.load(f)
+
+
+# Print current vs baseline medians; return the names that regressed
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    regressions = []
+    baseline_results = baseline['results']
+    print(f"\n{'benchmark':<40} {'baseline ms':>12} {'current ms':>12} {'ratio':>8}")
+    for name, current in sorted(results.items()):
+        if name not in baseline_results:
+            print(f"{name:<40} {'-':>12} {current['median_s'] * 1000:12.2f} {'new':>8}")
+            continue
+        before = baseline_results[name]['median_s']
+        ratio = current['median_s'] / before if before else float('inf')
+        flag = "  REGRESSION" if ratio > tolerance else ""
+        print(f"{name:<40} {before * 1000:12.2f} {current['median_s'] * 1000:12.2f} {ratio:8.2f}{flag}")
+        if ratio > tolerance:
+            regressions.append(name)
+    return regressions
@@ -0,0 +1,261 @@
+"""Repeatable benchmarks for the dashboard data path and the analysis submit path.
+
+Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --rows 50000 --save baseline
+    python -m benchmarks.run_benchmarks --rows 50000 --compare baseline
+
+Everything runs against the in-process Supabase and OpenAI stand-ins in
+``benchmarks.fakes``, so no credentials or network access are needed.
+"""
+import argparse
+import json
+import random
+import os
+import sys
+import tempfile
+from io import BytesIO
+
+import numpy as np
+
+from openai import OpenAI
+
+import dashboard_data
+from analysis_pipeline import build_analysis_row, encode_image_png, request_analysis
+from analysis_result import decode_multi_response, decode_result
+from benchmarks.fakes import FakeOpenAI, FakeOpenAIServer, FakeSupabase
+from benchmarks.harness import DEFAULT_TOLERANCE, compare_results, load_results, run_suite, save_results
+from benchmarks.synthetic_data import generate_analysis_result_json, generate_analysis_results, generate_image
+from dataset_store import DatasetSnapshot
+from drift_monitor import DriftMonitor, drift_config
+from duplicate_index import DEFAULT_MAX_DISTANCE, DEFAULT_SIMILAR_DISTANCE, HashIndex, image_dhash
+from feedback_analytics import FeedbackAnalytics
+from finding_index import FindingIndex
+from image_quality import measure_quality, measure_quality_file
+from restaurant_reports import partition_hash, partition_records
+
+
+def build_benchmarks(args, openai_url):
+    records = generate_analysis_results(args.rows, n_cafeterias=args.cafeterias, seed=args.seed)
+    supabase = FakeSupabase({'analysis_results': records}, latency=args.supabase_latency_ms / 1000)
+    df = dashboard_data.records_to_frame(records)
+    snapshot = DatasetSnapshot(records)
+    restaurant = snapshot.restaurants()[0]
+    image = generate_image(seed=args.seed)
+    client = OpenAI(api_key="benchmark", base_url=openai_url)
+    rng = np.random.default_rng(args.seed)
+    hash_index = HashIndex()
+    hash_index.extend(rng.integers(0, 2 ** 64 - 1, args.hashes, dtype=np.uint64, endpoint=True))
+    query_hash = image_dhash(image)
+    photo = BytesIO()
+    generate_image(seed=args.seed, size=(3024, 4032)).save(photo, format="JPEG", quality=90)
+    # Model responses as the batch CLI receives them, some with comma-joined list fields
+    response_rng = random.Random(args.seed)
+    responses = []
+    for _ in range(1000):
+        response = generate_analysis_result_json(response_rng)
+        if response_rng.random() < 0.2:
+            response['tags'] = ", ".join(response['tags'])
+        responses.append(json.dumps(response))
+    multi_responses = [json.dumps({'results': [dict(generate_analysis_result_json(response_rng), question_number=n)
+                                               for n in range(1, 6)]})
+                       for _ in range(200)]
+
+    # The same data plus 100 new inspections, as after a refresh
+    drift_dir = tempfile.mkdtemp()
+    next_id = max(record['id'] for record in records) + 1
+    newer_snapshot = DatasetSnapshot(records + [dict(record, id=next_id + i) for i, record in enumerate(records[:100])])
+
+    def drift_monitor():
+        path = os.path.join(drift_dir, "drift_state.json")
+        if os.path.exists(path):
+            os.remove(path)
+        return DriftMonitor(drift_config({'state_path': path}))
+
+    def drift_full():
+        drift_monitor().update(newer_snapshot)
+
+    drift_warm = {}
+
+    def drift_incremental():
+        # The state is saved up to the older snapshot; only the new rows are folded in
+        if 'path' not in drift_warm:
+            drift_monitor().update(snapshot)
+            drift_warm['path'] = os.path.join(drift_dir, "drift_state.json")
+            with open(drift_warm['path']) as f:
+                drift_warm['state'] = f.read()
+        with open(drift_warm['path'], "w") as f:
+            f.write(drift_warm['state'])
+        DriftMonitor(drift_config({'state_path': drift_warm['path']})).update(newer_snapshot)
+
+    finding_index = FindingIndex()
+    finding_index.update(snapshot)
+    finding_queries = [" ".join(filter(None, [record.get('explanation'), record.get('improvement_suggestions')]))
+                       for record in records[:100]]
+
+    def findings_build():
+        FindingIndex().update(snapshot)
+
+    def findings_incremental():
+        # An index up to the older snapshot takes in the 100 new rows
+        index = FindingIndex()
+        index.update(snapshot)
+        index.update(newer_snapshot)
+
+    def findings_search():
+        for query in finding_queries:
+            finding_index.search(query, non_compliant_only=True)
+
+    # Feedback on 1 in 4 analyses, most of it linked to the analysis row
+    feedback_rng = random.Random(args.seed)
+    feedback_rows = [{
+        'id': i + 1,
+        'analysis_id': record['id'] if feedback_rng.random() < 0.8 else None,
+        'satisfied': feedback_rng.random() < 0.8,
+        'cafeteria_name': record['cafeteria name'],
+        'question': record['question'],
+        'severity_level': record.get('severity_level'),
+    } for i, record in enumerate(feedback_rng.sample(records, len(records) // 4))]
+    feedback_analytics = FeedbackAnalytics()
+    feedback_analytics.add(feedback_rows, snapshot)
+
+    def feedback_fold_all():
+        FeedbackAnalytics().add(feedback_rows, snapshot)
+
+    def feedback_breakdowns():
+        for dimension in feedback_analytics.counts:
+            feedback_analytics.breakdown(dimension)
+
+    def reports_change_check():
+        # What a scheduled report run does before it renders anything
+        for partition in partition_records(records).values():
+            partition_hash(partition, "png")
+
+    def load_data():
+        DatasetSnapshot(dashboard_data.fetch_all_records(supabase, 'analysis_results'))
+
+    def overview():
+        dashboard_data.compliance_counts(df)
+        dashboard_data.severity_counts(df)
+        dashboard_data.count_multi_values(df['image_quality_issues'])
+        dashboard_data.top_tags(df, 10)
+        dashboard_data.compliance_trend(df)
+
+    def restaurant_analysis():
+        snapshot.dimensions['cafeteria name'].search("")
+        restaurant_df = df[df['cafeteria name'] == restaurant]
+        dashboard_data.restaurant_stats(restaurant_df)
+        dashboard_data.compliance_counts(restaurant_df)
+        dashboard_data.severity_counts(restaurant_df)
+        dashboard_data.quality_issue_counts(restaurant_df)
+        dashboard_data.top_tags(restaurant_df, 10)
+        dashboard_data.non_compliant_items(restaurant_df)
+
+    def comparison():
+        dashboard_data.restaurant_comparison(snapshot.frame)
+
+    def individual_records_filters():
+        snapshot.dimensions['cafeteria name'].search("")
+        snapshot.dimensions['compliance_status'].values
+        snapshot.dimensions['severity_level'].values
+        dashboard_data.filter_records(df)
+        dashboard_data.filter_records(df, restaurant=restaurant)
+        dashboard_data.filter_records(df, compliance="No", severity="Critical")
+        dashboard_data.filter_records(df, restaurant=restaurant, quality="Has Issues")
+
+    def submit_analysis():
+        img_base64 = encode_image_png(image)
+        request_analysis(client, img_base64, "Is the food storage area clean and organized?")
+
+    def quality_check():
+        measure_quality(image)
+
+    def quality_check_photo():
+        photo.seek(0)
+        measure_quality_file(photo)
+
+    def duplicate_lookup():
+        for _ in range(100):
+            hash_index.search(query_hash, DEFAULT_MAX_DISTANCE)
+
+    def similar_lookup():
+        for _ in range(100):
+            hash_index.search(query_hash, DEFAULT_SIMILAR_DISTANCE)
+
+    def decode_json_only():
+        for response in responses:
+            json.loads(response)
+
+    def decode_results():
+        for response in responses:
+            decode_result(response)
+
+    def decode_multi_results():
+        for response in multi_responses:
+            decode_multi_response(response)
+
+    def decode_to_rows():
+        for response in responses:
+            build_analysis_row(decode_result(response), restaurant, "Is the area clean?", "https://example.com/a.png")
+
+    return [
+        ("load_data", load_data),
+        ("view.overview", overview),
+        ("view.restaurant_analysis", restaurant_analysis),
+        ("view.comparison", comparison),
+        ("view.individual_records_filters", individual_records_filters),
+        ("submit.analysis", submit_analysis),
+        ("submit.quality_check", quality_check),
+        ("submit.quality_check_12mp_jpeg", quality_check_photo),
+        ("submit.image_hash", lambda: image_dhash(image)),
+        ("duplicates.lookup_x100", duplicate_lookup),
+        ("duplicates.similar_lookup_x100", similar_lookup),
+        ("decode.json_loads_x1000", decode_json_only),
+        ("decode.result_x1000", decode_results),
+        ("decode.multi_5q_x200", decode_multi_results),
+        ("decode.batch_rows_x1000", decode_to_rows),
+        ("drift.full_history", drift_full),
+        ("drift.load_state_and_100_new_rows", drift_incremental),
+        ("findings.build", findings_build),
+        ("findings.build_and_100_new_rows", findings_incremental),
+        ("findings.search_x100", findings_search),
+        ("feedback.fold_all", feedback_fold_all),
+        ("feedback.breakdowns", feedback_breakdowns),
+        ("reports.change_check", reports_change_check),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="synthetic analysis_results rows")
+    parser.add_argument("--cafeterias", type=int, default=200, help="distinct cafeteria names")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--hashes", type=int, default=1000000, help="random hashes in the near-duplicate index")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--supabase-latency-ms", type=float, default=0.0, help="added latency per Supabase request")
+    parser.add_argument("--openai-latency-ms", type=float, default=0.0, help="added latency per OpenAI request")
+    parser.add_argument("--only", nargs="*", help="run only benchmarks whose name contains one of these")
+    parser.add_argument("--save", help="store results under benchmarks/results/<name>.json (or a path)")
+    parser.add_argument("--compare", help="baseline results to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="median ratio above which a benchmark counts as a regression")
+    args = parser.parse_args(argv)
+
+    fake_openai = FakeOpenAI(latency=args.openai_latency_ms / 1000, seed=args.seed)
+    with FakeOpenAIServer(fake_openai) as server:
+        benchmarks = build_benchmarks(args, server.url)
+        results = run_suite(benchmarks, repeat=args.repeat, only=args.only)
+
+    meta = {k: v for k, v in vars(args).items() if k not in ("save", "compare", "only")}
+    if args.save:
+        save_results(args.save, results, meta)
+    if args.compare:
+        regressions = compare_results(results, load_results(args.compare), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""Synthetic ``analysis_results`` rows matching the real Supabase column set."""
+import base64
+import json
+import random
+from datetime import date, timedelta
+from io import BytesIO
+
+from PIL import Image
+
+QUESTIONS = [
+    "Is the food storage area clean and organized?",
+    "Are all food items properly covered and labeled?",
+    "Is the area clear? Take a blank photo if not applicable.",
+    "Are staff wearing hairnets and gloves while handling food?",
+    "Is the handwash station stocked with soap and paper towels?",
+    "Are raw and cooked foods stored separately in the refrigerator?",
+    "Is the floor free of spills and debris?",
+    "Are waste bins covered and emptied regularly?",
+    "Is the serving counter sanitized between services?",
+    "Are pest control measures visible and maintained?",
+]
+
+TAGS = [
+    "kitchen", "storage", "cleanliness", "hygiene", "refrigeration", "labeling",
+    "serving", "waste", "pest_control", "handwash", "uniform", "floor", "equipment",
+]
+
+SEVERITY_BY_STATUS = {
+    "Yes": (["None"], [1.0]),
+    "No": (["Critical", "Major", "Minor"], [0.15, 0.35, 0.5]),
+    "Unable to determine": (["Minor", "None"], [0.5, 0.5]),
+}
+
+EXPLANATIONS = {
+    "Yes": "The area shown meets the expected standard. No visible hazards were found in the image.",
+    "No": "The image shows items that do not meet the standard. Surfaces and storage need attention before service.",
+    "Unable to determine": "Image quality prevents a confident assessment. Key areas are not clearly visible.",
+}
+
+IMPROVEMENTS = {
+    "Yes": "",
+    "No": "Clean and sanitize the affected surfaces, label all containers and re-inspect before the next service.",
+    "Unable to determine": "Retake the photo with better lighting and hold the camera steady.",
+}
+
+
+def cafeteria_names(n_cafeterias):
+    return [f"Cafeteria {i:04d} - Block {chr(65 + i % 26)}" for i in range(n_cafeterias)]
+
+
+def _image_quality_issues(rng):
+    roll = rng.random()
+    if roll < 0.75:
+        return "none"
+    if roll < 0.87:
+        return "too_dark"
+    if roll < 0.97:
+        return "too_blurry"
+    return "too_dark, too_blurry"
+
+
+def tiny_png_data_uri(rng, size=64):
+    # Small noisy PNG so inline images carry a realistic payload
+    img = Image.effect_noise((size, size), rng.uniform(20, 80)).convert("RGB")
+    buffered = BytesIO()
+    img.save(buffered, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffered.getvalue()).decode()
+
+
+def generate_analysis_results(n_rows, n_cafeterias=50, seed=0, start_date=date(2025, 1, 1),
+                              n_days=90, inline_image_fraction=0.0, inline_image_side=64):
+    """Return ``n_rows`` dicts shaped like rows of the ``analysis_results`` table.
+
+    ``inline_image_fraction`` of the rows store a base64 data URI in
+    ``upload_links (images)`` instead of a JSON list of storage URLs; the
+    image is a noisy PNG of ``inline_image_side`` pixels square.
+    """
+    rng = random.Random(seed)
+    names = cafeteria_names(n_cafeterias)
+    inline_image = tiny_png_data_uri(rng, inline_image_side) if inline_image_fraction else None
+
+    rows = []
+    for i in range(n_rows):
+        status = rng.choices(["Yes", "No", "Unable to determine"], [0.62, 0.33, 0.05])[0]
+        severities, weights = SEVERITY_BY_STATUS[status]
+        cafeteria = names[rng.randrange(n_cafeterias)]
+        analysis_date = start_date + timedelta(days=rng.randrange(n_days))
+
+        if inline_image is not None and rng.random() < inline_image_fraction:
+            image_link = inline_image
+        else:
+            image_link = json.dumps([
+                f"https://example.supabase.co/storage/v1/object/public/images/cafeteria_images/{i}.png"
+            ])
+
+        rows.append({
+            'id': i + 1,
+            'question': rng.choice(QUESTIONS),
+            'upload_links (images)': image_link,
+            'answer_type': 'boolean',
+            'cafeteria name': cafeteria,
+            'compliance_status': status,
+            'explanation': EXPLANATIONS[status],
+            'improvement_suggestions': IMPROVEMENTS[status],
+            'severity_level': rng.choices(severities, weights)[0],
+            'image_quality_issues': _image_quality_issues(rng),
+            'quality_assessment': "Image quality was sufficient for the assessment.",
+            'tags': ", ".join(rng.sample(TAGS, rng.randint(3, 5))),
+            'analysis_date': analysis_date.isoformat(),
+        })
+    return rows
+
+
+def generate_analysis_result_json(rng=None):
+    # A model response in the shape the analysis prompt asks for
+    rng = rng or random.Random()
+    status = rng.choices(["Yes", "No", "Unable to determine"], [0.62, 0.33, 0.05])[0]
+    severities, weights = SEVERITY_BY_STATUS[status]
+    return {
+        "criteria_met": status,
+        "explanation": EXPLANATIONS[status],
+        "improvements": IMPROVEMENTS[status],
+        "severity": rng.choices(severities, weights)[0],
+        "image_quality_issues": [_image_quality_issues(rng)],
+        "quality_assessment": "Image quality was sufficient for the assessment.",
+        "tags": rng.sample(TAGS, rng.randint(3, 5)),
+        "confidence": round(rng.uniform(0.5, 0.99), 2),
+    }
+
+
+def generate_image(seed=0, size=(1280, 960)):
+    rng = random.Random(seed)
+    return Image.effect_noise(size, rng.uniform(20, 80)).convert("RGB")
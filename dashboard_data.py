@@ -0,0 +1,239 @@
+"""Data loading and the pandas computations behind the dashboard views.
+
+Nothing in here touches Streamlit, so the same functions are used by the app
+and by the benchmark suite.
+"""
+import hashlib
+import json
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from image_quality import QUALITY_ISSUES
+
+# Image quality issues that count as a photo having quality issues
+QUALITY_ISSUE_PATTERN = '|'.join(QUALITY_ISSUES)
+
+
+# Boolean mask of the rows whose image_quality_issues name a known issue;
+# shared by the records filter and the restaurant comparison
+def has_quality_issues(issues):
+    return issues.str.contains(QUALITY_ISSUE_PATTERN, na=False).astype(bool)
+
+
+# Fetch every row of a Supabase table, one page at a time; ``execute(query)``
+# runs each page request, e.g. through a rate limiter
+def fetch_all_records(client, table='analysis_results', page_size=1000, execute=None):
+    execute = execute or (lambda query: query.execute())
+    all_records = []
+    offset = 0
+
+    while True:
+        response = execute(client.table(table).select("*").range(offset, offset + page_size - 1))
+        if not response.data:
+            break
+        all_records.extend(response.data)
+        offset += page_size
+
+    return all_records
+
+
+# Build the dashboard DataFrame, tagged with a content version so cached
+# figures can be reused until the underlying records change
+def records_to_frame(records):
+    df = pd.DataFrame(records)
+    df.attrs['data_version'] = hashlib.sha1(
+        json.dumps(records, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return df
+
+
+# Count the items of a comma-joined column such as tags or image_quality_issues
+def count_multi_values(series):
+    items = []
+    for value in series.dropna():
+        if isinstance(value, str):
+            items.extend([item.strip() for item in value.split(',')])
+    return Counter(items)
+
+
+def compliance_counts(df):
+    return df['compliance_status'].value_counts()
+
+
+def severity_counts(df):
+    return df['severity_level'].value_counts()
+
+
+def top_tags(df, n=10):
+    tags_count = count_multi_values(df['tags']).most_common(n)
+    return pd.DataFrame(tags_count, columns=['Tag', 'Count'])
+
+
+# Records per date and compliance status, or None when all dates are equal
+def compliance_trend(df):
+    if len(df['analysis_date'].unique()) <= 1:
+        return None
+    return df.groupby(['analysis_date', 'compliance_status']).size().reset_index(name='count')
+
+
+def restaurant_stats(restaurant_df):
+    total = len(restaurant_df)
+    compliant_count = int((restaurant_df['compliance_status'] == 'Yes').sum())
+    stats = {
+        'total': total,
+        'compliance_percentage': (compliant_count / total) * 100 if total > 0 else 0,
+        'critical_count': None,
+    }
+    if 'severity_level' in restaurant_df.columns:
+        stats['critical_count'] = int((restaurant_df['severity_level'] == 'Critical').sum())
+    return stats
+
+
+def quality_issue_counts(df):
+    return df['image_quality_issues'].str.split(',').explode().str.strip().value_counts()
+
+
+def non_compliant_items(df):
+    non_compliant = df[df['compliance_status'] == 'No']
+    display_columns = ['question', 'explanation']
+    if 'severity_level' in df.columns:
+        display_columns.insert(1, 'severity_level')
+    if 'improvement_suggestions' in df.columns:
+        display_columns.append('improvement_suggestions')
+    return non_compliant[display_columns]
+
+
+# Top ``n`` comma-joined values per group code, most frequent first (ties
+# alphabetically), as one comma-joined string per code; split and counted
+# with Arrow and NumPy kernels rather than per-row Python
+def _top_values_by_code(codes, series, n):
+    array = pa.Array.from_pandas(series)
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    if pa.types.is_null(array.type):
+        return pd.Series(dtype=object)
+    lists = pc.split_pattern(array, ",")
+    parents = pc.list_parent_indices(lists).to_numpy()
+    items = pc.utf8_trim_whitespace(pc.list_flatten(lists))
+    present = pc.not_equal(items, "")
+    parents = parents[present.to_numpy(zero_copy_only=False)]
+    encoded = pc.dictionary_encode(items.filter(present))
+    item_codes = encoded.indices.to_numpy().astype(np.int64)
+    dictionary = encoded.dictionary
+    if not len(dictionary):
+        return pd.Series(dtype=object)
+
+    keys, counts = np.unique(codes[parents].astype(np.int64) * len(dictionary) + item_codes, return_counts=True)
+    group_codes, item_codes = keys // len(dictionary), keys % len(dictionary)
+    alphabetical = np.empty(len(dictionary), dtype=np.int64)
+    alphabetical[pc.array_sort_indices(dictionary).to_numpy()] = np.arange(len(dictionary))
+    order = np.lexsort((alphabetical[item_codes], -counts, group_codes))
+    group_codes, item_codes = group_codes[order], item_codes[order]
+
+    # Position of each item within its group, kept for the first ``n``
+    positions = np.arange(len(group_codes))
+    starts = np.r_[True, group_codes[1:] != group_codes[:-1]]
+    rank = positions - np.maximum.accumulate(np.where(starts, positions, 0))
+    top = pd.DataFrame({
+        'code': group_codes[rank < n],
+        'rank': rank[rank < n],
+        'item': dictionary.take(pa.array(item_codes[rank < n])).to_numpy(zero_copy_only=False),
+    })
+    wide = top.pivot(index='code', columns='rank', values='item')
+    joined = wide[0]
+    for column in wide.columns[1:]:
+        joined = joined.str.cat(wide[column], sep=", ").fillna(joined)
+    return joined
+
+
+# Per-restaurant leaderboard of every restaurant, computed in one grouped pass
+# with integer group codes instead of a filter per restaurant
+def restaurant_comparison(df, top_tags_per_restaurant=3):
+    codes, names = pd.factorize(df['cafeteria name'], sort=True)
+    valid = codes >= 0
+    codes = codes[valid]
+    n = len(names)
+
+    def count(mask):
+        return np.bincount(codes, weights=mask[valid], minlength=n).astype(int)
+
+    total = np.bincount(codes, minlength=n)
+    status = df['compliance_status']
+    compliant = count((status == 'Yes').to_numpy(dtype=bool, na_value=False))
+    non_compliant = count((status == 'No').to_numpy(dtype=bool, na_value=False))
+    comparison = pd.DataFrame({
+        'Restaurant': names.astype(object),
+        'Inspections': total,
+        'Compliance rate': compliant / total * 100,
+        'Non-compliant': non_compliant,
+    })
+    if 'severity_level' in df.columns:
+        critical = count((df['severity_level'] == 'Critical').to_numpy(dtype=bool, na_value=False))
+        comparison['Critical issues'] = critical
+        comparison['Critical rate'] = critical / total * 100
+    if 'image_quality_issues' in df.columns:
+        comparison['Quality issue rate'] = count(has_quality_issues(df['image_quality_issues']).to_numpy()) / total * 100
+    if 'tags' in df.columns:
+        top = _top_values_by_code(codes, df['tags'][valid], top_tags_per_restaurant)
+        comparison['Top tags'] = top.reindex(range(n)).fillna("").to_numpy()
+    return comparison
+
+
+# Leaderboard orderings: label -> (column, ascending)
+COMPARISON_RANKINGS = {
+    "Lowest compliance rate": ('Compliance rate', True),
+    "Highest critical rate": ('Critical rate', False),
+    "Most critical issues": ('Critical issues', False),
+    "Highest quality issue rate": ('Quality issue rate', False),
+    "Most inspections": ('Inspections', False),
+}
+
+# Rates shown as problems (higher is worse) in the comparison heatmap
+HEATMAP_COLUMNS = ['Non-compliance rate', 'Critical rate', 'Quality issue rate']
+
+
+def rank_restaurants(comparison, ranking, min_inspections=1):
+    column, ascending = COMPARISON_RANKINGS[ranking]
+    if column not in comparison.columns:
+        return comparison
+    ranked = comparison[comparison['Inspections'] >= min_inspections]
+    # Ties go to the restaurant with more inspections, the stronger evidence
+    return ranked.sort_values([column, 'Inspections'], ascending=[ascending, False], kind='stable')
+
+
+def heatmap_matrix(ranked):
+    # Only 'No' counts as non-compliant, like the Non-compliant column
+    matrix = ranked.set_index('Restaurant').assign(
+        **{'Non-compliance rate': lambda c: c['Non-compliant'] / c['Inspections'] * 100})
+    return matrix[[column for column in HEATMAP_COLUMNS if column in matrix.columns]]
+
+
+# Apply the Individual Records filters; "All" leaves a dimension unfiltered
+# and the frame is returned as-is when nothing is filtered
+def filter_records(df, restaurant="All", compliance="All", severity="All", quality="All"):
+    masks = []
+
+    if restaurant != "All":
+        masks.append(df['cafeteria name'] == restaurant)
+
+    if compliance != "All":
+        masks.append(df['compliance_status'] == compliance)
+
+    if severity != "All" and 'severity_level' in df.columns:
+        masks.append(df['severity_level'] == severity)
+
+    if quality != "All" and 'image_quality_issues' in df.columns:
+        has_issues = has_quality_issues(df['image_quality_issues'])
+        masks.append(has_issues if quality == "Has Issues" else ~has_issues)
+
+    if not masks:
+        return df
+
+    mask = masks[0]
+    for other in masks[1:]:
+        mask &= other
+    return df[mask.fillna(False).astype(bool)]
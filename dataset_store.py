@@ -0,0 +1,237 @@
+"""Process-wide, read-only copy of the ``analysis_results`` dataset.
+
+The records are converted once into an immutable Arrow table, sorted by
+cafeteria, and exposed as a pandas DataFrame whose columns wrap the Arrow
+buffers directly (``pd.ArrowDtype``). Every session gets a shallow view of
+that frame instead of its own deserialized copy, and per-restaurant subsets
+are contiguous ``iloc`` slices of it. The distinct values and counts of the
+filter columns are collected batch by batch into ``dimensions`` while the
+snapshot is built. A refresh builds a new snapshot and
+swaps it in atomically; sessions still holding the old one keep working.
+With the host-level shared cache enabled (``shared_dataset.py``), one
+process fetches for all processes on the host and each of them maps the
+published Arrow file instead of holding its own copy.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from functools import cached_property
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+import dashboard_data
+from dimensions import build_dimensions
+from shared_dataset import SharedDatasetCache
+
+logger = logging.getLogger(__name__)
+
+RESTAURANT_COLUMN = 'cafeteria name'
+
+
+def sort_table(table):
+    # Rows of one restaurant together, in id order
+    if RESTAURANT_COLUMN in table.column_names:
+        sort_keys = [(RESTAURANT_COLUMN, "ascending")]
+        if 'id' in table.column_names:
+            sort_keys.append(('id', "ascending"))
+        table = table.sort_by(sort_keys)
+    return table
+
+
+class DatasetSnapshot:
+    """One immutable version of the dataset."""
+
+    def __init__(self, records, version=None):
+        version = version or hashlib.sha1(
+            json.dumps(records, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        self._build(sort_table(pa.Table.from_pylist(records)), version)
+
+    @classmethod
+    def from_table(cls, table, version, comparison=None):
+        """Snapshot over an already sorted ``table``, e.g. one mapped from the shared cache."""
+        snapshot = cls.__new__(cls)
+        snapshot._build(table, version)
+        if comparison is not None:
+            snapshot.__dict__['comparison'] = comparison
+        return snapshot
+
+    def _build(self, table, version):
+        self.version = version
+        self.loaded_at = time.time()
+        self.table = table
+
+        self.frame = table.to_pandas(types_mapper=pd.ArrowDtype)
+        self.frame.attrs['data_version'] = self.version
+        self._restaurant_bounds = self._index_restaurants()
+        self.dimensions = build_dimensions(table)
+
+    def _index_restaurants(self):
+        # Rows are sorted by restaurant, so each one is a contiguous run
+        if RESTAURANT_COLUMN not in self.frame.columns or self.frame.empty:
+            return {}
+        names = self.frame[RESTAURANT_COLUMN]
+        starts = (names != names.shift()).to_numpy(dtype=bool, na_value=True)
+        start_positions = starts.nonzero()[0].tolist()
+        end_positions = start_positions[1:] + [len(names)]
+        return {names.iloc[start]: (start, end) for start, end in zip(start_positions, end_positions)}
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    # True for a snapshot mapped from the host-level shared cache
+    shared = False
+
+    def view(self):
+        # Shallow frame over the shared Arrow buffers; with copy-on-write a
+        # session that modifies its view never affects the shared snapshot
+        return self.frame.copy(deep=False)
+
+    def restaurants(self):
+        if RESTAURANT_COLUMN in self.dimensions:
+            return self.dimensions[RESTAURANT_COLUMN].values
+        return sorted(name for name in self._restaurant_bounds if pd.notna(name))
+
+    @cached_property
+    def comparison(self):
+        # Leaderboard of every restaurant, computed once per dataset version
+        return dashboard_data.restaurant_comparison(self.frame)
+
+    @cached_property
+    def id_positions(self):
+        # Row position of each record id, built on first lookup by id
+        if 'id' not in self.frame.columns:
+            return pd.Series(dtype="int64")
+        return pd.Series(range(len(self.frame)), index=self.frame['id'].to_numpy(dtype="int64", na_value=-1))
+
+    def rows_by_id(self, ids):
+        # Records with the given ids, in the order given; unknown ids are skipped
+        positions = self.id_positions.reindex(ids).dropna().astype("int64")
+        return self.frame.iloc[positions.to_numpy()]
+
+    def restaurant_slice(self, name):
+        start, end = self._restaurant_bounds.get(name, (0, 0))
+        return self.frame.iloc[start:end]
+
+
+class DatasetStore:
+    """Holds the current snapshot; loads and swaps it under a single-flight lock.
+
+    With a ``SharedDatasetCache``, the flight is single across every process
+    on the host: one of them fetches and publishes, and all of them map the
+    published version.
+    """
+
+    def __init__(self, shared_cache=None, max_age=None):
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()
+        self._shared = shared_cache
+        self._shared_stamp = None
+        self._max_age = max_age
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def get(self, fetch_records):
+        # Return the current snapshot, loading it on first use
+        if self._shared is not None and self._snapshot is not None and self._shared.stamp() != self._shared_stamp:
+            # Another process published a new version
+            with self._refresh_lock:
+                self._adopt_shared()
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        return self.refresh(fetch_records, only_if_missing=True)
+
+    def refresh(self, fetch_records, only_if_missing=False):
+        with self._refresh_lock:
+            if only_if_missing and self._snapshot is not None:
+                return self._snapshot
+            if self._shared is None:
+                return self._swap(DatasetSnapshot(fetch_records()))
+
+            requested_at = time.time()
+            with self._shared.writer_lock():
+                # Another process may have refreshed while this one waited for the lock
+                manifest = self._shared.current()
+                if manifest is not None and self._is_current(manifest, requested_at, only_if_missing):
+                    if self._adopt_shared(manifest):
+                        return self._snapshot
+                snapshot = self._swap(DatasetSnapshot(fetch_records()))
+                try:
+                    self._publish(snapshot, manifest)
+                except OSError as e:
+                    # Keep serving this process's own copy
+                    logger.warning(f"Could not publish the dataset to {self._shared.path}: {e}")
+            return self._snapshot
+
+    def _is_current(self, manifest, requested_at, only_if_missing):
+        # Good enough to adopt instead of fetching
+        if manifest['published_at'] >= requested_at:
+            return True
+        return only_if_missing and (self._max_age is None or time.time() - manifest['published_at'] <= self._max_age)
+
+    def _swap(self, snapshot):
+        previous = self._snapshot
+        if previous is not None and previous.version == snapshot.version:
+            # Unchanged data: keep the snapshot sessions already share
+            return previous
+        self._snapshot = snapshot
+        logger.info(f"Dataset version {snapshot.version[:12]} loaded: "
+                    f"{snapshot.table.num_rows} records, {snapshot.nbytes / 1e6:.1f} MB")
+        return snapshot
+
+    def _publish(self, snapshot, manifest):
+        # Called with the writer lock held
+        if manifest is not None and manifest['version'] == snapshot.version:
+            manifest = self._shared.touch(manifest)
+        else:
+            manifest = self._shared.publish(snapshot.version, {
+                'dataset': snapshot.table,
+                'comparison': pa.Table.from_pandas(snapshot.comparison, preserve_index=False),
+            }, records=snapshot.table.num_rows)
+            logger.info(f"Dataset version {snapshot.version[:12]} published to {self._shared.path}")
+        # Serve the mapped copy, like every other process, and drop the fetched one
+        self._adopt_shared(manifest)
+
+    def _adopt_shared(self, manifest=None):
+        """Map the published version if it differs from the current snapshot; False if there is none."""
+        stamp = self._shared.stamp()
+        manifest = manifest or self._shared.current()
+        if manifest is None:
+            return False
+        if self._snapshot is not None and self._snapshot.version == manifest['version'] \
+                and getattr(self._snapshot, 'shared', False):
+            self._shared_stamp = stamp
+            return True
+        try:
+            table = self._shared.read_table(manifest['tables']['dataset'])
+            comparison = self._shared.read_table(manifest['tables']['comparison']).to_pandas()
+        except (OSError, KeyError, pa.ArrowInvalid) as e:
+            # Removed by a newer publication in the meantime, or never completed;
+            # retried when the manifest changes
+            self._shared_stamp = stamp
+            logger.warning(f"Could not map shared dataset version {manifest.get('version', '?')[:12]}: {e}")
+            return False
+        snapshot = DatasetSnapshot.from_table(table, manifest['version'], comparison)
+        snapshot.shared = True
+        self._snapshot = snapshot
+        self._shared_stamp = stamp
+        logger.info(f"Mapped shared dataset version {snapshot.version[:12]}: {table.num_rows} records")
+        return True
+
+
+# One store shared by every session of this Streamlit process; with the
+# shared cache enabled, also by every process on the host
+@st.cache_resource
+def get_dataset_store(settings=None):
+    shared_cache = None
+    if settings and settings['enabled']:
+        shared_cache = SharedDatasetCache(settings['path'])
+    return DatasetStore(shared_cache, settings['max_age'] if shared_cache else None)
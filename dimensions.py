@@ -0,0 +1,123 @@
+"""Distinct values and record counts of the dashboard's filter columns.
+
+Each snapshot of the dataset builds one ``DimensionDictionary`` per
+filterable column, fed batch by batch from its Arrow table, so widgets read
+sorted options and counts instead of re-running ``unique()`` and ``sorted()``
+on every rerun. The restaurant picker searches a prefix index over the
+names and the words in them and only sends the best matches to the browser,
+so its setup cost stays flat as the number of cafeterias grows.
+"""
+import bisect
+from collections import Counter
+
+import pyarrow.compute as pc
+import streamlit as st
+
+# Columns the dashboard filters on
+FILTER_COLUMNS = ('cafeteria name', 'compliance_status', 'severity_level')
+
+# Options shown by the restaurant picker at a time
+MAX_SUGGESTIONS = 50
+
+
+class DimensionDictionary:
+    """Sorted distinct values of one column with per-value record counts."""
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = Counter()
+        self._values = None
+        self._prefix_index = None
+
+    def update(self, value_counts):
+        # ``value_counts`` maps values to record counts, e.g. from one record batch
+        for value, count in value_counts.items():
+            if value is not None:
+                self.counts[value] += count
+        self._values = None
+        self._prefix_index = None
+
+    def update_from_arrow(self, array):
+        counts = pc.value_counts(array).to_pylist()
+        self.update({entry['values']: entry['counts'] for entry in counts})
+
+    @property
+    def values(self):
+        if self._values is None:
+            self._values = sorted(self.counts)
+        return self._values
+
+    def __len__(self):
+        return len(self.counts)
+
+    def count(self, value):
+        return self.counts.get(value, 0)
+
+    def _build_prefix_index(self):
+        # (lowercase key, value) for the full value and each later word in it
+        entries = set()
+        for value in self.values:
+            lowered = str(value).lower()
+            entries.add((lowered, value))
+            words = lowered.split()
+            for position in range(1, len(words)):
+                entries.add((" ".join(words[position:]), value))
+        index = sorted(entries)
+        return [key for key, _ in index], [value for _, value in index]
+
+    def search(self, prefix, limit=MAX_SUGGESTIONS):
+        """Values whose name, or a word in it, starts with ``prefix`` (case-insensitive), sorted."""
+        prefix = " ".join(prefix.lower().split())
+        if not prefix:
+            return self.values[:limit]
+        if self._prefix_index is None:
+            self._prefix_index = self._build_prefix_index()
+        keys, values = self._prefix_index
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + "\uffff", lo=start)
+        matches = []
+        seen = set()
+        for value in values[start:end]:
+            if value not in seen:
+                seen.add(value)
+                matches.append(value)
+        return sorted(matches)[:limit]
+
+
+def build_dimensions(table, columns=FILTER_COLUMNS):
+    """One ``DimensionDictionary`` per column of ``table`` present in ``columns``."""
+    dimensions = {name: DimensionDictionary(name) for name in columns if name in table.column_names}
+    for batch in table.to_batches():
+        for name, dimension in dimensions.items():
+            dimension.update_from_arrow(batch.column(name))
+    return dimensions
+
+
+def render_dimension_select(dimension, label, key, include_all=True):
+    """Selectbox over every value of a small dimension, labelled with record counts."""
+    options = (["All"] if include_all else []) + dimension.values
+    return st.selectbox(label, options, key=key,
+                        format_func=lambda value: value if value == "All" and include_all
+                        else f"{value} ({dimension.count(value)})")
+
+
+def render_restaurant_picker(dimension, label, key, include_all=True, limit=MAX_SUGGESTIONS):
+    """Typeahead restaurant picker: a search box and a selectbox of the matching names.
+
+    Only up to ``limit`` matches are sent to the browser; the current
+    selection stays available while the search changes.
+    """
+    query = st.text_input("Search restaurants", key=f"{key}_search",
+                          placeholder=f"Type to search {len(dimension)} restaurants")
+    matches = dimension.search(query, limit)
+    if not matches:
+        st.caption(f"No restaurant matches \"{query}\"")
+        matches = dimension.values[:limit]
+    current = st.session_state.get(key)
+    if current is not None and current != "All" and current not in matches and dimension.count(current):
+        matches = [current] + matches
+    options = (["All"] if include_all else []) + matches
+    caption = f"{len(matches)} of {len(dimension)} shown" if len(dimension) > len(matches) else None
+    return st.selectbox(label, options, key=key, help=caption,
+                        format_func=lambda value: value if value == "All" and include_all
+                        else f"{value} ({dimension.count(value)})")
@@ -0,0 +1,336 @@
+"""Per-restaurant compliance drift detection over the stream of inspections.
+
+Every restaurant keeps two exponentially weighted averages of its compliance
+rate (Yes vs No) and of its critical-issue rate: a recent one with a short
+half-life and a baseline with a long one, both counted in inspections. Rows
+are folded in in ``id`` order. Those more than ``trailing_ids`` below the
+newest id are settled: folded in once, with the state and the settled
+watermark saved to a JSON file, so a restart picks up where the last run
+stopped instead of replaying the history. The newer rows are replayed on
+top of the settled state on every update, so rows committed out of ``id``
+order or edited after they were first seen are still counted correctly; a
+refresh costs O(new rows + trailing_ids).
+
+A restaurant is at risk when its recent rate is worse than its baseline by
+more than ``z_threshold`` standard errors (and by at least ``min_drop``).
+The standard error is that of the difference of the two averages if the
+restaurant's rate had stayed at the baseline; it comes from the baseline
+rate and running sums of the averages' weights, so it is O(1) as well.
+"""
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+
+import pandas as pd
+import pyarrow.compute as pc
+import streamlit as st
+
+from perf_metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+DEFAULT_DRIFT_CONFIG = {
+    'state_path': "drift_state.json",
+    # Half-lives in inspections of the restaurant
+    'half_life': 8,
+    'baseline_half_life': 100,
+    # A restaurant needs this many recent (effective) and total inspections to be judged
+    'min_inspections': 8,
+    'min_history': 30,
+    'z_threshold': 3.0,
+    # Smallest drop in rate worth flagging, however significant
+    'min_drop': 0.2,
+    'max_listed': 10,
+    # Rows this close to the newest id are re-read on every update
+    'trailing_ids': 1000,
+}
+
+# Settings that change the stored averages; a change restarts from scratch
+_STATE_SETTINGS = ('half_life', 'baseline_half_life')
+
+# Rates are clamped away from 0 and 1 so a spotless baseline still has a variance
+_RATE_FLOOR = 0.02
+
+
+def drift_config(overrides=None):
+    config = dict(DEFAULT_DRIFT_CONFIG)
+    config.update({key: value for key, value in (overrides or {}).items() if key in config})
+    return config
+
+
+class Ewma:
+    """Exponentially weighted average of 0/1 outcomes with its weight sums."""
+
+    __slots__ = ('decay', 'mean', 'weight', 'weight_sq')
+
+    def __init__(self, half_life, mean=0.0, weight=0.0, weight_sq=0.0):
+        self.decay = 0.5 ** (1 / half_life)
+        self.mean = mean
+        self.weight = weight
+        self.weight_sq = weight_sq
+
+    def update(self, value):
+        self.weight = self.decay * self.weight + 1
+        self.weight_sq = self.decay ** 2 * self.weight_sq + 1
+        self.mean += (value - self.mean) / self.weight
+
+    @property
+    def effective_count(self):
+        return self.weight ** 2 / self.weight_sq if self.weight_sq else 0.0
+
+    def state(self):
+        return [self.mean, self.weight, self.weight_sq]
+
+
+class RateDrift:
+    """Recent and baseline average of one 0/1 outcome and how far they have drifted apart."""
+
+    __slots__ = ('recent', 'baseline', 'cross_weight')
+
+    def __init__(self, half_life, baseline_half_life, state=None):
+        recent, baseline, self.cross_weight = state or ([], [], 0.0)
+        self.recent = Ewma(half_life, *recent)
+        self.baseline = Ewma(baseline_half_life, *baseline)
+
+    def update(self, value):
+        self.cross_weight = self.recent.decay * self.baseline.decay * self.cross_weight + 1
+        self.recent.update(value)
+        self.baseline.update(value)
+
+    def z(self):
+        """Standard errors by which the recent average is above the baseline.
+
+        The baseline includes the recent inspections too; under a constant
+        rate the difference of the two weighted averages has variance
+        ``p(1 - p) * sum((a_i - b_i)^2)`` over their normalized weights.
+        """
+        recent, baseline = self.recent, self.baseline
+        weight_spread = (recent.weight_sq / recent.weight ** 2
+                         - 2 * self.cross_weight / (recent.weight * baseline.weight)
+                         + baseline.weight_sq / baseline.weight ** 2)
+        rate = min(max(baseline.mean, _RATE_FLOOR), 1 - _RATE_FLOOR)
+        standard_error = math.sqrt(rate * (1 - rate) * max(weight_spread, 1e-12))
+        return (recent.mean - baseline.mean) / standard_error
+
+    def state(self):
+        return [self.recent.state(), self.baseline.state(), self.cross_weight]
+
+
+class RestaurantDrift:
+    """Compliance and critical-issue rates of one restaurant."""
+
+    def __init__(self, half_life, baseline_half_life, state=None):
+        state = state or {}
+        self.inspections = state.get('inspections', 0)
+        self.compliance = RateDrift(half_life, baseline_half_life, state.get('compliance'))
+        self.critical = RateDrift(half_life, baseline_half_life, state.get('critical'))
+
+    def update(self, compliance_status, severity_level):
+        self.inspections += 1
+        # "Unable to determine" says nothing about compliance
+        if compliance_status in ("Yes", "No"):
+            self.compliance.update(1.0 if compliance_status == "Yes" else 0.0)
+        self.critical.update(1.0 if severity_level == "Critical" else 0.0)
+
+    def state(self):
+        return {
+            'inspections': self.inspections,
+            'compliance': self.compliance.state(),
+            'critical': self.critical.state(),
+        }
+
+
+class DriftMonitor:
+    """Drift state of every restaurant, updated from dataset snapshots."""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.path = settings['state_path']
+        # Settled state, through id ``watermark``
+        self.restaurants = {}
+        self.watermark = None
+        # Settled state plus the trailing rows, as of the newest id seen
+        self.live = self.restaurants
+        self.newest_id = None
+        self.alerted = set()
+        self._version = None
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            self._load()
+
+    def _new_restaurant(self, state=None):
+        return RestaurantDrift(self.settings['half_life'], self.settings['baseline_half_life'], state)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                document = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable drift state {self.path}: {e}")
+            return
+        stored_settings = document.get('settings', {})
+        if document.get('version') != STATE_VERSION or any(
+                stored_settings.get(key) != self.settings[key] for key in _STATE_SETTINGS):
+            logger.info(f"Drift settings changed; rebuilding the state in {self.path}")
+            return
+        self.watermark = document.get('watermark')
+        self.newest_id = document.get('newest_id', self.watermark)
+        self.restaurants = {name: self._new_restaurant(state) for name, state in document['restaurants'].items()}
+        self.live = self.restaurants
+        self.alerted = set(document.get('alerted', []))
+        logger.info(f"Loaded drift state of {len(self.restaurants)} restaurants up to id {self.watermark}")
+
+    def _save(self):
+        document = {
+            'version': STATE_VERSION,
+            'settings': {key: self.settings[key] for key in _STATE_SETTINGS},
+            'watermark': self.watermark,
+            'newest_id': self.newest_id,
+            'alerted': sorted(self.alerted),
+            'restaurants': {name: drift.state() for name, drift in self.restaurants.items()},
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(document, f)
+        os.replace(tmp_path, self.path)
+
+    def _reset(self):
+        self.restaurants = {}
+        self.watermark = None
+        self.live = self.restaurants
+        self.newest_id = None
+        self.alerted = set()
+
+    def _fold(self, restaurants, table):
+        # ``table`` is sorted by id
+        names = table['cafeteria name'].to_pylist()
+        statuses = table['compliance_status'].to_pylist()
+        severities = (table['severity_level'].to_pylist() if 'severity_level' in table.column_names
+                      else [None] * table.num_rows)
+        for name, status, severity in zip(names, statuses, severities):
+            if name is None:
+                continue
+            drift = restaurants.get(name)
+            if drift is None:
+                drift = restaurants[name] = self._new_restaurant()
+            drift.update(status, severity)
+
+    def update(self, snapshot):
+        """Settle the rows of ``snapshot`` that fell out of the trailing window and replay the rest.
+
+        Returns the number of rows folded in or replayed; a snapshot already
+        seen costs nothing.
+        """
+        with self._lock:
+            if snapshot is None or snapshot.version == self._version:
+                return 0
+            table = snapshot.table
+            if 'id' not in table.column_names or table.num_rows == 0:
+                self._version = snapshot.version
+                return 0
+            max_id = pc.max(table['id']).as_py()
+            if self.newest_id is not None and max_id < self.newest_id:
+                # The table was truncated or reloaded with new ids
+                logger.info("Dataset ids went backwards; rebuilding the drift state")
+                self._reset()
+            if self.watermark is not None:
+                table = table.filter(pc.greater(table['id'], self.watermark))
+            table = table.sort_by([('id', "ascending")])
+
+            settle_through = max_id - self.settings['trailing_ids']
+            settled = table.filter(pc.less_equal(table['id'], settle_through))
+            if settled.num_rows:
+                self._fold(self.restaurants, settled)
+            if self.watermark is None or settle_through > self.watermark:
+                self.watermark = settle_through
+
+            # Copies of the settled state, so replaying never changes it
+            trailing = table.filter(pc.greater(table['id'], self.watermark))
+            self.live = {name: self._new_restaurant(drift.state()) for name, drift in self.restaurants.items()}
+            self._fold(self.live, trailing)
+
+            self.newest_id = max_id
+            self._alert()
+            self._save()
+            logger.info(f"Drift state updated with {settled.num_rows} settled and {trailing.num_rows} trailing "
+                        f"inspections up to id {max_id}")
+            self._version = snapshot.version
+            return settled.num_rows + trailing.num_rows
+
+    def _assess(self, name, drift):
+        settings = self.settings
+        if drift.inspections < settings['min_history']:
+            return None
+        compliance, critical = drift.compliance, drift.critical
+        assessment = {'restaurant': name, 'inspections': drift.inspections, 'compliance_z': 0.0, 'critical_z': 0.0}
+        if compliance.recent.effective_count >= settings['min_inspections'] and \
+                compliance.baseline.mean - compliance.recent.mean >= settings['min_drop']:
+            assessment['compliance_z'] = -compliance.z()
+        if critical.recent.effective_count >= settings['min_inspections'] and \
+                critical.recent.mean - critical.baseline.mean >= settings['min_drop']:
+            assessment['critical_z'] = critical.z()
+        assessment['score'] = max(assessment['compliance_z'], assessment['critical_z'])
+        if assessment['score'] < settings['z_threshold']:
+            return None
+        assessment.update({
+            'recent_compliance': compliance.recent.mean,
+            'baseline_compliance': compliance.baseline.mean,
+            'recent_critical': critical.recent.mean,
+            'baseline_critical': critical.baseline.mean,
+        })
+        return assessment
+
+    def _at_risk(self):
+        assessments = (self._assess(name, drift) for name, drift in self.live.items())
+        return sorted((a for a in assessments if a is not None), key=lambda a: a['score'], reverse=True)
+
+    def _alert(self):
+        # Log restaurants that became at risk since the last update, once each
+        at_risk = {assessment['restaurant']: assessment for assessment in self._at_risk()}
+        for name in sorted(at_risk.keys() - self.alerted):
+            a = at_risk[name]
+            logger.warning(f"Compliance drift at {name}: compliance {a['recent_compliance']:.0%} "
+                           f"(baseline {a['baseline_compliance']:.0%}), critical {a['recent_critical']:.0%} "
+                           f"(baseline {a['baseline_critical']:.0%}), z={a['score']:.1f}")
+        self.alerted = set(at_risk)
+
+    def at_risk(self, limit=None):
+        """At-risk restaurants, most significant drift first."""
+        with self._lock:
+            at_risk = self._at_risk()
+        return at_risk[:limit] if limit else at_risk
+
+    def gauges(self):
+        with self._lock:
+            return [
+                ("drift_at_risk_restaurants", {}, len(self.alerted)),
+                ("drift_tracked_restaurants", {}, len(self.live)),
+            ]
+
+
+def at_risk_frame(assessments):
+    # Display table of ``DriftMonitor.at_risk`` results
+    return pd.DataFrame({
+        'Restaurant': [a['restaurant'] for a in assessments],
+        'Recent compliance': [f"{a['recent_compliance']:.0%}" for a in assessments],
+        'Baseline compliance': [f"{a['baseline_compliance']:.0%}" for a in assessments],
+        'Recent critical': [f"{a['recent_critical']:.0%}" for a in assessments],
+        'Baseline critical': [f"{a['baseline_critical']:.0%}" for a in assessments],
+        'Drift (z)': [round(a['score'], 1) for a in assessments],
+        'Inspections': [a['inspections'] for a in assessments],
+    })
+
+
+# One monitor shared by every session of this Streamlit process
+@st.cache_resource
+def get_drift_monitor(settings):
+    monitor = DriftMonitor(settings)
+    get_metrics().register_gauge_source("drift", monitor)
+    return monitor
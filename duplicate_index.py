@@ -0,0 +1,259 @@
+"""Near-duplicate detection for inspection photos.
+
+Every analyzed photo gets a 64-bit difference hash (dHash). Slightly
+different shots of the same counter hash to values a few bits apart, so a
+previous analysis of the same scene and question can be offered instead of
+calling the model again.
+
+Hashes are kept in a multi-index hashing structure: each hash is split into
+four 16-bit chunks and, per chunk, the entries are sorted by chunk value. Two
+hashes within Hamming distance ``d`` must agree to within ``d // 4`` bits on
+at least one chunk, so a lookup only probes the few chunk values near the
+query's and verifies those candidates. The analyses themselves stay in an
+append-only file and are read back by offset for the matches only.
+"""
+import json
+import logging
+import os
+import threading
+from functools import lru_cache
+from itertools import combinations
+
+import numpy as np
+import streamlit as st
+from PIL import Image
+from pydantic import ValidationError
+
+from analysis_result import result_from_dict
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# Hamming distance (out of 64) up to which two photos count as the same shot
+DEFAULT_MAX_DISTANCE = 6
+# Looser distance for the "similar past inspections" panel
+DEFAULT_SIMILAR_DISTANCE = 10
+
+DEFAULT_INDEX_PATH = "image_hash_index.tsv"
+
+DEFAULT_DUPLICATE_CONFIG = {
+    'index_path': DEFAULT_INDEX_PATH,
+    'max_distance': DEFAULT_MAX_DISTANCE,
+    'similar_distance': DEFAULT_SIMILAR_DISTANCE,
+}
+
+# Entries added since the last rebuild are scanned linearly until there are this
+# many, or 1/32 of the index on large indexes, keeping rebuilds amortized
+REBUILD_THRESHOLD = 4096
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _BYTE_POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def image_dhash(image):
+    """Return the 64-bit difference hash of a PIL image."""
+    gray = image.convert("L").resize((9, 8), Image.Resampling.BOX)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def image_file_dhash(source):
+    # ``source`` is a path or file-like object; JPEGs are decoded at reduced size
+    with Image.open(source) as image:
+        if image.format == "JPEG":
+            image.draft("L", (64, 64))
+        return image_dhash(image)
+
+
+def duplicate_config(overrides=None):
+    config = dict(DEFAULT_DUPLICATE_CONFIG)
+    config.update({key: value for key, value in (overrides or {}).items() if key in config})
+    return config
+
+
+def _chunk_values(hashes, chunk):
+    return ((hashes >> np.uint64(chunk * CHUNK_BITS)) & np.uint64(CHUNK_MASK)).astype(np.uint16)
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(radius):
+    # XOR masks turning a chunk value into every value within ``radius`` bits
+    masks = [sum(1 << bit for bit in bits)
+             for flips in range(radius + 1)
+             for bits in combinations(range(CHUNK_BITS), flips)]
+    return np.array(masks, dtype=np.uint16)
+
+
+class HashIndex:
+    """Multi-index hashing over 64-bit hashes; entries are identified by position."""
+
+    def __init__(self):
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._size = 0
+        self._indexed = 0
+        self._sorted_chunks = []
+        self._orders = []
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, count):
+        if self._size + count > len(self._hashes):
+            grown = np.empty(max(1024, 2 * len(self._hashes), self._size + count), dtype=np.uint64)
+            grown[:self._size] = self._hashes[:self._size]
+            self._hashes = grown
+
+    def add(self, value):
+        self._reserve(1)
+        self._hashes[self._size] = value
+        self._size += 1
+        if self._size - self._indexed >= max(REBUILD_THRESHOLD, self._indexed // 32):
+            self.rebuild()
+        return self._size - 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=np.uint64)
+        self._reserve(len(values))
+        self._hashes[self._size:self._size + len(values)] = values
+        self._size += len(values)
+        self.rebuild()
+
+    def rebuild(self):
+        hashes = self._hashes[:self._size]
+        self._orders = []
+        self._sorted_chunks = []
+        for chunk in range(CHUNKS):
+            values = _chunk_values(hashes, chunk)
+            order = np.argsort(values, kind="stable")
+            self._orders.append(order)
+            self._sorted_chunks.append(values[order])
+        self._indexed = self._size
+
+    def search(self, value, max_distance):
+        """Return ``(distance, position)`` pairs within ``max_distance``, closest first."""
+        query = np.uint64(value)
+        candidates = [np.arange(self._indexed, self._size)]
+        if self._indexed:
+            radius = max_distance // CHUNKS
+            for chunk in range(CHUNKS):
+                probes = np.sort(_chunk_values(query, chunk) ^ _flip_masks(radius))
+                keys = self._sorted_chunks[chunk]
+                starts = np.searchsorted(keys, probes, side="left")
+                lengths = np.searchsorted(keys, probes, side="right") - starts
+                # Concatenated [start, end) ranges without a Python loop
+                offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+                candidates.append(self._orders[chunk][offsets + np.arange(lengths.sum())])
+        positions = np.concatenate(candidates)
+        distances = _popcount(self._hashes[positions] ^ query)
+        close = distances <= max_distance
+        # A match can be found through several chunks
+        positions, first = np.unique(positions[close], return_index=True)
+        distances = distances[close][first]
+        order = np.argsort(distances, kind="stable")
+        return [(int(distances[i]), int(positions[i])) for i in order]
+
+
+class DuplicateIndex:
+    """Hash index backed by an append-only ``<hex hash>\\t<json>`` file.
+
+    Only hashes and file offsets are held in memory; entries are read back
+    from the file for matches.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self.index = HashIndex()
+        self._offsets = []
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        return len(self.index)
+
+    def _load(self):
+        hashes = []
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                # A torn last line from a crash is skipped
+                if line.endswith(b"\n") and len(line) > 17:
+                    hashes.append(int(line[:16], 16))
+                    self._offsets.append(offset)
+                offset += len(line)
+        self.index.extend(hashes)
+        logger.info(f"Loaded {len(self._offsets)} image hashes from {self.path}")
+
+    def add(self, image_hash, entry):
+        line = f"{image_hash:016x}\t{json.dumps(entry)}\n".encode()
+        with self._lock:
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                f.write(line)
+            self.index.add(image_hash)
+            self._offsets.append(offset)
+
+    def _read(self, positions):
+        entries = []
+        with open(self.path, "rb") as f:
+            for position in positions:
+                f.seek(self._offsets[position])
+                entries.append(json.loads(f.readline()[17:]))
+        return entries
+
+    def find(self, image_hash, max_distance=DEFAULT_MAX_DISTANCE, question=None, limit=5):
+        """Return stored entries within ``max_distance``, closest first, with a ``distance`` key.
+
+        Each entry's ``result`` is decoded into an ``AnalysisResult``. With
+        ``question``, only entries for the same question are returned.
+        """
+        with self._lock:
+            matches = self.index.search(image_hash, max_distance)
+        results = []
+        # Read in small batches so a question filter doesn't load every candidate
+        for start in range(0, len(matches), limit):
+            batch = matches[start:start + limit]
+            for (distance, _), entry in zip(batch, self._read([position for _, position in batch])):
+                if question is not None and normalize_question(entry.get('question')) != normalize_question(question):
+                    continue
+                try:
+                    entry['result'] = result_from_dict(entry['result'])
+                except ValidationError as e:
+                    logger.warning(f"Skipping unreadable stored result: {e.error_count()} validation errors")
+                    continue
+                entry['distance'] = distance
+                results.append(entry)
+                if len(results) == limit:
+                    return results
+        return results
+
+
+def normalize_question(question):
+    return " ".join((question or "").lower().split())
+
+
+def make_entry(result, cafeteria_name, question, analysis_date, image_url=None, analysis_id=None):
+    return {
+        'id': analysis_id,
+        'question': question,
+        'cafeteria name': cafeteria_name,
+        'analysis_date': analysis_date,
+        'image_url': image_url,
+        'result': result.to_dict(),
+    }
+
+
+# One index shared by every session of this Streamlit process
+@st.cache_resource
+def get_duplicate_index(path=DEFAULT_INDEX_PATH):
+    return DuplicateIndex(path)
@@ -0,0 +1,460 @@
+"""Streaming bulk import of inspection workbooks into ``analysis_results``.
+
+Rows are streamed from the workbook with openpyxl's read-only mode,
+validated and normalized to the dashboard's column layout, and upserted to
+Supabase in batches on a small thread pool. Only a bounded number of batches
+is ever in flight, so memory stays flat regardless of workbook size. Each
+finished batch is recorded in a JSON checkpoint, and re-running the same
+import skips the batches that already landed.
+
+Every row carries an ``import_key`` derived from the workbook contents and
+its row number, and rows are upserted on it (on ``id`` where the workbook
+has ids). Batches written but not yet checkpointed when an import died, or
+retried after a write that timed out but succeeded, therefore overwrite
+their earlier copies instead of duplicating them. This needs a unique
+``import_key`` column on ``analysis_results``:
+
+    ALTER TABLE public.analysis_results ADD COLUMN IF NOT EXISTS import_key TEXT UNIQUE;
+
+    python excel_importer.py analysis_results_20250407_221405.xlsx --workers 4
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime
+
+from openpyxl import load_workbook
+
+from analysis_pipeline import IMPORT_KEY_COLUMN, is_inline_image
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'analysis_results'
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_WORKERS = 4
+MAX_ATTEMPTS = 3
+
+# Columns of analysis_results the importer writes
+COLUMNS = [
+    'id',
+    'question',
+    'upload_links (images)',
+    'answer_type',
+    'cafeteria name',
+    'compliance_status',
+    'explanation',
+    'improvement_suggestions',
+    'severity_level',
+    'image_quality_issues',
+    'quality_assessment',
+    'tags',
+    'analysis_date',
+    'model',
+    'model_tier',
+    'escalation_reason',
+]
+REQUIRED_COLUMNS = ['cafeteria name', 'question', 'compliance_status']
+
+# Alternative spellings seen in exported workbooks
+HEADER_ALIASES = {
+    'cafeteria_name': 'cafeteria name',
+    'cafeteria': 'cafeteria name',
+    'restaurant': 'cafeteria name',
+    'upload_links': 'upload_links (images)',
+    'upload_links(images)': 'upload_links (images)',
+    'image_url': 'upload_links (images)',
+    'criteria_met': 'compliance_status',
+    'severity': 'severity_level',
+    'improvements': 'improvement_suggestions',
+}
+
+COMPLIANCE_VALUES = {
+    'yes': 'Yes', 'y': 'Yes', 'true': 'Yes', 'compliant': 'Yes',
+    'no': 'No', 'n': 'No', 'false': 'No', 'non-compliant': 'No',
+    'unable to determine': 'Unable to determine',
+}
+SEVERITY_VALUES = {
+    'critical': 'Critical', 'major': 'Major', 'moderate': 'Moderate',
+    'minor': 'Minor', 'none': 'None', 'unknown': 'Unknown',
+}
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text(value):
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def _split_list(value):
+    text = _text(value)
+    if text is None:
+        return []
+    if text.startswith('['):
+        try:
+            return [str(item).strip() for item in json.loads(text) if str(item).strip()]
+        except json.JSONDecodeError:
+            text = text.strip('[]')
+    return [item.strip().strip('"\'') for item in text.split(',') if item.strip()]
+
+
+def _normalize_date(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value).strip()
+    try:
+        return datetime.fromisoformat(text).date().isoformat()
+    except ValueError:
+        pass
+    for fmt in ("%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise RowError(f"invalid analysis_date {text!r}")
+
+
+def _normalize_image_links(value):
+    text = _text(value)
+    if is_inline_image(text):
+        raise RowError("inline image data in upload_links (images); use a storage URL")
+    if text is None or text.startswith('['):
+        return text
+    return json.dumps([text])
+
+
+def map_header(header_row):
+    """Map workbook column positions to ``analysis_results`` column names."""
+    mapping = {}
+    for position, name in enumerate(header_row):
+        if name is None:
+            continue
+        key = str(name).strip()
+        lowered = key.lower()
+        column = key if key in COLUMNS else lowered if lowered in COLUMNS else HEADER_ALIASES.get(lowered)
+        if column is None:
+            logger.warning(f"Ignoring unknown column {key!r}")
+            continue
+        mapping[position] = column
+
+    missing = [column for column in REQUIRED_COLUMNS if column not in mapping.values()]
+    if missing:
+        raise ValueError(f"Workbook is missing required columns: {', '.join(missing)}")
+    return mapping
+
+
+def normalize_row(values, header_map):
+    """Turn one worksheet row into an ``analysis_results`` record or raise RowError."""
+    raw = {column: values[position] if position < len(values) else None
+           for position, column in header_map.items()}
+
+    row = {}
+    for column in REQUIRED_COLUMNS:
+        if _text(raw.get(column)) is None:
+            raise RowError(f"missing {column}")
+
+    row['cafeteria name'] = _text(raw['cafeteria name'])
+    row['question'] = _text(raw['question'])
+
+    status = COMPLIANCE_VALUES.get(_text(raw['compliance_status']).lower())
+    if status is None:
+        raise RowError(f"invalid compliance_status {raw['compliance_status']!r}")
+    row['compliance_status'] = status
+
+    if 'severity_level' in raw:
+        severity = _text(raw['severity_level'])
+        if severity is not None:
+            if severity.lower() not in SEVERITY_VALUES:
+                raise RowError(f"invalid severity_level {severity!r}")
+            severity = SEVERITY_VALUES[severity.lower()]
+        row['severity_level'] = severity
+
+    if 'tags' in raw:
+        row['tags'] = ', '.join(_split_list(raw['tags'])) or None
+
+    if 'image_quality_issues' in raw:
+        issues = [issue.lower().replace(' ', '_') for issue in _split_list(raw['image_quality_issues'])]
+        row['image_quality_issues'] = ', '.join(issues) or 'none'
+
+    if 'analysis_date' in raw:
+        row['analysis_date'] = _normalize_date(raw['analysis_date'])
+
+    if 'upload_links (images)' in raw:
+        row['upload_links (images)'] = _normalize_image_links(raw['upload_links (images)'])
+
+    if 'id' in raw and raw['id'] not in (None, ''):
+        try:
+            row['id'] = int(raw['id'])
+        except (TypeError, ValueError):
+            raise RowError(f"invalid id {raw['id']!r}")
+
+    for column in ('answer_type', 'explanation', 'improvement_suggestions', 'quality_assessment',
+                   'model', 'model_tier', 'escalation_reason'):
+        if column in raw:
+            row[column] = _text(raw[column])
+
+    return row
+
+
+def import_key(digest, row_number):
+    # Same workbook contents and row, same key, whatever the batch size
+    return hashlib.sha1(f"{digest}:{row_number}".encode()).hexdigest()
+
+
+def iter_batches(path, batch_size, sheet_name=None, digest=None):
+    """Yield ``(batch_number, rows, rejects)`` while streaming the worksheet.
+
+    With a ``digest`` of the workbook every row gets its ``import_key``.
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        rows_iter = sheet.iter_rows(values_only=True)
+        header_map = map_header(next(rows_iter, ()))
+
+        batch, rejects, batch_number = [], [], 0
+        for row_number, values in enumerate(rows_iter, start=2):
+            if not any(value not in (None, '') for value in values):
+                continue
+            try:
+                row = normalize_row(values, header_map)
+            except RowError as e:
+                rejects.append({'row': row_number, 'error': str(e)})
+            else:
+                if digest is not None:
+                    row[IMPORT_KEY_COLUMN] = import_key(digest, row_number)
+                batch.append(row)
+            if len(batch) + len(rejects) >= batch_size:
+                yield batch_number, batch, rejects
+                batch, rejects, batch_number = [], [], batch_number + 1
+        if batch or rejects:
+            yield batch_number, batch, rejects
+    finally:
+        workbook.close()
+
+
+def workbook_digest(path, sheet_name=None):
+    # Identifies the workbook contents and the sheet imported from it
+    digest = hashlib.sha1()
+    source = open(path, "rb") if isinstance(path, (str, os.PathLike)) else _rewound(path)
+    with source as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    digest.update(f"{sheet_name}".encode())
+    return digest.hexdigest()
+
+
+def workbook_fingerprint(path, sheet_name, batch_size, digest=None):
+    # Identifies the workbook contents and batching a checkpoint belongs to
+    digest = digest or workbook_digest(path, sheet_name)
+    return hashlib.sha1(f"{digest}|{batch_size}".encode()).hexdigest()
+
+
+class _rewound:
+    # Context manager reading a file-like object from the start without closing it
+    def __init__(self, f):
+        self.f = f
+
+    def __enter__(self):
+        self.f.seek(0)
+        return self.f
+
+    def __exit__(self, *exc):
+        self.f.seek(0)
+
+
+class ImportCheckpoint:
+    """Completed batch numbers for one workbook, persisted as JSON."""
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.completed_through = -1
+        self.completed = set()
+        self.imported = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, fingerprint, restart=False):
+        checkpoint = cls(path, fingerprint)
+        if restart or not os.path.exists(path):
+            return checkpoint
+        with open(path) as f:
+            state = json.load(f)
+        if state.get('fingerprint') != fingerprint:
+            raise SystemExit(f"Checkpoint {path} belongs to a different workbook or batch size; "
+                             f"use --restart to discard it")
+        checkpoint.completed_through = state['completed_through']
+        checkpoint.completed = set(state['completed'])
+        checkpoint.imported = state['imported']
+        checkpoint.rejected = state['rejected']
+        return checkpoint
+
+    def is_done(self, batch_number):
+        return batch_number <= self.completed_through or batch_number in self.completed
+
+    def mark_done(self, batch_number, imported, rejected):
+        with self._lock:
+            self.completed.add(batch_number)
+            # Compact the set into a watermark where batches are contiguous
+            while self.completed_through + 1 in self.completed:
+                self.completed_through += 1
+                self.completed.remove(self.completed_through)
+            self.imported += imported
+            self.rejected += rejected
+            self._save()
+
+    def _save(self):
+        state = {
+            'fingerprint': self.fingerprint,
+            'completed_through': self.completed_through,
+            'completed': sorted(self.completed),
+            'imported': self.imported,
+            'rejected': self.rejected,
+            'updated': datetime.now().isoformat(timespec='seconds'),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+
+def upsert_batch(client, rows, table=TABLE_NAME):
+    # Rows are upserted on a deterministic key, so writing a batch again,
+    # after a retry or on resume, never duplicates it
+    with_id = [row for row in rows if 'id' in row]
+    without_id = [row for row in rows if 'id' not in row]
+    if any(IMPORT_KEY_COLUMN not in row for row in without_id):
+        raise ValueError(f"Rows without an id need an {IMPORT_KEY_COLUMN}")
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            if with_id:
+                client.table(table).upsert(with_id, on_conflict='id').execute()
+                with_id = []
+            if without_id:
+                client.table(table).upsert(without_id, on_conflict=IMPORT_KEY_COLUMN).execute()
+            return
+        except Exception as e:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            logger.warning(f"Batch write failed (attempt {attempt}): {e}")
+            time.sleep(2 ** attempt)
+
+
+def import_workbook(client, path, checkpoint_path, sheet_name=None, batch_size=DEFAULT_BATCH_SIZE,
+                    workers=DEFAULT_WORKERS, restart=False, rejects_path=None, progress=None):
+    """Import ``path`` into ``analysis_results`` and return the checkpoint.
+
+    ``progress(checkpoint)`` is called after every finished batch.
+    """
+    digest = workbook_digest(path, sheet_name)
+    fingerprint = workbook_fingerprint(path, sheet_name, batch_size, digest)
+    checkpoint = ImportCheckpoint.load(checkpoint_path, fingerprint, restart=restart)
+    # A fresh import starts a fresh rejects file; a resumed one appends to it
+    fresh = checkpoint.completed_through < 0 and not checkpoint.completed
+    rejects_file = open(rejects_path, "w" if fresh else "a") if rejects_path else None
+    max_in_flight = workers * 2
+
+    def write_batch(batch_number, rows, rejects):
+        if rows:
+            upsert_batch(client, rows)
+        return batch_number, len(rows), rejects
+
+    def finish(futures):
+        # Record every batch that landed, then re-raise the first failure
+        error = None
+        for future in futures:
+            try:
+                batch_number, imported, rejects = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            if rejects_file:
+                for reject in rejects:
+                    rejects_file.write(json.dumps(reject) + "\n")
+                rejects_file.flush()
+            checkpoint.mark_done(batch_number, imported, len(rejects))
+            if progress:
+                progress(checkpoint)
+        if error is not None:
+            raise error
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            try:
+                for batch_number, rows, rejects in iter_batches(path, batch_size, sheet_name, digest):
+                    if checkpoint.is_done(batch_number):
+                        continue
+                    pending.add(executor.submit(write_batch, batch_number, rows, rejects))
+                    if len(pending) >= max_in_flight:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        finish(done)
+            except BaseException:
+                # Still checkpoint the batches that landed, but surface the original error
+                try:
+                    finish(wait(pending).done)
+                except Exception as e:
+                    logger.error(f"Batch write failed while stopping the import: {e}")
+                raise
+            finish(wait(pending).done)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+
+    return checkpoint
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("workbook", help="path to the .xlsx workbook")
+    parser.add_argument("--sheet", help="worksheet name (default: first sheet)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="concurrent Supabase requests")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <workbook>.import.json)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from app_config import create_supabase_client
+
+    checkpoint_path = args.checkpoint or f"{args.workbook}.import.json"
+    start = time.perf_counter()
+
+    def report(checkpoint):
+        logger.info(f"{checkpoint.imported} rows imported, {checkpoint.rejected} rejected")
+
+    checkpoint = import_workbook(
+        create_supabase_client(),
+        args.workbook,
+        checkpoint_path,
+        sheet_name=args.sheet,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        restart=args.restart,
+        rejects_path=f"{args.workbook}.rejects.jsonl",
+        progress=report,
+    )
+    logger.info(f"Import finished in {time.perf_counter() - start:.1f}s: {checkpoint.imported} rows imported, "
+                f"{checkpoint.rejected} rejected (see {args.workbook}.rejects.jsonl)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""Chunked, in-memory export of filtered dashboard records.
+
+Exports are produced chunk by chunk straight into an in-memory buffer (no
+temp files written by the app) and cached per data version, view, filter
+selection and format. The download button generates the file lazily on a
+background thread, so a large export never blocks the session's rerun.
+"""
+import io
+import json
+import logging
+import threading
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+from openpyxl import Workbook
+
+from figure_cache import LRUCache
+from perf_metrics import get_metrics, timed
+
+logger = logging.getLogger(__name__)
+
+# Rows converted per chunk while writing an export
+EXPORT_CHUNK_ROWS = 5000
+
+# Maximum number of finished exports kept across all sessions
+EXPORT_CACHE_MAX_ENTRIES = 8
+
+# Excel's hard limit on rows per sheet, minus the header row
+EXCEL_MAX_ROWS_PER_SHEET = 1_048_575
+
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+def _iter_chunks(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+# Writers return the rewound BytesIO itself; copying it out with getvalue()
+# would hold the export in memory twice while the download button reads it
+def write_csv(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    buffer = BytesIO()
+    text = io.TextIOWrapper(buffer, encoding="utf-8", newline="")
+    for i, chunk in enumerate(_iter_chunks(df, chunk_rows)):
+        chunk.to_csv(text, header=(i == 0), index=False)
+    if len(df) == 0:
+        text.write(",".join(map(str, df.columns)) + "\n")
+    text.flush()
+    text.detach()
+    buffer.seek(0)
+    return buffer
+
+
+def write_parquet(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    buffer = BytesIO()
+    writer = None
+    for chunk in _iter_chunks(df, chunk_rows):
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(buffer, table.schema)
+        writer.write_table(table)
+    if writer is None:
+        writer = pq.ParquetWriter(buffer, pa.Table.from_pandas(df, preserve_index=False).schema)
+    writer.close()
+    buffer.seek(0)
+    return buffer
+
+
+def _excel_value(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    if value is None or pd.isna(value):
+        return None
+    return value
+
+
+def write_excel(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    # Write-only workbooks stream rows instead of keeping every cell in memory
+    workbook = Workbook(write_only=True)
+    header = [str(column) for column in df.columns]
+    sheet = None
+    sheet_rows = EXCEL_MAX_ROWS_PER_SHEET
+
+    for chunk in _iter_chunks(df, chunk_rows):
+        for row in chunk.itertuples(index=False, name=None):
+            if sheet_rows >= EXCEL_MAX_ROWS_PER_SHEET:
+                sheet = workbook.create_sheet(title=f"records_{len(workbook.worksheets) + 1}")
+                sheet.append(header)
+                sheet_rows = 0
+            sheet.append([_excel_value(value) for value in row])
+            sheet_rows += 1
+
+    if sheet is None:
+        workbook.create_sheet(title="records_1").append(header)
+
+    buffer = BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+WRITERS = {
+    "CSV": write_csv,
+    "Parquet": write_parquet,
+    "Excel": write_excel,
+}
+
+
+# Finished exports shared by every session of this Streamlit process
+@st.cache_resource
+def get_export_cache():
+    cache = LRUCache(EXPORT_CACHE_MAX_ENTRIES)
+    get_metrics().register_cache_source("export", cache)
+    return cache
+
+
+# Striped locks so concurrent clicks generate a file only once without keeping
+# a lock per export key alive forever
+EXPORT_LOCK_STRIPES = 64
+_export_locks = [threading.Lock() for _ in range(EXPORT_LOCK_STRIPES)]
+
+
+def _lock_for(key):
+    return _export_locks[hash(key) % EXPORT_LOCK_STRIPES]
+
+
+def export_records(df, fmt, cache_key):
+    cache = get_export_cache()
+    key = (cache_key, fmt)
+
+    data = cache.get(key)
+    if data is not None:
+        return data
+
+    with _lock_for(key):
+        data = cache.get(key)
+        if data is None:
+            with timed(f"export.{fmt.lower()}"):
+                data = WRITERS[fmt](df)
+            cache.put(key, data)
+            logger.info(f"Generated {fmt} export of {len(df)} records ({data.getbuffer().nbytes / 1e6:.1f} MB)")
+    return data
+
+
+def render_export_controls(df, view_name, filter_key, data_version):
+    """Format picker and download button for ``df``.
+
+    ``filter_key`` identifies the filter selection that produced ``df``; with
+    ``data_version`` and ``view_name`` it keys the export cache.
+    """
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        fmt = st.selectbox("Export format", list(EXPORT_FORMATS), key=f"export_format_{view_name}")
+    extension, mime = EXPORT_FORMATS[fmt]
+    cache_key = (data_version, view_name, filter_key)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    with col2:
+        st.markdown("<br>", unsafe_allow_html=True)
+        st.download_button(
+            label=f"Download {len(df)} records as {fmt}",
+            data=lambda: export_records(df, fmt, cache_key),
+            file_name=f"{view_name}_export_{timestamp}.{extension}",
+            mime=mime,
+            key=f"export_download_{view_name}",
+            on_click="ignore",
+            disabled=df.empty,
+        )
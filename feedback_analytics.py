@@ -0,0 +1,220 @@
+"""Dissatisfaction rates of analysis feedback by question, tag, severity and restaurant.
+
+Feedback rows are read from the ``feedback`` table in ``id`` order, only
+those newer than the last one seen, and folded into running counts per
+value of each dimension. A row with an ``analysis_id`` takes its question,
+tags, severity and restaurant from that ``analysis_results`` row, found
+through the dataset snapshot's id index; feedback given before the analysis
+was saved falls back to the copies stored on the feedback row itself, which
+have no tags. Such rows are kept aside and joined again once a newer
+snapshot is loaded, e.g. after the analysis was saved by another process.
+A refresh costs one query plus the new rows; the breakdowns are read from
+the counts.
+"""
+import logging
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+from perf_metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_TABLE = 'feedback'
+DEFAULT_PAGE_SIZE = 1000
+
+# New feedback is fetched at most this often unless a refresh is requested
+FEEDBACK_REFRESH_SECONDS = 60
+
+# Breakdown name -> (analysis_results column, feedback column); tags are comma-joined
+DIMENSIONS = {
+    'Question': ('question', 'question'),
+    'Tag': ('tags', None),
+    'Severity': ('severity_level', 'severity_level'),
+    'Restaurant': ('cafeteria name', 'cafeteria_name'),
+}
+MULTI_VALUE_DIMENSIONS = {'Tag'}
+
+# Feedback rows with an analysis_id missing from the snapshot that are
+# joined again on newer snapshots; beyond this the oldest stay unlinked
+MAX_PENDING_ROWS = 10000
+
+
+def fetch_feedback_since(client, last_id=0, page_size=DEFAULT_PAGE_SIZE):
+    """Feedback rows with ``id`` above ``last_id``, in ``id`` order, paged on ``id``."""
+    rows = []
+    while True:
+        page = (client.table(FEEDBACK_TABLE).select("*").gt('id', last_id).order('id')
+                .limit(page_size).execute().data or [])
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        last_id = page[-1]['id']
+
+
+def _values(dimension, value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return []
+    if dimension in MULTI_VALUE_DIMENSIONS:
+        return [item.strip() for item in str(value).split(',') if item.strip()]
+    return [value]
+
+
+class FeedbackAnalytics:
+    """Running feedback and dissatisfaction counts per dimension value."""
+
+    def __init__(self):
+        self.counts = {dimension: {} for dimension in DIMENSIONS}
+        self.total = 0
+        self.dissatisfied = 0
+        self.linked = 0
+        self.watermark = 0
+        self.refreshed_at = None
+        # Bumped whenever the counts change, to key cached charts
+        self.revision = 0
+        # Unlinked rows by feedback id, and the snapshot version they were last joined with
+        self._pending = {}
+        self._pending_version = None
+        self._lock = threading.Lock()
+
+    def _join(self, rows, snapshot):
+        # Analysis columns of each row's analysis_id, looked up by position
+        # in the snapshot; None where the row has no analysis in it
+        if snapshot is None or not len(snapshot.id_positions):
+            return [None] * len(rows)
+        ids = [row.get('analysis_id') for row in rows]
+        positions = snapshot.id_positions.reindex([-1 if i is None else i for i in ids])
+        found = positions.notna().to_numpy()
+        if not found.any():
+            return [None] * len(rows)
+        columns = [column for column, _ in DIMENSIONS.values() if column in snapshot.frame.columns]
+        matched = snapshot.frame.iloc[positions[found].astype("int64").to_numpy()][columns].to_dict('records')
+        joined = [None] * len(rows)
+        for index, analysis in zip(found.nonzero()[0], matched):
+            joined[index] = analysis
+        return joined
+
+    def _count(self, row, analysis, sign=1):
+        # Add (or with sign=-1 take back) one feedback row's counts
+        dissatisfied = not row.get('satisfied')
+        self.total += sign
+        self.dissatisfied += sign * dissatisfied
+        self.linked += sign * (analysis is not None)
+        for dimension, (analysis_column, feedback_column) in DIMENSIONS.items():
+            value = (analysis.get(analysis_column) if analysis is not None
+                     else row.get(feedback_column) if feedback_column else None)
+            for item in set(_values(dimension, value)):
+                counts = self.counts[dimension].setdefault(item, [0, 0])
+                counts[0] += sign
+                counts[1] += sign * dissatisfied
+                if not counts[0]:
+                    del self.counts[dimension][item]
+
+    def add(self, rows, snapshot=None):
+        """Fold feedback ``rows`` (in ``id`` order) into the counts; returns the number added.
+
+        Rows at or below the watermark were counted already and are skipped.
+        Rows whose analysis is not in ``snapshot`` are counted unlinked and
+        kept for ``rejoin``.
+        """
+        joined = self._join(rows, snapshot)
+        added = 0
+        with self._lock:
+            for row, analysis in zip(rows, joined):
+                if row.get('id') is not None and row['id'] <= self.watermark:
+                    continue
+                added += 1
+                self._count(row, analysis)
+                if row.get('id') is not None:
+                    self.watermark = row['id']
+                    if analysis is None and row.get('analysis_id') is not None:
+                        self._pending[row['id']] = row
+            while len(self._pending) > MAX_PENDING_ROWS:
+                del self._pending[next(iter(self._pending))]
+            self.revision += bool(added)
+        return added
+
+    def rejoin(self, snapshot):
+        """Move unlinked rows whose analysis ``snapshot`` now has to its counts; returns how many.
+
+        A no-op until the snapshot version changes.
+        """
+        with self._lock:
+            if snapshot is None or not self._pending or snapshot.version == self._pending_version:
+                return 0
+            self._pending_version = snapshot.version
+            rows = list(self._pending.values())
+        linked = 0
+        joined = self._join(rows, snapshot)
+        with self._lock:
+            for row, analysis in zip(rows, joined):
+                # Another session may have linked it meanwhile
+                if analysis is None or self._pending.pop(row['id'], None) is None:
+                    continue
+                self._count(row, None, sign=-1)
+                self._count(row, analysis)
+                linked += 1
+            self.revision += bool(linked)
+        if linked:
+            logger.info(f"Linked {linked} earlier feedback rows to their analyses")
+        return linked
+
+    def refresh(self, fetch_since, snapshot, force=False):
+        """Fetch and fold in feedback newer than the watermark; returns the number of new rows.
+
+        Without ``force`` this is a no-op until ``FEEDBACK_REFRESH_SECONDS``
+        have passed since the last refresh. ``fetch_since`` takes the last
+        feedback id seen. Unlinked rows are joined again first when
+        ``snapshot`` is newer than the last one they were joined with.
+        """
+        self.rejoin(snapshot)
+        with self._lock:
+            if not force and self.refreshed_at is not None and \
+                    time.time() - self.refreshed_at < FEEDBACK_REFRESH_SECONDS:
+                return 0
+            watermark = self.watermark
+            # Other sessions keep reading the current counts meanwhile
+            self.refreshed_at = time.time()
+        try:
+            rows = fetch_since(watermark)
+        except Exception:
+            # Try again on the next rerun rather than after the interval
+            with self._lock:
+                self.refreshed_at = None
+            raise
+        added = self.add(rows, snapshot) if rows else 0
+        if added:
+            logger.info(f"Feedback analytics updated with {added} rows up to id {self.watermark}")
+        return added
+
+    def invalidate(self):
+        # Fetch on the next refresh, e.g. after feedback was submitted
+        with self._lock:
+            self.refreshed_at = None
+
+    def breakdown(self, dimension, min_feedback=1):
+        """Feedback and dissatisfaction per value of ``dimension``, highest rate first."""
+        with self._lock:
+            items = [(value, total, dissatisfied) for value, (total, dissatisfied)
+                     in self.counts[dimension].items() if total >= min_feedback]
+        frame = pd.DataFrame(items, columns=[dimension, 'Feedback', 'Dissatisfied'])
+        frame['Dissatisfaction rate'] = (frame['Dissatisfied'] / frame['Feedback'] * 100).round(1)
+        return frame.sort_values(['Dissatisfaction rate', 'Feedback', dimension],
+                                 ascending=[False, False, True], ignore_index=True)
+
+    def gauges(self):
+        with self._lock:
+            return [
+                ("feedback_rows", {}, self.total),
+                ("feedback_dissatisfied", {}, self.dissatisfied),
+            ]
+
+
+# One set of counts shared by every session of this Streamlit process
+@st.cache_resource
+def get_feedback_analytics():
+    analytics = FeedbackAnalytics()
+    get_metrics().register_gauge_source("feedback", analytics)
+    return analytics
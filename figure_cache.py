@@ -0,0 +1,85 @@
+"""Process-wide cache of serialized Plotly figures for the dashboard.
+
+Figures are keyed by chart id, dataset version and the view parameters the
+chart depends on (for example the selected restaurant), and stored as the
+figure JSON so every session of the app can reuse them.
+"""
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+import streamlit as st
+
+from perf_metrics import get_metrics
+
+# Maximum number of serialized figures kept across all sessions
+FIGURE_CACHE_MAX_ENTRIES = 256
+
+# Stored in place of a figure when the builder had nothing to plot
+_NO_FIGURE = ""
+
+
+class LRUCache:
+    """Thread-safe least-recently-used mapping with hit/miss counters."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# One cache shared by every session of this Streamlit process
+@st.cache_resource
+def get_figure_cache():
+    cache = LRUCache(FIGURE_CACHE_MAX_ENTRIES)
+    get_metrics().register_cache_source("figure", cache)
+    return cache
+
+
+def make_figure_key(chart_id, data_version, **params):
+    return (chart_id, data_version, tuple(sorted(params.items())))
+
+
+def cached_figure(chart_id, data_version, build_fig, **params):
+    """Return the figure for ``chart_id``, building it only on a cache miss.
+
+    ``build_fig`` takes no arguments and returns a Plotly figure, or None when
+    there is nothing to plot; None results are cached as well.
+    """
+    cache = get_figure_cache()
+    key = make_figure_key(chart_id, data_version, **params)
+
+    fig_json = cache.get(key)
+    if fig_json is None:
+        fig = build_fig()
+        fig_json = fig.to_json() if fig is not None else _NO_FIGURE
+        cache.put(key, fig_json)
+
+    if fig_json == _NO_FIGURE:
+        return None
+    return pio.from_json(fig_json)
@@ -0,0 +1,275 @@
+"""Similar past findings by the text of their explanation and suggestions.
+
+Each inspection's ``explanation`` and ``improvement_suggestions`` are
+tokenized into words and word pairs, hashed into a fixed number of buckets
+(no vocabulary to grow), and weighted TF-IDF. The index holds three parallel
+NumPy arrays of (document, bucket, log term frequency) entries plus an
+inverted copy sorted by bucket, so a query only touches the postings of its
+own terms. New inspections are appended as they load and scanned linearly
+until enough have accumulated to re-sort, as in the photo hash index.
+"""
+import logging
+import re
+import threading
+import zlib
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+HASH_BUCKETS = 1 << 20
+
+# Memoized token buckets kept before the memo is cleared
+TOKEN_CACHE_MAX_ENTRIES = 500_000
+
+# Appended entries are scanned linearly until there are this many, or 1/32
+# of the index on large indexes, keeping re-sorts amortized
+REBUILD_THRESHOLD = 8192
+
+TEXT_COLUMNS = ('explanation', 'improvement_suggestions')
+
+# Matches sharing little more than a common word are not worth showing
+MIN_SIMILARITY = 0.1
+
+_WORD = re.compile(r"[a-z][a-z0-9']+")
+
+STOP_WORDS = frozenset("""
+a an and are as at be been but by can for from has have in into is it its
+may more no not of on or should that the there these this to was were which
+will with image photo area
+""".split())
+
+
+class Tokenizer:
+    """Words and adjacent word pairs of a text, hashed into buckets."""
+
+    def __init__(self, buckets=HASH_BUCKETS):
+        self.buckets = buckets
+        # Inspection texts reuse a small vocabulary, so bucket lookups are memoized
+        self._cache = {}
+
+    def _bucket(self, token):
+        bucket = self._cache.get(token)
+        if bucket is None:
+            if len(self._cache) >= TOKEN_CACHE_MAX_ENTRIES:
+                self._cache.clear()
+            bucket = self._cache[token] = zlib.crc32(token.encode()) % self.buckets
+        return bucket
+
+    def vector(self, text):
+        """Return (buckets, log term frequencies) of ``text``, buckets sorted and unique."""
+        words = [word for word in _WORD.findall((text or "").lower()) if word not in STOP_WORDS]
+        tokens = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+        counts = Counter(self._bucket(token) for token in tokens)
+        buckets = sorted(counts)
+        return (np.array(buckets, dtype=np.int32),
+                (1 + np.log(np.array([counts[bucket] for bucket in buckets], dtype=np.float32))))
+
+
+class FindingIndex:
+    """Hashed TF-IDF index of inspection findings, identified by record id."""
+
+    def __init__(self, buckets=HASH_BUCKETS):
+        self.tokenizer = Tokenizer(buckets)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.non_compliant = np.empty(0, dtype=bool)
+        self.document_frequency = np.zeros(buckets, dtype=np.int32)
+        self.watermark = None
+        self._documents = 0
+        self._doc = np.empty(0, dtype=np.int32)
+        self._bucket = np.empty(0, dtype=np.int32)
+        self._weight = np.empty(0, dtype=np.float32)
+        self._entries = 0
+        self._norms = np.empty(0, dtype=np.float32)
+        # Inverted copy of the first ``_indexed_entries`` entries, sorted by bucket
+        self._indexed_entries = 0
+        self._postings_bucket = np.empty(0, dtype=np.int32)
+        self._postings_doc = np.empty(0, dtype=np.int32)
+        self._postings_weight = np.empty(0, dtype=np.float32)
+        self._version = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._documents
+
+    def _idf(self, buckets):
+        return np.log((self._documents + 1) / (self.document_frequency[buckets] + 1)).astype(np.float32) + 1
+
+    def _append(self, ids, non_compliant, vectors):
+        count = sum(len(buckets) for buckets, _ in vectors)
+        if self._entries + count > len(self._doc):
+            size = max(4096, 2 * len(self._doc), self._entries + count)
+            for name in ('_doc', '_bucket', '_weight'):
+                grown = np.empty(size, dtype=getattr(self, name).dtype)
+                grown[:self._entries] = getattr(self, name)[:self._entries]
+                setattr(self, name, grown)
+        first_doc = self._documents
+        end = self._entries
+        for offset, (buckets, weights) in enumerate(vectors):
+            start, end = end, end + len(buckets)
+            self._doc[start:end] = first_doc + offset
+            self._bucket[start:end] = buckets
+            self._weight[start:end] = weights
+            self.document_frequency[buckets] += 1
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        self.non_compliant = np.concatenate([self.non_compliant, np.asarray(non_compliant, dtype=bool)])
+        self._documents += len(vectors)
+        self._entries = end
+        self._norms = np.concatenate([self._norms, np.zeros(len(vectors), dtype=np.float32)])
+        self._update_norms(first_doc)
+
+    def _update_norms(self, first_doc=0):
+        # Document norms under the current IDF; older norms drift slowly as
+        # documents are added and are refreshed on every re-sort
+        start = int(np.searchsorted(self._doc[:self._entries], first_doc))
+        weighted = self._weight[start:self._entries] * self._idf(self._bucket[start:self._entries])
+        squares = np.bincount(self._doc[start:self._entries] - first_doc, weights=weighted.astype(np.float64) ** 2,
+                              minlength=self._documents - first_doc)
+        self._norms[first_doc:] = np.sqrt(squares)
+
+    def _rebuild(self):
+        order = np.argsort(self._bucket[:self._entries], kind="stable")
+        self._postings_bucket = self._bucket[:self._entries][order]
+        self._postings_doc = self._doc[:self._entries][order]
+        self._postings_weight = self._weight[:self._entries][order]
+        self._indexed_entries = self._entries
+        self._update_norms()
+
+    def _reset(self):
+        # Called with the lock held, which is kept
+        lock = self._lock
+        self.__init__(self.tokenizer.buckets)
+        self._lock = lock
+
+    def _add(self, ids, texts, non_compliant):
+        # Generated findings repeat a lot; identical texts are tokenized once per batch
+        vectors = {}
+        for text in texts:
+            if text not in vectors:
+                vectors[text] = self.tokenizer.vector(text)
+        self._append(ids, non_compliant, [vectors[text] for text in texts])
+        pending = self._entries - self._indexed_entries
+        if pending >= max(REBUILD_THRESHOLD, self._indexed_entries // 32):
+            self._rebuild()
+
+    def add(self, ids, texts, non_compliant):
+        """Index the findings ``texts`` of records ``ids``."""
+        with self._lock:
+            self._add(ids, texts, non_compliant)
+
+    def update(self, snapshot):
+        """Index the rows of ``snapshot`` newer than the last id seen.
+
+        Returns the number of rows indexed; a snapshot already seen costs nothing.
+        """
+        with self._lock:
+            if snapshot is None or snapshot.version == self._version:
+                return 0
+            table = snapshot.table
+            if 'id' not in table.column_names or table.num_rows == 0 or \
+                    not all(column in table.column_names for column in TEXT_COLUMNS):
+                self._version = snapshot.version
+                return 0
+            max_id = pc.max(table['id']).as_py()
+            if self.watermark is not None and max_id < self.watermark:
+                # The table was truncated or reloaded with new ids
+                logger.info("Dataset ids went backwards; rebuilding the findings index")
+                self._reset()
+            if self.watermark is not None:
+                table = table.filter(pc.greater(table['id'], self.watermark))
+            new_rows = table.num_rows
+            if new_rows:
+                table = table.sort_by([('id', "ascending")])
+                texts = [" ".join(part for part in parts if part)
+                         for parts in zip(*(table[column].to_pylist() for column in TEXT_COLUMNS))]
+                non_compliant = pc.fill_null(pc.equal(table['compliance_status'], "No"), False).to_numpy(
+                    zero_copy_only=False)
+                self._add(table['id'].to_numpy(), texts, non_compliant)
+                self.watermark = max_id
+                logger.info(f"Indexed {new_rows} findings up to id {max_id} ({len(self)} in total)")
+            self._version = snapshot.version
+            return new_rows
+
+    def search(self, text, limit=5, non_compliant_only=False, exclude_id=None, min_similarity=MIN_SIMILARITY):
+        """Return ``(record id, cosine similarity)`` pairs for ``text``, most similar first."""
+        buckets, weights = self.tokenizer.vector(text)
+        with self._lock:
+            if not len(buckets) or not self._documents:
+                return []
+            idf = self._idf(buckets)
+            query = weights * idf * idf
+            query_norm = float(np.sqrt(np.sum((weights * idf) ** 2)))
+
+            # Postings of the query's buckets, as concatenated [start, end) ranges
+            starts = np.searchsorted(self._postings_bucket, buckets, side="left")
+            lengths = np.searchsorted(self._postings_bucket, buckets, side="right") - starts
+            offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            docs = [self._postings_doc[offsets]]
+            scores = [self._postings_weight[offsets] * np.repeat(query, lengths)]
+
+            # Entries appended since the last re-sort
+            tail = slice(self._indexed_entries, self._entries)
+            tail_buckets = self._bucket[tail]
+            position = np.clip(np.searchsorted(buckets, tail_buckets), 0, len(buckets) - 1)
+            hit = buckets[position] == tail_buckets
+            docs.append(self._doc[tail][hit])
+            scores.append(self._weight[tail][hit] * query[position[hit]])
+
+            docs = np.concatenate(docs)
+            if not len(docs):
+                return []
+            totals = np.bincount(docs, weights=np.concatenate(scores), minlength=self._documents)
+            candidates = np.flatnonzero(totals)
+            similarity = totals[candidates] / (self._norms[candidates] * query_norm + 1e-12)
+            keep = similarity >= min_similarity
+            if non_compliant_only:
+                keep &= self.non_compliant[candidates]
+            if exclude_id is not None:
+                keep &= self.ids[candidates] != exclude_id
+            candidates, similarity = candidates[keep], similarity[keep]
+            if len(similarity) > limit:
+                top = np.argpartition(-similarity, limit)[:limit]
+                top = top[np.argsort(-similarity[top], kind="stable")]
+            else:
+                top = np.argsort(-similarity, kind="stable")
+            return [(int(self.ids[candidates[i]]), float(similarity[i])) for i in top]
+
+
+def follow_up(snapshot, record):
+    # Outcome of the next inspection of the same restaurant and question
+    later = snapshot.restaurant_slice(record['cafeteria name'])
+    later = later[(later['question'] == record['question']) & (later['id'] > record['id'])]
+    if later.empty:
+        return "No later inspection"
+    status = later['compliance_status'].iloc[0]
+    if status == "Yes":
+        return "Resolved at next inspection"
+    if status == "No":
+        return "Still non-compliant at next inspection"
+    return "Undetermined at next inspection"
+
+
+def similar_findings_frame(snapshot, matches):
+    """Display table of ``FindingIndex.search`` results found in ``snapshot``."""
+    similarity = dict(matches)
+    rows = snapshot.rows_by_id([record_id for record_id, _ in matches])
+    return pd.DataFrame({
+        'Similarity': [round(similarity[record_id], 2) for record_id in rows['id']],
+        'Restaurant': rows['cafeteria name'].tolist(),
+        'Date': rows['analysis_date'].tolist() if 'analysis_date' in rows.columns else None,
+        'Question': rows['question'].tolist(),
+        'Compliance': rows['compliance_status'].tolist(),
+        'Explanation': rows['explanation'].tolist(),
+        'Improvement Suggestions': rows['improvement_suggestions'].tolist(),
+        'Follow-up': [follow_up(snapshot, record) for _, record in rows.iterrows()],
+    })
+
+
+# One index shared by every session of this Streamlit process
+@st.cache_resource
+def get_finding_index():
+    return FindingIndex()
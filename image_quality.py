@@ -0,0 +1,126 @@
+"""Local image quality checks run before the vision model is called.
+
+Exposure and sharpness are measured with vectorized NumPy on a small
+grayscale copy of the photo, which takes a few milliseconds instead of a
+multi-second model call. Depending on the configured mode, photos with
+issues are rejected outright or sent with the measurements attached to the
+prompt.
+"""
+import numpy as np
+from PIL import Image
+
+from analysis_result import AnalysisResult
+
+# Longest side of the grayscale copy the measurements are taken on
+ANALYSIS_SIDE = 512
+
+# "reject" skips the model call for photos with issues; "annotate" sends them
+# with the measurements added to the prompt
+QUALITY_MODES = ("annotate", "reject")
+
+DEFAULT_QUALITY_CONFIG = {
+    'mode': "annotate",
+    # Mean luminance (0-255) below which a photo is too dark
+    'min_mean_luminance': 40.0,
+    # Mean luminance above which a photo is overexposed
+    'max_mean_luminance': 220.0,
+    # Fraction of pixels at the ends of the range that counts as clipped
+    'max_clipped_fraction': 0.4,
+    # Laplacian variance below which a photo is too blurry
+    'min_sharpness': 60.0,
+}
+
+SHADOW_LEVEL = 8
+HIGHLIGHT_LEVEL = 247
+
+# Issues measure_quality reports, as stored in image_quality_issues
+QUALITY_ISSUES = ('too_dark', 'too_bright', 'too_blurry')
+
+
+def quality_config(overrides=None):
+    config = dict(DEFAULT_QUALITY_CONFIG)
+    config.update({key: value for key, value in (overrides or {}).items() if key in config})
+    if config['mode'] not in QUALITY_MODES:
+        raise ValueError(f"Unknown image quality mode {config['mode']!r}; expected one of {QUALITY_MODES}")
+    return config
+
+
+def _grayscale_array(image, side=ANALYSIS_SIDE, use_draft=False):
+    # JPEG decoders can downscale while decoding, which is much cheaper, but
+    # draft() changes the image in place so it's only used on private copies
+    if use_draft and image.format == "JPEG":
+        image.draft("L", (side, side))
+    gray = image.convert("L")
+    if max(gray.size) > side:
+        gray.thumbnail((side, side), Image.Resampling.BILINEAR)
+    return np.asarray(gray, dtype=np.float32)
+
+
+def laplacian_variance(gray):
+    # 4-neighbour Laplacian via array slicing, no per-pixel Python
+    center = gray[1:-1, 1:-1]
+    laplacian = gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:] - 4 * center
+    return float(laplacian.var())
+
+
+def measure_quality(image, config=None, use_draft=False):
+    """Return exposure/sharpness scores and the detected issues for ``image``."""
+    config = config or DEFAULT_QUALITY_CONFIG
+    gray = _grayscale_array(image, use_draft=use_draft)
+    pixels = gray.size
+
+    report = {
+        'mean_luminance': float(gray.mean()),
+        'shadow_clipped': float(np.count_nonzero(gray <= SHADOW_LEVEL)) / pixels,
+        'highlight_clipped': float(np.count_nonzero(gray >= HIGHLIGHT_LEVEL)) / pixels,
+        'sharpness': laplacian_variance(gray),
+    }
+
+    issues = []
+    if (report['mean_luminance'] < config['min_mean_luminance']
+            or report['shadow_clipped'] > config['max_clipped_fraction']):
+        issues.append('too_dark')
+    if (report['mean_luminance'] > config['max_mean_luminance']
+            or report['highlight_clipped'] > config['max_clipped_fraction']):
+        issues.append('too_bright')
+    if report['sharpness'] < config['min_sharpness']:
+        issues.append('too_blurry')
+    report['issues'] = issues
+    return report
+
+
+def measure_quality_file(source, config=None):
+    # ``source`` is a path or file-like object; decoded at reduced size
+    with Image.open(source) as image:
+        return measure_quality(image, config, use_draft=True)
+
+
+def should_reject(report, config):
+    return config['mode'] == "reject" and bool(report['issues'])
+
+
+def describe_quality(report):
+    # Sentence appended to the analysis prompt
+    issues = ', '.join(report['issues']) or 'none'
+    return (f"Local image measurements: mean luminance {report['mean_luminance']:.0f}/255, "
+            f"{report['shadow_clipped']:.0%} clipped shadows, {report['highlight_clipped']:.0%} clipped highlights, "
+            f"sharpness {report['sharpness']:.0f} (Laplacian variance). Locally detected issues: {issues}.")
+
+
+def merge_quality_issues(result, report):
+    # Add locally detected issues to the model's image_quality_issues
+    result.image_quality_issues += [issue for issue in report['issues'] if issue not in result.image_quality_issues]
+    return result
+
+
+def rejected_result(report):
+    # Result for a photo rejected before analysis
+    return AnalysisResult(
+        criteria_met="Unable to determine",
+        explanation="The photo was rejected by the local quality check before analysis. " + describe_quality(report),
+        improvements="Retake the photo with better lighting and a steady camera.",
+        severity="None",
+        image_quality_issues=list(report['issues']),
+        quality_assessment="Image quality prevented assessment.",
+        tags=["image_quality"],
+    )
@@ -0,0 +1,165 @@
+"""Move inline base64 images out of ``analysis_results`` into storage.
+
+Older rows store ``data:image/...;base64`` strings in ``upload_links
+(images)``, so every full-table select in the dashboard transfers the image
+bytes. This job pages through the rows that still hold inline images,
+uploads the decoded images to Supabase storage on a thread pool and replaces
+each value with a JSON list holding the storage URL, written back with
+concurrent UPDATEs, one per distinct image of a page. It can be stopped and
+re-run at any time: migrated rows no longer match, and images are stored
+under their content hash so uploading one again lands on the same object.
+
+    python migrate_inline_images.py --workers 8
+    python migrate_inline_images.py --dry-run
+"""
+import argparse
+import hashlib
+import json
+import logging
+import mimetypes
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from analysis_pipeline import IMAGE_BUCKET, IMAGE_LINKS_COLUMN, INLINE_IMAGE_PREFIX, decode_inline_image, upload_image
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'analysis_results'
+MIGRATED_FOLDER = "migrated_images"
+DEFAULT_PAGE_SIZE = 200
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_WORKERS = 8
+MAX_ATTEMPTS = 3
+
+
+def _with_retries(fn, description):
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            logger.warning(f"{description} failed (attempt {attempt}): {e}")
+            time.sleep(2 ** attempt)
+
+
+def iter_inline_rows(client, table=TABLE_NAME, page_size=DEFAULT_PAGE_SIZE):
+    """Yield pages of ``{id, upload_links (images)}`` for rows holding inline images.
+
+    Pages are keyed on ``id`` rather than offsets, since migrated rows drop
+    out of the filter while the job runs.
+    """
+    last_id = 0
+    while True:
+        response = _with_retries(
+            lambda: client.table(table)
+            .select(f'id,"{IMAGE_LINKS_COLUMN}"')
+            .like(IMAGE_LINKS_COLUMN, f"{INLINE_IMAGE_PREFIX}%")
+            .gt('id', last_id)
+            .order('id')
+            .limit(page_size)
+            .execute(),
+            "Inline image query")
+        rows = response.data or []
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]['id']
+
+
+def store_inline_image(client, value, bucket=IMAGE_BUCKET, folder=MIGRATED_FOLDER):
+    """Upload one inline image and return its public URL."""
+    content_type, data = decode_inline_image(value)
+    extension = mimetypes.guess_extension(content_type) or ".png"
+    file_name = f"{hashlib.sha1(data).hexdigest()}{extension}"
+    try:
+        return upload_image(client, data, file_name, bucket, folder, content_type=content_type)
+    except Exception as e:
+        # Already uploaded by an earlier, interrupted run
+        if "already exists" not in str(e) and "Duplicate" not in str(e):
+            raise
+        return client.storage.from_(bucket).get_public_url(f"{folder}/{file_name}")
+
+
+def migrate_inline_images(client, table=TABLE_NAME, workers=DEFAULT_WORKERS, page_size=DEFAULT_PAGE_SIZE,
+                          batch_size=DEFAULT_BATCH_SIZE, dry_run=False, progress=None):
+    """Replace inline images with storage URLs and return migrated/failed/bytes counts.
+
+    ``progress(counts)`` is called after every page.
+    """
+    counts = {'found': 0, 'migrated': 0, 'failed': 0, 'inline_bytes': 0}
+
+    def migrate_row(row):
+        value = row[IMAGE_LINKS_COLUMN]
+        url = _with_retries(lambda: store_inline_image(client, value), f"Upload for row {row['id']}")
+        return {'id': row['id'], IMAGE_LINKS_COLUMN: json.dumps([url])}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for rows in iter_inline_rows(client, table, page_size):
+            counts['found'] += len(rows)
+            counts['inline_bytes'] += sum(len(row[IMAGE_LINKS_COLUMN]) for row in rows)
+            if dry_run:
+                continue
+
+            updates = []
+            for row, future in [(row, pool.submit(migrate_row, row)) for row in rows]:
+                try:
+                    updates.append(future.result())
+                except Exception as e:
+                    logger.error(f"Could not migrate the image of row {row['id']}: {e}")
+                    counts['failed'] += 1
+
+            # A real UPDATE, never an upsert: Postgres checks NOT NULL columns
+            # of an upsert's insert tuple before resolving the conflict on id.
+            # Rows holding the same image share its URL and one request.
+            ids_by_value = {}
+            for update in updates:
+                ids_by_value.setdefault(update[IMAGE_LINKS_COLUMN], []).append(update['id'])
+
+            def write_back(value, ids):
+                _with_retries(
+                    lambda: client.table(table).update({IMAGE_LINKS_COLUMN: value}).in_('id', ids).execute(),
+                    f"Update of {len(ids)} rows")
+                return len(ids)
+
+            writes = [pool.submit(write_back, value, ids[start:start + batch_size])
+                      for value, ids in ids_by_value.items() for start in range(0, len(ids), batch_size)]
+            for future in writes:
+                counts['migrated'] += future.result()
+
+            if progress:
+                progress(counts)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="concurrent storage uploads")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="rows fetched per query")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="most rows per update request")
+    parser.add_argument("--dry-run", action="store_true", help="only count rows with inline images")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from app_config import create_supabase_client
+
+    def report(counts):
+        logger.info(f"{counts['migrated']} rows migrated, {counts['failed']} failed")
+
+    start = time.perf_counter()
+    counts = migrate_inline_images(
+        create_supabase_client(),
+        workers=args.workers,
+        page_size=args.page_size,
+        batch_size=args.batch_size,
+        dry_run=args.dry_run,
+        progress=report,
+    )
+    logger.info(f"Finished in {time.perf_counter() - start:.1f}s: {counts['found']} rows with inline images "
+                f"({counts['inline_bytes'] / 1e6:.1f} MB), {counts['migrated']} migrated, {counts['failed']} failed")
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""Lightweight timing spans and cache counters for the dashboard.
+
+Spans are recorded into a process-wide registry shared by every session.
+The registry can be shown in an optional sidebar panel and exported in the
+Prometheus text format, either to a file (for the node_exporter textfile
+collector) or over a small HTTP endpoint.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# Number of recent samples kept per span for the percentile estimates
+SPAN_WINDOW = 500
+
+# Minimum number of seconds between two writes of the metrics file
+EXPORT_INTERVAL_SECONDS = 15
+
+METRIC_PREFIX = "hungerbox"
+
+
+class MetricsRegistry:
+    """Thread-safe store of span timings, counters and cache statistics."""
+
+    def __init__(self, window=SPAN_WINDOW):
+        self.window = window
+        self._spans = {}
+        self._span_totals = {}
+        self._cache_stats = {}
+        self._cache_sources = {}
+        self._gauges = {}
+        self._gauge_sources = {}
+        self._last_export = 0.0
+        self._lock = threading.Lock()
+
+    def record_span(self, name, seconds):
+        with self._lock:
+            if name not in self._spans:
+                self._spans[name] = deque(maxlen=self.window)
+                self._span_totals[name] = [0, 0.0]
+            self._spans[name].append(seconds)
+            totals = self._span_totals[name]
+            totals[0] += 1
+            totals[1] += seconds
+
+    def record_cache_lookup(self, name, hit):
+        with self._lock:
+            stats = self._cache_stats.setdefault(name, [0, 0])
+            stats[0 if hit else 1] += 1
+
+    def register_cache_source(self, name, source):
+        # ``source`` is any object exposing ``hits`` and ``misses`` counters
+        with self._lock:
+            self._cache_sources[name] = source
+
+    def register_gauge_source(self, name, source):
+        # ``source`` is any object whose ``gauges()`` returns (name, labels, value) tuples
+        with self._lock:
+            self._gauge_sources[name] = source
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def span_summary(self):
+        with self._lock:
+            spans = {name: (list(samples), tuple(self._span_totals[name]))
+                     for name, samples in self._spans.items()}
+
+        rows = []
+        for name, (samples, (count, total)) in sorted(spans.items()):
+            values = np.asarray(samples)
+            rows.append({
+                'span': name,
+                'latest_ms': values[-1] * 1000,
+                'p50_ms': np.percentile(values, 50) * 1000,
+                'p95_ms': np.percentile(values, 95) * 1000,
+                'count': count,
+                'total_s': total,
+            })
+        return rows
+
+    def cache_summary(self):
+        with self._lock:
+            stats = {name: tuple(counts) for name, counts in self._cache_stats.items()}
+            for name, source in self._cache_sources.items():
+                stats[name] = (source.hits, source.misses)
+
+        rows = []
+        for name, (hits, misses) in sorted(stats.items()):
+            lookups = hits + misses
+            rows.append({
+                'cache': name,
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+            })
+        return rows
+
+    def gauge_summary(self):
+        with self._lock:
+            gauges = dict(self._gauges)
+            sources = list(self._gauge_sources.values())
+        for source in sources:
+            for name, labels, value in source.gauges():
+                gauges[(name, tuple(sorted(labels.items())))] = value
+        return gauges
+
+    def render_prometheus(self):
+        lines = [
+            f"# HELP {METRIC_PREFIX}_span_seconds Duration of instrumented dashboard spans.",
+            f"# TYPE {METRIC_PREFIX}_span_seconds summary",
+        ]
+        for row in self.span_summary():
+            label = f'span="{row["span"]}"'
+            lines.append(f'{METRIC_PREFIX}_span_seconds{{{label},quantile="0.5"}} {row["p50_ms"] / 1000:.6f}')
+            lines.append(f'{METRIC_PREFIX}_span_seconds{{{label},quantile="0.95"}} {row["p95_ms"] / 1000:.6f}')
+            lines.append(f'{METRIC_PREFIX}_span_seconds_sum{{{label}}} {row["total_s"]:.6f}')
+            lines.append(f'{METRIC_PREFIX}_span_seconds_count{{{label}}} {row["count"]}')
+
+        cache_rows = self.cache_summary()
+        lines.append(f"# HELP {METRIC_PREFIX}_cache_hits_total Cache lookups served from cache.")
+        lines.append(f"# TYPE {METRIC_PREFIX}_cache_hits_total counter")
+        for row in cache_rows:
+            lines.append(f'{METRIC_PREFIX}_cache_hits_total{{cache="{row["cache"]}"}} {row["hits"]}')
+        lines.append(f"# HELP {METRIC_PREFIX}_cache_misses_total Cache lookups that had to compute the value.")
+        lines.append(f"# TYPE {METRIC_PREFIX}_cache_misses_total counter")
+        for row in cache_rows:
+            lines.append(f'{METRIC_PREFIX}_cache_misses_total{{cache="{row["cache"]}"}} {row["misses"]}')
+
+        gauges = self.gauge_summary()
+        for gauge_name in sorted({name for name, _ in gauges}):
+            lines.append(f"# TYPE {METRIC_PREFIX}_{gauge_name} gauge")
+            for (name, labels), value in sorted(gauges.items()):
+                if name != gauge_name:
+                    continue
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+                lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def export_to_file(self, path, force=False):
+        # Throttled, atomic write so a scraper never reads a partial file
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_export < EXPORT_INTERVAL_SECONDS:
+                return False
+            self._last_export = now
+
+        text = self.render_prometheus()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        return True
+
+
+# One registry shared by every session of this Streamlit process
+@st.cache_resource
+def get_metrics():
+    return MetricsRegistry()
+
+
+@contextmanager
+def timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_metrics().record_span(name, time.perf_counter() - start)
+
+
+def record_span(name, seconds):
+    get_metrics().record_span(name, seconds)
+
+
+def record_cache_lookup(name, hit):
+    get_metrics().record_cache_lookup(name, hit)
+
+
+# Serve the registry at http://<host>:<port>/metrics from a daemon thread
+@st.cache_resource
+def start_metrics_server(port):
+    registry = get_metrics()
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    except OSError as e:
+        logger.error(f"Could not start metrics endpoint on port {port}: {e}")
+        return None
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info(f"Serving Prometheus metrics on port {port}")
+    return server
+
+
+def export_metrics(config):
+    # ``config`` is the optional [metrics] secrets section
+    textfile_path = config.get("textfile_path")
+    if textfile_path:
+        try:
+            get_metrics().export_to_file(textfile_path)
+        except OSError as e:
+            logger.error(f"Could not write metrics file {textfile_path}: {e}")
+
+    port = config.get("port")
+    if port:
+        start_metrics_server(int(port))
+
+
+def render_metrics_panel():
+    if not st.checkbox("Show performance metrics", key="show_perf_metrics"):
+        return
+
+    registry = get_metrics()
+    span_rows = registry.span_summary()
+    if span_rows:
+        st.markdown("**Timings (ms)**")
+        spans_df = pd.DataFrame(span_rows)[['span', 'latest_ms', 'p50_ms', 'p95_ms', 'count']]
+        st.dataframe(spans_df.round(1), hide_index=True, use_container_width=True)
+    else:
+        st.caption("No timings recorded yet")
+
+    cache_rows = registry.cache_summary()
+    if cache_rows:
+        st.markdown("**Cache hit rates**")
+        cache_df = pd.DataFrame(cache_rows)
+        cache_df['hit_rate'] = (cache_df['hit_rate'] * 100).round(1).astype(str) + "%"
+        st.dataframe(cache_df, hide_index=True, use_container_width=True)
+
+    gauges = registry.gauge_summary()
+    if gauges:
+        st.markdown("**Gauges**")
+        gauges_df = pd.DataFrame([
+            {'gauge': name, 'labels': ", ".join(f"{key}={label}" for key, label in labels), 'value': value}
+            for (name, labels), value in sorted(gauges.items())
+        ])
+        st.dataframe(gauges_df, hide_index=True, use_container_width=True)
@@ -0,0 +1,157 @@
+"""Page-at-a-time HTML rendering of inspection records.
+
+The Individual Records view used to issue a dozen Streamlit elements per
+record (expander, columns, subheaders, one markdown call per field), and
+each element is a separate message to the browser. Here a page of records
+is rendered from a template into a single HTML block, with native
+``<details>`` elements for the collapsible records, and cached across
+sessions per dataset version, filter selection and page. Images are linked
+by URL so the browser loads them lazily instead of the server downloading
+every one.
+"""
+import html
+import json
+
+import pandas as pd
+import streamlit as st
+
+from figure_cache import LRUCache
+from perf_metrics import get_metrics
+
+RECORDS_PER_PAGE = 25
+
+# Maximum number of rendered pages kept across all sessions
+RECORD_PAGE_CACHE_MAX_ENTRIES = 512
+
+STATUS_COLORS = {'Yes': "green", 'No': "red"}
+SEVERITY_COLORS = {'Critical': "red", 'Major': "orange", 'Minor': "yellow"}
+
+RECORDS_CSS = """<style>
+.record-card { border: 1px solid rgba(49, 51, 63, 0.2); border-radius: 0.5rem; margin-bottom: 0.5rem; }
+.record-card summary { cursor: pointer; padding: 0.6rem 1rem; }
+.record-body { display: flex; gap: 1.5rem; padding: 0 1rem 1rem 1rem; }
+.record-image { flex: 1; }
+.record-image img { max-width: 100%; border-radius: 0.3rem; }
+.record-fields { flex: 2; }
+.record-fields p { margin: 0 0 0.4rem 0; }
+</style>"""
+
+RECORD_TEMPLATE = (
+    '<details class="record-card"><summary>{title}</summary><div class="record-body">'
+    '<div class="record-image">{image}</div><div class="record-fields">{fields}</div></div></details>'
+)
+FIELD_TEMPLATE = '<p><b>{label}:</b> {value}</p>'
+COLORED_TEMPLATE = '<span style="color:{color};">{value}</span>'
+IMAGE_TEMPLATE = '<img src="{url}" loading="lazy" alt="Inspection photo">'
+TAG_TEMPLATE = '<span class="tag-pill">{tag}</span>'
+
+TEXT_FIELDS = [
+    ('explanation', "Explanation"),
+    ('improvement_suggestions', "Improvement Suggestions"),
+    ('image_quality_issues', "Image Quality Issues"),
+    ('quality_assessment', "Quality Assessment"),
+]
+
+
+# Rendered pages shared by every session of this Streamlit process
+@st.cache_resource
+def get_record_page_cache():
+    cache = LRUCache(RECORD_PAGE_CACHE_MAX_ENTRIES)
+    get_metrics().register_cache_source("record_page", cache)
+    return cache
+
+
+def image_link(value):
+    """First image URL of an ``upload_links (images)`` value, or None."""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    value = value.strip()
+    if value.startswith('['):
+        try:
+            urls = json.loads(value)
+        except ValueError:
+            return None
+        value = urls[0] if isinstance(urls, list) and urls and isinstance(urls[0], str) else ""
+    # Only links the browser can load directly; anything else is not rendered
+    if value.startswith(("http://", "https://", "data:image")):
+        return value
+    return None
+
+
+def _text(value):
+    # Escaped, with line breaks kept; pages go through st.html, not markdown
+    if not pd.notna(value) or value == "":
+        return None
+    return html.escape(str(value)).replace("\r\n", "\n").replace("\n", "<br>")
+
+
+def render_record(record):
+    question = str(record.get('question') or "")
+    preview = question if len(question) <= 60 else question[:60] + "..."
+    title = html.escape(f"{record.get('cafeteria name')} - {preview}")
+
+    url = image_link(record.get('upload_links (images)'))
+    image = IMAGE_TEMPLATE.format(url=html.escape(url)) if url else "<p>No image available</p>"
+
+    status = record.get('compliance_status')
+    fields = [FIELD_TEMPLATE.format(label="Compliance Status", value=COLORED_TEMPLATE.format(
+        color=STATUS_COLORS.get(status, "orange"), value=_text(status) or ""))]
+    severity = _text(record.get('severity_level'))
+    if severity:
+        fields.append(FIELD_TEMPLATE.format(label="Severity Level", value=COLORED_TEMPLATE.format(
+            color=SEVERITY_COLORS.get(record.get('severity_level'), "green"), value=severity)))
+    fields.append(FIELD_TEMPLATE.format(label="Question", value=_text(question) or ""))
+    for column, label in TEXT_FIELDS:
+        value = _text(record.get(column))
+        if value and not (column == 'image_quality_issues' and value == 'none'):
+            fields.append(FIELD_TEMPLATE.format(label=label, value=value))
+    tags = _text(record.get('tags'))
+    if tags:
+        pills = "".join(TAG_TEMPLATE.format(tag=tag.strip()) for tag in tags.split(',') if tag.strip())
+        fields.append(FIELD_TEMPLATE.format(label="Tags", value=pills))
+    date = _text(record.get('analysis_date'))
+    if date:
+        fields.append(FIELD_TEMPLATE.format(label="Analysis Date", value=date))
+
+    return RECORD_TEMPLATE.format(title=title, image=image, fields="".join(fields))
+
+
+def render_records_page(df):
+    return "".join(render_record(record) for record in df.to_dict('records'))
+
+
+def page_count(n_records, per_page=RECORDS_PER_PAGE):
+    return max(1, -(-n_records // per_page))
+
+
+def cached_records_page(df, page, cache_key, per_page=RECORDS_PER_PAGE):
+    """HTML for ``page`` (1-based) of ``df``, rendered on a cache miss only.
+
+    ``cache_key`` identifies the dataset version and filter selection that
+    produced ``df``.
+    """
+    cache = get_record_page_cache()
+    key = (cache_key, page, per_page)
+    page_html = cache.get(key)
+    if page_html is None:
+        start = (page - 1) * per_page
+        page_html = render_records_page(df.iloc[start:start + per_page])
+        cache.put(key, page_html)
+    return page_html
+
+
+def render_records(df, cache_key, key="records_page", per_page=RECORDS_PER_PAGE):
+    """Page picker plus the selected page of ``df`` as one HTML element; returns the page's rows."""
+    if df.empty:
+        st.info("No records match the selected filters.")
+        return df
+    pages = page_count(len(df), per_page)
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages})", min_value=1, value=1, step=1, key=key)
+        # A page kept from a wider filter selection may be past the end
+        page = min(int(page), pages)
+    # Raw HTML, so blank lines, $ and * in record text are not read as markdown or LaTeX
+    st.html(RECORDS_CSS + cached_records_page(df, page, cache_key, per_page))
+    start = (page - 1) * per_page
+    return df.iloc[start:start + per_page]
@@ -0,0 +1,292 @@
+"""Client-side rate limiting and circuit breaking for OpenAI and Supabase calls.
+
+Every call to a dependency goes through a ``Dependency``: a circuit breaker
+that fails fast while the dependency is down, then an ``AdaptiveLimiter``
+that combines a token bucket (requests per second) with an AIMD window on
+concurrent requests. The window grows by one request per window's worth of
+successful calls and halves when the dependency answers 429 or is slower
+than its latency target. One set of dependencies is shared by every session
+of the Streamlit process, so sessions back off together.
+"""
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+import streamlit as st
+
+from perf_metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMITS = {
+    'openai': {'rate_per_second': 5.0, 'burst': 10, 'max_concurrency': 16, 'latency_target': 30.0},
+    'supabase': {'rate_per_second': 20.0, 'burst': 20, 'max_concurrency': 8, 'latency_target': 10.0},
+    'storage': {'rate_per_second': 10.0, 'burst': 10, 'max_concurrency': 8, 'latency_target': 15.0},
+}
+
+DEFAULT_BREAKER = {
+    # Consecutive failures that open the breaker
+    'failure_threshold': 5,
+    # Seconds an open breaker waits before letting one probe call through
+    'reset_timeout': 30.0,
+}
+
+# Longest a call waits for the limiter before giving up
+DEFAULT_ACQUIRE_TIMEOUT = 30.0
+
+BREAKER_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+DISPLAY_NAMES = {'openai': "OpenAI", 'supabase': "Supabase", 'storage': "Supabase storage"}
+
+
+class DependencyUnavailable(Exception):
+    """Raised instead of calling a dependency that is down or saturated."""
+
+    def __init__(self, dependency, message, retry_after=None):
+        super().__init__(message)
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(DependencyUnavailable):
+    pass
+
+
+class LimiterTimeout(DependencyUnavailable):
+    pass
+
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_throttled(error):
+    status = _status_code(error)
+    if status is not None:
+        return status == 429
+    text = str(error).lower()
+    return "429" in text or "rate limit" in text or "too many requests" in text
+
+
+def counts_as_failure(error):
+    # Bad requests and malformed responses say nothing about the dependency's health
+    if isinstance(error, (ValueError, TypeError, KeyError, DependencyUnavailable)):
+        return False
+    status = _status_code(error)
+    if status is not None and 400 <= status < 500 and status != 408:
+        return False
+    return not is_throttled(error)
+
+
+class AdaptiveLimiter:
+    """Token bucket on request rate plus an AIMD window on concurrent requests."""
+
+    def __init__(self, rate_per_second, burst=1, max_concurrency=8, min_concurrency=1,
+                 latency_target=None, acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        self.rate = float(rate_per_second)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.latency_target = latency_target
+        self.acquire_timeout = acquire_timeout
+        self.in_flight = 0
+        self.throttled = 0
+        self.decreases = 0
+        # Smoothed call latency; one window of calls takes about this long
+        self.latency = None
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout=None):
+        """Wait for a rate token and a concurrency slot; False when ``timeout`` passes first."""
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self.in_flight < int(self.limit) and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return True
+                remaining = deadline - now
+                if remaining <= 0:
+                    return False
+                wait_time = remaining
+                if self.tokens < 1:
+                    wait_time = min(wait_time, (1 - self.tokens) / self.rate)
+                self._cond.wait(wait_time)
+
+    def release(self, latency=None, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if latency is not None:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            if throttled:
+                self.throttled += 1
+                # Pause new requests until the bucket refills
+                self.tokens = min(self.tokens, 0.0)
+                self._decrease(now)
+            elif self.latency_target and latency is not None and latency > self.latency_target:
+                self._decrease(now)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def _decrease(self, now):
+        # Calls already in flight report the same overload; halve at most once per round trip
+        if now - self._last_decrease < min(self.latency or 1.0, 1.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_concurrency, self.limit / 2)
+        self.decreases += 1
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single probe through after ``reset_timeout``."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self):
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+                return True
+            return self.state == "closed"
+
+    def release_probe(self):
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened += 1
+                self._opened_at = time.monotonic()
+
+
+class Dependency:
+    """A named dependency whose calls go through a circuit breaker and an adaptive limiter."""
+
+    def __init__(self, name, limiter, breaker):
+        self.name = name
+        self.limiter = limiter
+        self.breaker = breaker
+
+    def call(self, fn, *args, **kwargs):
+        label = DISPLAY_NAMES.get(self.name, self.name)
+        if not self.breaker.allow():
+            retry_after = self.breaker.retry_after()
+            raise CircuitOpenError(self.name, f"{label} is unavailable after repeated failures; "
+                                              f"trying again in {retry_after:.0f}s", retry_after)
+        if not self.limiter.acquire():
+            # A probe that never ran must not hold the half-open slot
+            self.breaker.release_probe()
+            raise LimiterTimeout(self.name, f"{label} is busy; please try again in a moment")
+
+        throttled = False
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            throttled = is_throttled(e)
+            if counts_as_failure(e):
+                self.breaker.record_failure()
+                logger.warning(f"{self.name} call failed ({self.breaker.failures} in a row): {e}")
+            else:
+                # 429s and bad requests say nothing either way: free a probe slot, keep the failure count
+                self.breaker.release_probe()
+            raise
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+        finally:
+            self.limiter.release(time.perf_counter() - start, throttled=throttled)
+        self.breaker.record_success()
+        return result
+
+    def gauges(self):
+        labels = {'dependency': self.name}
+        return [
+            ("limiter_concurrency_limit", labels, int(self.limiter.limit)),
+            ("limiter_in_flight", labels, self.limiter.in_flight),
+            ("limiter_rate_per_second", labels, self.limiter.rate),
+            ("limiter_throttled_total", labels, self.limiter.throttled),
+            ("breaker_state", labels, BREAKER_STATE_VALUES[self.breaker.state]),
+            ("breaker_opened_total", labels, self.breaker.opened),
+        ]
+
+
+class DependencySet(dict):
+    """Dependencies by name, exposed to the metrics registry as gauges."""
+
+    def gauges(self):
+        return [gauge for dependency in self.values() for gauge in dependency.gauges()]
+
+
+def guard_openai_client(client, dependency):
+    """Wrap an OpenAI client so every chat completion goes through ``dependency``."""
+    def create(*args, **kwargs):
+        return dependency.call(client.chat.completions.create, *args, **kwargs)
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def limits_config(overrides=None):
+    # ``overrides`` is the optional [limits] secrets section, e.g. [limits.openai]
+    overrides = overrides or {}
+    config = {}
+    for name, defaults in DEFAULT_LIMITS.items():
+        section = overrides.get(name, {})
+        config[name] = {key: section.get(key, value) for key, value in {**defaults, **DEFAULT_BREAKER}.items()}
+    return config
+
+
+def build_dependency(name, settings):
+    limiter = AdaptiveLimiter(settings['rate_per_second'], burst=settings['burst'],
+                              max_concurrency=settings['max_concurrency'],
+                              latency_target=settings['latency_target'])
+    breaker = CircuitBreaker(settings['failure_threshold'], settings['reset_timeout'])
+    return Dependency(name, limiter, breaker)
+
+
+# One set of limiters and breakers shared by every session of this Streamlit process
+@st.cache_resource
+def get_dependencies(config):
+    dependencies = DependencySet({name: build_dependency(name, settings) for name, settings in config.items()})
+    get_metrics().register_gauge_source("dependencies", dependencies)
+    return dependencies
@@ -0,0 +1,62 @@
+"""Plotly figures of one restaurant's records.
+
+Shared by the Restaurant Analysis view and the offline cafeteria reports so
+both show the same charts. Each builder returns None when there is nothing
+to plot.
+"""
+import plotly.express as px
+
+import dashboard_data
+
+
+def compliance_pie(restaurant_df):
+    compliance_counts = dashboard_data.compliance_counts(restaurant_df)
+    return px.pie(
+        names=compliance_counts.index,
+        values=compliance_counts.values,
+        title="Compliance Status",
+        color_discrete_sequence=px.colors.qualitative.Bold,
+        hole=0.4
+    )
+
+
+def severity_bar(restaurant_df):
+    if 'severity_level' not in restaurant_df.columns:
+        return None
+    severity_counts = dashboard_data.severity_counts(restaurant_df)
+    return px.bar(
+        x=severity_counts.index,
+        y=severity_counts.values,
+        title="Severity Levels",
+        labels={'x': 'Severity', 'y': 'Count'},
+        color=severity_counts.index,
+        color_discrete_sequence=px.colors.qualitative.Bold
+    )
+
+
+def quality_issues_bar(restaurant_df):
+    if 'image_quality_issues' not in restaurant_df.columns or restaurant_df['image_quality_issues'].dropna().empty:
+        return None
+    quality_counts = dashboard_data.quality_issue_counts(restaurant_df)
+    return px.bar(
+        x=quality_counts.index,
+        y=quality_counts.values,
+        title="Image Quality Issues",
+        labels={'x': 'Issue Type', 'y': 'Count'},
+        color=quality_counts.index
+    )
+
+
+def tags_bar(restaurant_df):
+    if 'tags' not in restaurant_df.columns:
+        return None
+    tags_df = dashboard_data.top_tags(restaurant_df, 10)
+    if tags_df.empty:
+        return None
+    return px.bar(
+        tags_df,
+        x='Tag',
+        y='Count',
+        title="Top 10 Tags",
+        color='Tag'
+    )
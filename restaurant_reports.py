@@ -0,0 +1,289 @@
+"""Offline compliance reports, one static HTML page per cafeteria.
+
+Fetches ``analysis_results``, splits the records by ``cafeteria name`` and
+hashes each cafeteria's records. Only cafeterias whose hash differs from the
+one recorded in ``manifest.json`` by the previous run are rendered, on a
+process pool. Each report carries the Restaurant Analysis charts exported as
+static images (plotly's kaleido export, one headless browser per report),
+the non-compliant items and the improvement suggestions, in one
+self-contained file that can be mailed or hosted as is. ``index.html`` links
+every report. Run it from cron for weekly reports:
+
+    python restaurant_reports.py --out reports
+    python restaurant_reports.py --out reports --workers 8 --force
+"""
+import argparse
+import base64
+import hashlib
+import html
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import plotly.io as pio
+
+import dashboard_data
+import restaurant_figures
+
+logger = logging.getLogger(__name__)
+
+RESTAURANT_COLUMN = 'cafeteria name'
+
+# Part of every partition hash; bump it when the report layout changes so
+# every report is rebuilt once
+REPORT_VERSION = 1
+
+DEFAULT_OUTPUT_DIR = "reports"
+DEFAULT_WORKERS = 4
+MANIFEST_NAME = "manifest.json"
+INDEX_NAME = "index.html"
+
+IMAGE_FORMATS = {'png': "image/png", 'svg': "image/svg+xml"}
+CHART_WIDTH = 700
+CHART_HEIGHT = 450
+
+REPORT_CHARTS = [
+    restaurant_figures.compliance_pie,
+    restaurant_figures.severity_bar,
+    restaurant_figures.quality_issues_bar,
+    restaurant_figures.tags_bar,
+]
+
+REPORT_CSS = """<style>
+body { font-family: sans-serif; margin: 2rem; color: #262730; }
+h1 { color: #1E3A8A; }
+.stats { display: flex; gap: 2rem; margin-bottom: 1.5rem; }
+.stat { border: 1px solid #ddd; border-radius: 0.5rem; padding: 0.8rem 1.2rem; }
+.stat b { display: block; font-size: 1.6rem; }
+.charts { display: flex; flex-wrap: wrap; gap: 1rem; }
+.charts img { max-width: 100%; }
+table { border-collapse: collapse; width: 100%; }
+th, td { border: 1px solid #ddd; padding: 0.4rem; text-align: left; vertical-align: top; }
+th { background: #f0f2f6; }
+</style>"""
+
+REPORT_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>{css}</head><body>
+<h1>{title}</h1>
+<p>Generated {generated} from {total} inspections.</p>
+<div class="stats">{stats}</div>
+<h2>Charts</h2><div class="charts">{charts}</div>
+<h2>Non-Compliant Items</h2>{non_compliant}
+<h2>Improvement Suggestions</h2>{suggestions}
+</body></html>
+"""
+
+INDEX_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Cafeteria Compliance Reports</title>{css}</head><body>
+<h1>Cafeteria Compliance Reports</h1>
+<p>Updated {generated}; {count} cafeterias.</p>
+<table><tr><th>Cafeteria</th><th>Inspections</th><th>Compliance Rate</th><th>Report generated</th></tr>
+{rows}</table>
+</body></html>
+"""
+
+
+def partition_records(records):
+    """Records grouped by cafeteria, each group sorted by id."""
+    partitions = {}
+    for record in records:
+        name = record.get(RESTAURANT_COLUMN)
+        if name is not None:
+            partitions.setdefault(name, []).append(record)
+    for partition in partitions.values():
+        partition.sort(key=lambda record: (record.get('id') is None, record.get('id') or 0))
+    return partitions
+
+
+def partition_hash(records, image_format):
+    content = json.dumps([REPORT_VERSION, image_format, records], sort_keys=True, default=str)
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def report_filename(name):
+    # Readable and unique: a slug of the name plus a hash of the full name
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")[:60] or "cafeteria"
+    return f"{slug}-{hashlib.sha1(name.encode()).hexdigest()[:8]}.html"
+
+
+def write_atomic(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f).get('reports', {})
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable manifest {path}: {e}")
+        return {}
+
+
+def figure_images(figures, image_format):
+    """Static images of ``figures`` as ``<img>`` tags with the images inlined.
+
+    The figures are exported in one batch, which reuses one headless browser
+    instead of starting one per figure.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, f"{i}.{image_format}") for i in range(len(figures))]
+        pio.write_images(figures, paths, format=image_format, width=CHART_WIDTH, height=CHART_HEIGHT)
+        images = []
+        for fig, path in zip(figures, paths):
+            with open(path, "rb") as f:
+                encoded = base64.b64encode(f.read()).decode()
+            images.append(f'<img src="data:{IMAGE_FORMATS[image_format]};base64,{encoded}" '
+                          f'alt="{html.escape(fig.layout.title.text or "")}">')
+    return images
+
+
+def suggestion_list(restaurant_df):
+    # Distinct suggestions of the non-compliant items, most frequent first
+    if 'improvement_suggestions' not in restaurant_df.columns:
+        return Counter()
+    non_compliant = restaurant_df[restaurant_df['compliance_status'] == 'No']
+    suggestions = non_compliant['improvement_suggestions'].dropna().astype(str).str.strip()
+    return Counter(suggestion for suggestion in suggestions if suggestion and suggestion.lower() != 'none')
+
+
+def render_report(name, restaurant_df, stats, image_format="png"):
+    """HTML report of one cafeteria's records."""
+    stat_items = [("Total Records", stats['total']), ("Compliance Rate", f"{stats['compliance_percentage']:.1f}%"),
+                  ("Critical Issues", stats['critical_count'] if stats['critical_count'] is not None else "N/A")]
+
+    figures = [fig for fig in (build_figure(restaurant_df) for build_figure in REPORT_CHARTS) if fig is not None]
+    charts = figure_images(figures, image_format) if figures else []
+
+    non_compliant = dashboard_data.non_compliant_items(restaurant_df)
+    suggestions = suggestion_list(restaurant_df)
+    return REPORT_TEMPLATE.format(
+        title=html.escape(f"Compliance Report: {name}"),
+        css=REPORT_CSS,
+        generated=datetime.now().strftime("%Y-%m-%d %H:%M"),
+        total=stats['total'],
+        stats="".join(f'<div class="stat">{label}<b>{html.escape(str(value))}</b></div>'
+                      for label, value in stat_items),
+        charts="".join(charts) or "<p>No chart data.</p>",
+        non_compliant=(non_compliant.to_html(index=False, na_rep="") if not non_compliant.empty
+                       else "<p>No non-compliant items found for this cafeteria.</p>"),
+        suggestions=("<ul>" + "".join(f"<li>{html.escape(text)} ({count}×)</li>"
+                                      for text, count in suggestions.most_common()) + "</ul>"
+                     if suggestions else "<p>No improvement suggestions.</p>"),
+    )
+
+
+def build_report(name, records, path, image_format):
+    # Process pool task; returns the summary kept in the manifest
+    restaurant_df = dashboard_data.records_to_frame(records)
+    stats = dashboard_data.restaurant_stats(restaurant_df)
+    write_atomic(path, render_report(name, restaurant_df, stats, image_format))
+    return {
+        'records': stats['total'],
+        'compliance_percentage': stats['compliance_percentage'],
+        'generated_at': datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def write_index(output_dir, reports):
+    rows = "".join(
+        f'<tr><td><a href="{html.escape(entry["file"])}">{html.escape(name)}</a></td><td>{entry["records"]}</td>'
+        f'<td>{entry["compliance_percentage"]:.1f}%</td><td>{entry["generated_at"]}</td></tr>\n'
+        for name, entry in sorted(reports.items())
+    )
+    write_atomic(os.path.join(output_dir, INDEX_NAME), INDEX_TEMPLATE.format(
+        css=REPORT_CSS, generated=datetime.now().strftime("%Y-%m-%d %H:%M"), count=len(reports), rows=rows))
+
+
+def generate_reports(records, output_dir=DEFAULT_OUTPUT_DIR, workers=DEFAULT_WORKERS, image_format="png",
+                     force=False):
+    """Write the report of every cafeteria whose records changed since the last run.
+
+    Returns counts of ``built``, ``unchanged``, ``removed`` and ``failed`` reports.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    previous = load_manifest(output_dir)
+    partitions = partition_records(records)
+
+    reports = {}
+    pending = {}
+    for name, partition in partitions.items():
+        content_hash = partition_hash(partition, image_format)
+        entry = previous.get(name)
+        if not force and entry and entry.get('hash') == content_hash and \
+                os.path.exists(os.path.join(output_dir, entry['file'])):
+            reports[name] = entry
+        else:
+            pending[name] = content_hash
+    counts = {'built': 0, 'unchanged': len(reports), 'removed': 0, 'failed': 0}
+    logger.info(f"{len(partitions)} cafeterias: {len(pending)} to build, {len(reports)} unchanged")
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+            futures = {
+                pool.submit(build_report, name, partitions[name],
+                            os.path.join(output_dir, report_filename(name)), image_format): name
+                for name in pending
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    logger.error(f"Report for {name} failed: {e}")
+                    counts['failed'] += 1
+                    # Keep the previous report, with its old hash so the next run retries
+                    if name in previous:
+                        reports[name] = previous[name]
+                    continue
+                reports[name] = dict(summary, hash=pending[name], file=report_filename(name))
+                counts['built'] += 1
+
+    # Reports of cafeterias that no longer have records
+    for name in previous.keys() - partitions.keys():
+        path = os.path.join(output_dir, previous[name]['file'])
+        if os.path.exists(path):
+            os.remove(path)
+        counts['removed'] += 1
+
+    write_atomic(os.path.join(output_dir, MANIFEST_NAME),
+                 json.dumps({'version': REPORT_VERSION, 'reports': reports}, indent=1))
+    write_index(output_dir, reports)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=DEFAULT_OUTPUT_DIR, help="report directory")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="report processes")
+    parser.add_argument("--image-format", choices=sorted(IMAGE_FORMATS), default="png", help="chart image format")
+    parser.add_argument("--force", action="store_true", help="rebuild every report")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from app_config import create_supabase_client
+
+    start = time.perf_counter()
+    records = dashboard_data.fetch_all_records(create_supabase_client(), 'analysis_results')
+    counts = generate_reports(records, args.out, workers=args.workers, image_format=args.image_format,
+                              force=args.force)
+    logger.info(f"Finished in {time.perf_counter() - start:.1f}s: {counts['built']} built, "
+                f"{counts['unchanged']} unchanged, {counts['removed']} removed, {counts['failed']} failed")
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
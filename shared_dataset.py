@@ -0,0 +1,128 @@
+"""Host-level copy of the dataset, shared by every app process on the machine.
+
+Several Streamlit processes behind a load balancer would otherwise each
+page through ``analysis_results`` and hold their own copy of it. Here one
+process at a time, holding an exclusive ``flock`` on ``refresh.lock``,
+fetches the records and publishes them as uncompressed Arrow IPC files: the
+sorted dataset and its derived restaurant comparison, plus ``current.json``
+naming the current version. Every process, the writer included, then
+memory-maps those files, so the table's pages are shared through the page
+cache (``/dev/shm`` by default, i.e. shared memory) instead of copied into
+each heap. A process that waited on the lock while another one refreshed
+adopts that version instead of fetching again, and every process notices a
+newly published version from the manifest's mtime on its next rerun.
+"""
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARED_CACHE_CONFIG = {
+    'enabled': False,
+    'path': os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+                         "food_safety_dataset"),
+    # A starting process maps a version published at most this many seconds
+    # ago instead of fetching; older ones are refreshed first
+    'max_age': 600,
+}
+
+MANIFEST_NAME = "current.json"
+LOCK_NAME = "refresh.lock"
+
+
+def shared_cache_config(overrides=None):
+    config = dict(DEFAULT_SHARED_CACHE_CONFIG)
+    config.update({key: value for key, value in (overrides or {}).items() if key in config})
+    return config
+
+
+class SharedDatasetCache:
+    """Published dataset versions in one directory, with a single-writer lock."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.manifest_path = os.path.join(path, MANIFEST_NAME)
+        self.lock_path = os.path.join(path, LOCK_NAME)
+
+    def stamp(self):
+        """Cheap identity of the current manifest, to notice a newer publication."""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def current(self):
+        """The current manifest, or None when nothing was published yet."""
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable shared dataset manifest {self.manifest_path}: {e}")
+            return None
+
+    @contextmanager
+    def writer_lock(self):
+        # Held while fetching and publishing; other processes block here and
+        # then find the version just published
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read_table(self, file_name):
+        # Zero-copy: the table's buffers point into the mapped file
+        with pa.memory_map(os.path.join(self.path, file_name), "r") as source:
+            return pa.ipc.open_file(source).read_all()
+
+    def _write_table(self, file_name, table):
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f, pa.ipc.new_file(f, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, os.path.join(self.path, file_name))
+
+    def _write_manifest(self, manifest):
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def publish(self, version, tables, **metadata):
+        """Write ``tables`` (name -> Arrow table) as ``version`` and make it current.
+
+        Call with the writer lock held. Files of older versions are removed;
+        processes that still map them keep reading them until they let go.
+        """
+        files = {}
+        for name, table in tables.items():
+            files[name] = f"{name}-{version}.arrow"
+            if not os.path.exists(os.path.join(self.path, files[name])):
+                self._write_table(files[name], table)
+        manifest = dict(metadata, version=version, published_at=time.time(), tables=files)
+        self._write_manifest(manifest)
+        for file_name in os.listdir(self.path):
+            if file_name.endswith(".arrow") and file_name not in files.values():
+                os.remove(os.path.join(self.path, file_name))
+        return manifest
+
+    def touch(self, manifest):
+        # Re-publish an unchanged version, so processes waiting on the lock adopt it
+        manifest = dict(manifest, published_at=time.time())
+        self._write_manifest(manifest)
+        return manifest
+
+    def nbytes(self):
+        return sum(os.path.getsize(os.path.join(self.path, name))
+                   for name in os.listdir(self.path) if name.endswith(".arrow"))
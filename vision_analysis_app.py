@@ -3,20 +3,35 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-import json
 import plotly.express as px
 import plotly.graph_objects as go
 from PIL import Image
-import requests
 from io import BytesIO
-from collections import Counter
 import os
-import base64
 from datetime import datetime
 from openai import OpenAI
 from supabase import create_client
 import logging
 import time
+from figure_cache import cached_figure
+from dataset_store import RESTAURANT_COLUMN, get_dataset_store
+from dimensions import render_dimension_select, render_restaurant_picker
+from drift_monitor import at_risk_frame, drift_config, get_drift_monitor
+from feedback_analytics import DIMENSIONS as FEEDBACK_DIMENSIONS, fetch_feedback_since, get_feedback_analytics
+from finding_index import get_finding_index, similar_findings_frame
+from exporter import render_export_controls
+from record_renderer import render_records
+from excel_importer import DEFAULT_BATCH_SIZE, import_workbook, workbook_fingerprint
+import tempfile
+from image_quality import quality_config, measure_quality, should_reject, describe_quality, merge_quality_issues
+from duplicate_index import duplicate_config, get_duplicate_index, image_dhash, make_entry
+import dashboard_data
+import restaurant_figures
+from analysis_pipeline import (build_analysis_row, encode_image_png, insert_analysis_rows, request_question_set,
+                               routing_config, upload_image)
+from shared_dataset import shared_cache_config
+from resilience import DependencyUnavailable, get_dependencies, guard_openai_client, is_throttled, limits_config
+from perf_metrics import timed, record_span, record_cache_lookup, render_metrics_panel, export_metrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -260,57 +275,97 @@ SUPABASE_KEY = st.secrets["supabase"]["key"]
 # Initialize Supabase client
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-# Function to load data for dashboard
-@st.cache_data
-def load_data():
+# Local image quality check settings, overridable in the [quality] secrets section
+QUALITY_SETTINGS = quality_config(st.secrets.get("quality", {}))
+
+# Near-duplicate photo index settings, overridable in the [duplicates] secrets section
+DUPLICATE_SETTINGS = duplicate_config(st.secrets.get("duplicates", {}))
+
+# Fast/full vision model routing, overridable in the [routing] secrets section
+ROUTING_SETTINGS = routing_config(st.secrets.get("routing", {}))
+
+# Rate limiters and circuit breakers shared by every session, overridable in
+# the [limits] secrets section
+DEPENDENCIES = get_dependencies(limits_config(st.secrets.get("limits", {})))
+
+# Per-restaurant compliance drift detection, overridable in the [drift] secrets section
+DRIFT_SETTINGS = drift_config(st.secrets.get("drift", {}))
+
+# Dataset shared by the app processes of this host, enabled in the [shared_cache] secrets section
+SHARED_CACHE_SETTINGS = shared_cache_config(st.secrets.get("shared_cache", {}))
+
+# Show a warning instead of the raw error when a dependency is down or
+# throttling us; returns False for other errors
+def show_dependency_error(action, error):
+    if isinstance(error, DependencyUnavailable):
+        st.warning(f"⏳ {action} is paused: {error}")
+    elif is_throttled(error):
+        st.warning(f"⏳ {action} was rate limited; please try again in a moment")
+    else:
+        return False
+    return True
+
+# Attempts per page of a dashboard load before the load fails
+PAGE_ATTEMPTS = 3
+
+# Run one page request through the shared Supabase limiter and breaker,
+# retrying it so one failed page doesn't discard the pages already fetched
+def execute_page(query):
+    for attempt in range(1, PAGE_ATTEMPTS + 1):
+        try:
+            return DEPENDENCIES['supabase'].call(query.execute)
+        except DependencyUnavailable:
+            raise
+        except Exception as e:
+            if attempt == PAGE_ATTEMPTS:
+                raise
+            logger.warning(f"Page request failed (attempt {attempt}): {e}")
+            time.sleep(attempt)
+
+# Fetch all dashboard records from Supabase with pagination
+def fetch_analysis_records():
+    with timed("supabase.select"):
+        return dashboard_data.fetch_all_records(supabase, 'analysis_results', execute=execute_page)
+
+# Function to load data for dashboard from the process-wide dataset store
+def load_data(refresh=False):
+    store = get_dataset_store(SHARED_CACHE_SETTINGS)
     try:
-        # Initialize an empty list to hold all records
-        all_records = []
-        limit = 1000  # Number of records to fetch per request
-        offset = 0  # Start from the first record
-
-        while True:
-            # Fetch records with pagination
-            response = supabase.table('analysis_results').select("*").range(offset, offset + limit - 1).execute()
-            
-            if response.data:
-                all_records.extend(response.data)  # Add fetched records to the list
-                offset += limit  # Move to the next set of records
-            else:
-                break  # Exit loop if no more records are found
+        if refresh:
+            snapshot = store.refresh(fetch_analysis_records)
+        else:
+            record_cache_lookup("dataset", hit=store.snapshot is not None)
+            snapshot = store.get(fetch_analysis_records)
 
-        # Convert to pandas DataFrame
-        df = pd.DataFrame(all_records)
-        return df
+    except Exception as e:
+        if not show_dependency_error("Loading data", e):
+            st.error(f"Error loading data from Supabase: {e}")
+        # Keep showing the last loaded data while Supabase is unavailable
+        return store.snapshot
 
+    # Fold new inspections into the drift state; a snapshot already seen is free
+    try:
+        with timed("drift.update"):
+            get_drift_monitor(DRIFT_SETTINGS).update(snapshot)
+    except Exception as e:
+        logger.error(f"Error updating compliance drift state: {e}")
+    # Index the findings text of new inspections for similar-finding lookups
+    try:
+        with timed("findings.update"):
+            get_finding_index().update(snapshot)
     except Exception as e:
-        st.error(f"Error loading data from Supabase: {e}")
-        return pd.DataFrame()
+        logger.error(f"Error updating the findings index: {e}")
+    return snapshot
 
 # Add this function to handle image upload to Supabase storage
 def upload_image_to_supabase(image_data, file_name):
     try:
-        # Create images bucket if it doesn't exist
-        try:
-            supabase.storage.create_bucket("images", {"public": True})
-        except Exception as e:
-            if "already exists" not in str(e):
-                raise e
-
-        # Upload the image to Supabase storage
-        file_path = f"cafeteria_images/{file_name}"
-        supabase.storage.from_("images").upload(
-            path=file_path,
-            file=image_data,
-            file_options={"content-type": "image/png"}
-        )
-
-        # Get the public URL
-        image_url = supabase.storage.from_("images").get_public_url(file_path)
-        return image_url
+        # Upload the image to Supabase storage and get the public URL
+        return DEPENDENCIES['storage'].call(upload_image, supabase, image_data, file_name)
 
     except Exception as e:
-        st.error(f"Error uploading image to storage: {str(e)}")
+        if not show_dependency_error("Image upload", e):
+            st.error(f"Error uploading image to storage: {str(e)}")
         return None
 
 # Update the feedback and upload functions with better logging
@@ -344,7 +399,8 @@ def upload_feedback_image_to_supabase(image_data, file_name):
             file_path = f"feedback/{file_name}"
             logger.info(f"Uploading image to path: {file_path} in feedback_images bucket")
             
-            upload_result = supabase.storage.from_("feedback_images").upload(
+            upload_result = DEPENDENCIES['storage'].call(
+                supabase.storage.from_("feedback_images").upload,
                 path=file_path,
                 file=image_data,
                 file_options={"content-type": "image/png"}
@@ -361,7 +417,8 @@ def upload_feedback_image_to_supabase(image_data, file_name):
             
             # Fallback to images bucket
             file_path = f"feedback/{file_name}"
-            upload_result = supabase.storage.from_("images").upload(
+            upload_result = DEPENDENCIES['storage'].call(
+                supabase.storage.from_("images").upload,
                 path=file_path,
                 file=image_data,
                 file_options={"content-type": "image/png"}
@@ -374,40 +431,41 @@ def upload_feedback_image_to_supabase(image_data, file_name):
 
     except Exception as e:
         logger.error(f"Error uploading feedback image: {str(e)}")
-        st.error(f"Error uploading feedback image to storage: {str(e)}")
+        if not show_dependency_error("Image upload", e):
+            st.error(f"Error uploading feedback image to storage: {str(e)}")
         return None
 
-# Update the display_image function to handle both base64 and URL images
-def display_image(url_data):
+# Import an uploaded workbook into analysis_results; re-importing the same
+# file resumes from the checkpoint of an earlier interrupted run
+def run_workbook_import(workbook_file):
+    checkpoint_dir = os.path.join(tempfile.gettempdir(), "hungerbox_imports")
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    fingerprint = workbook_fingerprint(workbook_file, None, DEFAULT_BATCH_SIZE)
+    checkpoint_path = os.path.join(checkpoint_dir, f"{fingerprint}.json")
+    rejects_path = os.path.join(checkpoint_dir, f"{fingerprint}.rejects.jsonl")
+
+    status = st.empty()
+
+    def report(checkpoint):
+        status.caption(f"{checkpoint.imported} rows imported, {checkpoint.rejected} rejected")
+
     try:
-        # Check if it's a base64 string
-        if isinstance(url_data, str) and url_data.startswith('data:image'):
-            # Handle base64 image
-            img_data = base64.b64decode(url_data.split(',')[1])
-            img = Image.open(BytesIO(img_data))
-            return img
-        
-        # Check if it's a JSON string containing URLs
-        elif isinstance(url_data, str) and url_data.startswith('['):
-            urls = json.loads(url_data)
-            if isinstance(urls, list) and urls:
-                url = urls[0]
-                response = requests.get(url)
-                img = Image.open(BytesIO(response.content))
-                return img
-        
-        # Direct URL
-        else:
-            response = requests.get(url_data)
-            img = Image.open(BytesIO(response.content))
-            return img
-            
+        logger.info(f"Importing workbook {workbook_file.name}")
+        with timed("supabase.import"):
+            checkpoint = import_workbook(supabase, workbook_file, checkpoint_path,
+                                         rejects_path=rejects_path, progress=report)
+        st.success(f"Imported {checkpoint.imported} rows ({checkpoint.rejected} rejected)")
+        if checkpoint.rejected:
+            with open(rejects_path) as f:
+                st.download_button("Download rejected rows", f.read(), file_name="import_rejects.jsonl",
+                                   key="import_rejects")
+        load_data(refresh=True)
     except Exception as e:
-        st.warning(f"Could not load image: {e}")
-        return None
+        logger.error(f"Workbook import failed: {str(e)}")
+        st.error(f"Import failed: {str(e)}. Run the import again to resume.")
 
 # Function to display results for Vision Analysis
-def display_vision_results(result, cafeteria_name, question, analysis_date):
+def display_vision_results(result, cafeteria_name, question, analysis_date, quality_report=None):
     # Severity color mapping
     severity_color = {
         "Critical": "severity-critical",
@@ -428,28 +486,18 @@ def display_vision_results(result, cafeteria_name, question, analysis_date):
             st.markdown(f"**Analysis Date:** {analysis_date}")
             
         with col2:
-            status = result.get('criteria_met', 'Unknown')
+            status = result.criteria_met
             status_icon = "✅" if status == "Yes" else "❌" if status == "No" else "❓"
             st.markdown(f"**Compliance Status:** {status_icon} {status}")
             
-            severity = result.get('severity', 'Unknown')
+            severity = result.severity
             color_class = severity_color.get(severity, "")
             st.markdown(f"**Severity Level:** <span class='{color_class}'>{severity}</span>", 
                       unsafe_allow_html=True)
         
         with col3:
-            tags = result.get('tags', [])
-            if isinstance(tags, list):
-                tags_html = ""
-                for tag in tags:
-                    tags_html += f'<span class="tag-pill">{tag}</span>'
-                st.markdown(f"**Tags:** {tags_html}", unsafe_allow_html=True)
-            else:
-                tags_list = [tag.strip() for tag in tags.split(',')]
-                tags_html = ""
-                for tag in tags_list:
-                    tags_html += f'<span class="tag-pill">{tag}</span>'
-                st.markdown(f"**Tags:** {tags_html}", unsafe_allow_html=True)
+            tags_html = "".join(f'<span class="tag-pill">{tag}</span>' for tag in result.tags)
+            st.markdown(f"**Tags:** {tags_html}", unsafe_allow_html=True)
         st.markdown('</div>', unsafe_allow_html=True)
 
     # Quality Assessment
@@ -457,34 +505,191 @@ def display_vision_results(result, cafeteria_name, question, analysis_date):
         col1, col2 = st.columns(2)
         
         with col1:
-            issues = result.get('image_quality_issues', ['none'])
-            if issues == ['none'] or (isinstance(issues, str) and issues.lower() == 'none'):
+            if not result.image_quality_issues:
                 st.success("✅ No quality issues detected")
             else:
-                if isinstance(issues, list):
-                    issues_text = ', '.join(issues)
-                else:
-                    issues_text = issues
-                st.error(f"⚠️ Detected issues: {issues_text}")
+                st.error(f"⚠️ Detected issues: {', '.join(result.image_quality_issues)}")
         
         with col2:
-            st.info(f"Quality Impact Assessment: {result.get('quality_assessment', '')}")
+            st.info(f"Quality Impact Assessment: {result.quality_assessment}")
+            if quality_report:
+                st.caption(describe_quality(quality_report))
 
     # Detailed Analysis
     with st.expander("🔍 Detailed Compliance Analysis", expanded=True):
         st.markdown(f"**Assessment Question:** {question}")
+        if result.model:
+            answered_by = f"Answered by {result.model} ({result.model_tier or 'full'} model)"
+            if result.escalation_reason:
+                answered_by += f" after escalation: {result.escalation_reason}"
+            st.caption(answered_by)
         st.markdown("### Explanation")
-        st.write(result.get('explanation', 'No explanation provided'))
+        st.write(result.explanation or 'No explanation provided')
         
-        improvements = result.get('improvements', '')
-        if improvements:
+        if result.improvements:
             st.markdown("### 🛠️ Improvement Suggestions")
-            st.write(improvements)
+            st.write(result.improvements)
         else:
             st.success("🌟 No improvements needed - all standards met")
 
+# Summary of a multi-question analysis; the selected question's report is
+# shown below it. Returns the selected question's position.
+def display_question_set(question_results):
+    st.dataframe(pd.DataFrame([{
+        'Question': entry['question'],
+        'Compliance': entry['result'].criteria_met,
+        'Severity': entry['result'].severity,
+        'Model': entry['result'].model or '',
+    } for entry in question_results]), use_container_width=True, hide_index=True)
+
+    selected = st.selectbox("Show report for", range(len(question_results)), key="selected_question",
+                            format_func=lambda i: f"Q{i + 1}: {question_results[i]['question']}")
+    st.session_state.result = question_results[selected]['result']
+    st.session_state.question = question_results[selected]['question']
+    return selected
+
+# Save the analysis as one analysis_results row per question, sharing one
+# stored image, and add the photo's hash to the near-duplicate index. Feedback
+# on the selected question is linked to its saved row.
+def display_save_results(question_results, selected=0):
+    saved_ids = st.session_state.get('saved_analysis_ids')
+    if saved_ids:
+        st.session_state.analysis_id = saved_ids[selected]
+        st.caption(f"💾 Saved to records as {', '.join(f'#{row_id}' for row_id in saved_ids)}")
+        return
+
+    label = f"💾 Save {len(question_results)} results to records" if len(question_results) > 1 \
+        else "💾 Save result to records"
+    if st.button(label, key="save_question_results"):
+        try:
+            buffered = BytesIO()
+            st.session_state.image.save(buffered, format="PNG")
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            file_name = f"{st.session_state.cafeteria_name.replace(' ', '_')}_{timestamp}.png"
+            with timed("storage.upload"):
+                image_url = upload_image_to_supabase(buffered.getvalue(), file_name)
+            if not image_url:
+                return
+            rows = [build_analysis_row(entry['result'], st.session_state.cafeteria_name, entry['question'], image_url)
+                    for entry in question_results]
+            with timed("supabase.insert"):
+                saved = DEPENDENCIES['supabase'].call(insert_analysis_rows, supabase, rows)
+            logger.info(f"Saved {len(saved)} analysis rows")
+            # Rows come back in insert order, i.e. in question order
+            st.session_state.saved_analysis_ids = [row.get('id') for row in saved]
+            st.session_state.analysis_id = st.session_state.saved_analysis_ids[selected]
+            # Index the photo with the saved rows' ids, so the backfill job skips them
+            image_hash = st.session_state.get('image_hash')
+            if image_hash is not None:
+                duplicate_index = get_duplicate_index(DUPLICATE_SETTINGS['index_path'])
+                for entry, row in zip(question_results, saved):
+                    duplicate_index.add(image_hash, make_entry(entry['result'], st.session_state.cafeteria_name,
+                                                               entry['question'], st.session_state.analysis_date,
+                                                               image_url, row.get('id')))
+            st.success(f"✅ Saved {len(saved)} results to the database")
+            load_data(refresh=True)
+        except Exception as e:
+            logger.error(f"Saving results failed: {str(e)}")
+            if not show_dependency_error("Saving results", e):
+                st.error(f"Saving results failed: {str(e)}")
+
+# Past inspections whose photos look like the current one
+def display_similar_inspections(image_hash, analysis_date):
+    if image_hash is None:
+        return
+    matches = get_duplicate_index(DUPLICATE_SETTINGS['index_path']).find(
+        image_hash, DUPLICATE_SETTINGS['similar_distance'], limit=6)
+    # The current analysis is in the index too once it is saved
+    matches = [m for m in matches if m['analysis_date'] != analysis_date][:5]
+    with st.expander(f"🕘 Similar past inspections ({len(matches)})"):
+        if not matches:
+            st.info("No earlier inspection photos look like this one.")
+        for match in matches:
+            previous = match['result']
+            image_col, details_col = st.columns([1, 3])
+            if match.get('image_url'):
+                # The browser loads stored images directly from storage
+                image_col.image(match['image_url'], use_container_width=True)
+            with details_col:
+                st.markdown(f"**{match['cafeteria name']}** · {match['analysis_date']} · "
+                            f"{match['distance']}/64 bits different")
+                st.markdown(f"**Question:** {match['question']}")
+                st.markdown(f"**Compliance:** {previous.criteria_met} · **Severity:** {previous.severity}")
+
+# Past findings whose explanation and suggestions read like the given text
+def display_similar_findings(text, key, exclude_id=None):
+    dataset = get_dataset_store(SHARED_CACHE_SETTINGS).snapshot
+    with st.expander("🧾 Similar past findings"):
+        if dataset is None or not (text or "").strip():
+            st.info("No findings text to compare.")
+            return
+        non_compliant_only = st.checkbox("Only non-compliant findings", value=True, key=f"{key}_non_compliant")
+        with timed("findings.search"):
+            matches = get_finding_index().search(text, limit=5, non_compliant_only=non_compliant_only,
+                                                 exclude_id=exclude_id)
+        if not matches:
+            st.info("No earlier finding reads like this one.")
+            return
+        st.dataframe(similar_findings_frame(dataset, matches), use_container_width=True, hide_index=True)
+        st.caption("Follow-up is the outcome of the next inspection of the same restaurant and question.")
+
+# Analyze an image with the vision model and store the results in session
+# state. Several questions share one request so the image is only sent once.
+def run_vision_analysis(api_key, image, cafeteria_name, questions, quality_report):
+    try:
+        with st.spinner("🔍 Analyzing image and preparing report..."):
+            # Convert image to base64
+            img_base64 = encode_image_png(image)
+
+            # Save image in session state to persist after form submission; a
+            # new analysis is not saved yet
+            st.session_state.image = image
+            st.session_state.pop('saved_analysis_ids', None)
+            st.session_state.pop('analysis_id', None)
+
+            # Create OpenAI client; every model call, escalations included, goes
+            # through the shared limiter and breaker
+            client = guard_openai_client(OpenAI(api_key=api_key), DEPENDENCIES['openai'])
+
+            # API Call with logging
+            logger.info("Making OpenAI API call")
+            request_start = time.perf_counter()
+            with timed("openai.request"):
+                results = request_question_set(client, img_base64, questions, ROUTING_SETTINGS,
+                                               quality_note=describe_quality(quality_report))
+            elapsed = time.perf_counter() - request_start
+            # Requests that reached the full model count as full, as for a single question
+            tier = "full" if any(result.model_tier == "full" for result in results) else results[0].model_tier
+            record_span(f"openai.request.{tier}", elapsed)
+            record_span("openai.request.per_question", elapsed / len(questions))
+            logger.info(f"OpenAI API call completed successfully ({', '.join(r.model for r in results)})")
+
+            # Locally detected issues populate image_quality_issues too
+            results = [merge_quality_issues(result, quality_report) for result in results]
+            analysis_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+            # Store results in session state
+            st.session_state.question_results = [
+                {'question': question, 'result': result} for question, result in zip(questions, results)
+            ]
+            st.session_state.result = results[0]
+            st.session_state.cafeteria_name = cafeteria_name
+            st.session_state.question = questions[0]
+            st.session_state.analysis_date = analysis_date
+            st.session_state.quality_report = quality_report
+            st.session_state.has_analysis = True
+
+            logger.info(f"Analysis complete: {results}")
+
+    except Exception as e:
+        logger.error(f"Analysis failed: {str(e)}")
+        if not show_dependency_error("Analysis", e):
+            st.error(f"Analysis failed: {str(e)}")
+        st.session_state.has_analysis = False
+
 # Main function to run the dashboard
 def main():
+    rerun_start = time.perf_counter()
     # Sidebar
     with st.sidebar:
         st.title("🍽️ HungerBox Analytics")
@@ -494,13 +699,25 @@ def main():
         Connected to Supabase Database
         </div>
         """, unsafe_allow_html=True)
+        refresh_data = st.button("🔄 Refresh data", key="refresh_data")
+
+        # Bulk import of inspection workbooks
+        with st.expander("📥 Import inspection workbook"):
+            workbook_file = st.file_uploader("Excel workbook", type=["xlsx"], key="import_workbook")
+            if workbook_file and st.button("Import records", key="run_import"):
+                run_workbook_import(workbook_file)
 
     # Load data from Supabase
-    df = load_data()
+    with timed("load_data"):
+        dataset = load_data(refresh=refresh_data)
     
-    if df.empty:
+    if dataset is None or dataset.frame.empty:
         st.error("Could not load data from the database. Please check your connection.")
         return
+
+    # Read-only view of the shared dataset and its version, used to key cached figures
+    df = dataset.view()
+    data_version = dataset.version
         
     # Main tabs
     tab1, tab2 = st.tabs(["📊 Restaurant Analysis", "🔍 Visual Analyzer"])
@@ -511,18 +728,19 @@ def main():
         st.markdown('<div class="sub-header">Comprehensive analysis of food safety compliance across all cafeterias</div>', unsafe_allow_html=True)
         
         # Show data info
-        st.caption(f"Loaded {len(df)} records from {len(df['cafeteria name'].unique())} restaurants")
+        st.caption(f"Loaded {len(df)} records from {len(dataset.dimensions[RESTAURANT_COLUMN])} restaurants")
         
         # Sub navigation for analysis dashboard
         dashboard_nav = st.radio(
             "Select Dashboard View:",
-            ["Overview", "Restaurant Analysis", "Individual Records"],
+            ["Overview", "Restaurant Analysis", "Comparison", "Individual Records", "Feedback"],
             horizontal=True,
             key="dashboard_nav",
             help="Choose the type of analysis view you want to see"
         )
         
         st.markdown("<br>", unsafe_allow_html=True)  # Add some spacing
+        section_start = time.perf_counter()
 
         # Dashboard Overview
         if dashboard_nav == "Overview":
@@ -537,46 +755,57 @@ def main():
             
             with col1:
                 # Overall compliance counts
-                compliance_counts = df['compliance_status'].value_counts()
-                fig = px.pie(
-                    names=compliance_counts.index,
-                    values=compliance_counts.values,
-                    title="Overall Compliance Status",
-                    color_discrete_sequence=px.colors.qualitative.Bold,
-                    hole=0.4
-                )
+                def build_compliance_pie():
+                    compliance_counts = dashboard_data.compliance_counts(df)
+                    return px.pie(
+                        names=compliance_counts.index,
+                        values=compliance_counts.values,
+                        title="Overall Compliance Status",
+                        color_discrete_sequence=px.colors.qualitative.Bold,
+                        hole=0.4
+                    )
+                fig = cached_figure("overview_compliance", data_version, build_compliance_pie)
                 st.plotly_chart(fig, use_container_width=True)
                 
             with col2:
                 # Severity levels
                 if 'severity_level' in df.columns:
-                    severity_counts = df['severity_level'].value_counts()
-                    fig = px.bar(
-                        x=severity_counts.index,
-                        y=severity_counts.values,
-                        title="Severity Levels Distribution",
-                        labels={'x': 'Severity', 'y': 'Count'},
-                        color=severity_counts.index,
-                        color_discrete_sequence=px.colors.qualitative.Bold
-                    )
+                    def build_severity_bar():
+                        severity_counts = dashboard_data.severity_counts(df)
+                        return px.bar(
+                            x=severity_counts.index,
+                            y=severity_counts.values,
+                            title="Severity Levels Distribution",
+                            labels={'x': 'Severity', 'y': 'Count'},
+                            color=severity_counts.index,
+                            color_discrete_sequence=px.colors.qualitative.Bold
+                        )
+                    fig = cached_figure("overview_severity", data_version, build_severity_bar)
                     st.plotly_chart(fig, use_container_width=True)
                 else:
                     st.info("Severity level data not available")
             
+            # Restaurants whose recent compliance has dropped below their own baseline
+            st.subheader("Restaurants at Risk")
+            at_risk = get_drift_monitor(DRIFT_SETTINGS).at_risk(DRIFT_SETTINGS['max_listed'])
+            if at_risk:
+                st.dataframe(at_risk_frame(at_risk), hide_index=True, use_container_width=True)
+                st.caption(f"Recent rates halve an inspection's weight every {DRIFT_SETTINGS['half_life']} "
+                           f"inspections of the restaurant; drift is how many standard errors they are worse "
+                           f"than its baseline.")
+            else:
+                st.success("No restaurant's compliance is significantly below its usual level")
+
             # Image quality issues
             if 'image_quality_issues' in df.columns:
                 st.subheader("Image Quality Issues")
                 
-                # Extract all quality issues
-                all_issues = []
-                for issues in df['image_quality_issues'].dropna():
-                    if isinstance(issues, str):
-                        all_issues.extend([issue.strip() for issue in issues.split(',')])
-                
-                issues_count = Counter(all_issues)
-                
-                if issues_count:
-                    fig = px.bar(
+                def build_quality_bar():
+                    # Count all quality issues
+                    issues_count = dashboard_data.count_multi_values(df['image_quality_issues'])
+                    if not issues_count:
+                        return None
+                    return px.bar(
                         x=list(issues_count.keys()),
                         y=list(issues_count.values()),
                         labels={'x': 'Issue Type', 'y': 'Count'},
@@ -584,6 +813,9 @@ def main():
                         color=list(issues_count.keys()),
                         color_discrete_sequence=px.colors.qualitative.Pastel
                     )
+                
+                fig = cached_figure("overview_quality_issues", data_version, build_quality_bar)
+                if fig is not None:
                     st.plotly_chart(fig, use_container_width=True)
                 else:
                     st.info("No image quality issues found in the data")
@@ -592,17 +824,12 @@ def main():
             if 'tags' in df.columns:
                 st.subheader("Most Common Tags")
                 
-                # Extract all tags
-                all_tags = []
-                for tag_str in df['tags'].dropna():
-                    if isinstance(tag_str, str):
-                        all_tags.extend([tag.strip() for tag in tag_str.split(',')])
-                
-                if all_tags:
-                    tags_count = Counter(all_tags).most_common(10)
-                    tags_df = pd.DataFrame(tags_count, columns=['Tag', 'Count'])
+                def build_tags_bar():
+                    tags_df = dashboard_data.top_tags(df, 10)
+                    if tags_df.empty:
+                        return None
                     
-                    fig = px.bar(
+                    return px.bar(
                         tags_df,
                         x='Count', 
                         y='Tag',
@@ -611,53 +838,60 @@ def main():
                         color='Count',
                         color_continuous_scale=px.colors.sequential.Viridis
                     )
+                
+                fig = cached_figure("overview_tags", data_version, build_tags_bar)
+                if fig is not None:
                     st.plotly_chart(fig, use_container_width=True)
                 else:
                     st.info("No tags found in the data")
             
             # Compliance over time if dates vary
-            if 'analysis_date' in df.columns and len(df['analysis_date'].unique()) > 1:
-                st.subheader("Compliance Trend Over Time")
+            if 'analysis_date' in df.columns:
+                def build_trend_line():
+                    time_data = dashboard_data.compliance_trend(df)
+                    if time_data is None:
+                        return None
+                    return px.line(
+                        time_data, 
+                        x='analysis_date', 
+                        y='count', 
+                        color='compliance_status',
+                        title="Compliance Status Over Time",
+                        labels={'analysis_date': 'Date', 'count': 'Number of Records'}
+                    )
                 
-                time_data = df.groupby(['analysis_date', 'compliance_status']).size().reset_index(name='count')
-                fig = px.line(
-                    time_data, 
-                    x='analysis_date', 
-                    y='count', 
-                    color='compliance_status',
-                    title="Compliance Status Over Time",
-                    labels={'analysis_date': 'Date', 'count': 'Number of Records'}
-                )
-                st.plotly_chart(fig, use_container_width=True)
+                fig = cached_figure("overview_trend", data_version, build_trend_line)
+                if fig is not None:
+                    st.subheader("Compliance Trend Over Time")
+                    st.plotly_chart(fig, use_container_width=True)
         
         # Restaurant Analysis View
         elif dashboard_nav == "Restaurant Analysis":
             st.header("Restaurant-Specific Analysis")
             
             # Select restaurant
-            restaurants = sorted(df['cafeteria name'].unique())
-            selected_restaurant = st.selectbox("Select a Restaurant", restaurants)
+            selected_restaurant = render_restaurant_picker(
+                dataset.dimensions[RESTAURANT_COLUMN], "Select a Restaurant", key="analysis_restaurant",
+                include_all=False)
             
-            # Filter data for selected restaurant
-            restaurant_df = df[df['cafeteria name'] == selected_restaurant]
+            # Data for selected restaurant, a slice of the shared dataset
+            restaurant_df = dataset.restaurant_slice(selected_restaurant)
             
             st.subheader(f"Analysis for {selected_restaurant}")
             
             # Restaurant stats
+            stats = dashboard_data.restaurant_stats(restaurant_df)
             col1, col2, col3 = st.columns(3)
             
             with col1:
-                st.metric("Total Records", len(restaurant_df))
+                st.metric("Total Records", stats['total'])
             
             with col2:
-                compliant_count = len(restaurant_df[restaurant_df['compliance_status'] == 'Yes'])
-                compliance_percentage = (compliant_count / len(restaurant_df)) * 100 if len(restaurant_df) > 0 else 0
-                st.metric("Compliance Rate", f"{compliance_percentage:.1f}%")
+                st.metric("Compliance Rate", f"{stats['compliance_percentage']:.1f}%")
             
             with col3:
-                if 'severity_level' in df.columns:
-                    critical_count = len(restaurant_df[restaurant_df['severity_level'] == 'Critical'])
-                    st.metric("Critical Issues", critical_count)
+                if stats['critical_count'] is not None:
+                    st.metric("Critical Issues", stats['critical_count'])
                 else:
                     st.metric("Critical Issues", "N/A")
             
@@ -665,27 +899,16 @@ def main():
             col1, col2 = st.columns(2)
             
             with col1:
-                compliance_counts = restaurant_df['compliance_status'].value_counts()
-                fig = px.pie(
-                    names=compliance_counts.index,
-                    values=compliance_counts.values,
-                    title="Compliance Status",
-                    color_discrete_sequence=px.colors.qualitative.Bold,
-                    hole=0.4
-                )
+                fig = cached_figure("restaurant_compliance", data_version,
+                                    lambda: restaurant_figures.compliance_pie(restaurant_df),
+                                    restaurant=selected_restaurant)
                 st.plotly_chart(fig, use_container_width=True)
             
             with col2:
                 if 'severity_level' in df.columns:
-                    severity_counts = restaurant_df['severity_level'].value_counts()
-                    fig = px.bar(
-                        x=severity_counts.index,
-                        y=severity_counts.values,
-                        title="Severity Levels",
-                        labels={'x': 'Severity', 'y': 'Count'},
-                        color=severity_counts.index,
-                        color_discrete_sequence=px.colors.qualitative.Bold
-                    )
+                    fig = cached_figure("restaurant_severity", data_version,
+                                        lambda: restaurant_figures.severity_bar(restaurant_df),
+                                        restaurant=selected_restaurant)
                     st.plotly_chart(fig, use_container_width=True)
                 else:
                     st.info("Severity level data not available")
@@ -694,41 +917,22 @@ def main():
             if 'image_quality_issues' in df.columns:
                 st.subheader("Image Quality Issues")
                 
-                if restaurant_df['image_quality_issues'].dropna().empty:
-                    st.info("No image quality data for this restaurant")
-                else:
-                    quality_counts = restaurant_df['image_quality_issues'].str.split(',').explode().str.strip().value_counts()
-                    
-                    fig = px.bar(
-                        x=quality_counts.index,
-                        y=quality_counts.values,
-                        title="Image Quality Issues",
-                        labels={'x': 'Issue Type', 'y': 'Count'},
-                        color=quality_counts.index
-                    )
+                fig = cached_figure("restaurant_quality_issues", data_version,
+                                    lambda: restaurant_figures.quality_issues_bar(restaurant_df),
+                                    restaurant=selected_restaurant)
+                if fig is not None:
                     st.plotly_chart(fig, use_container_width=True)
+                else:
+                    st.info("No image quality data for this restaurant")
             
             # Top tags for this restaurant
             if 'tags' in df.columns:
                 st.subheader("Top Tags")
                 
-                # Extract all tags for this restaurant
-                rest_tags = []
-                for tag_str in restaurant_df['tags'].dropna():
-                    if isinstance(tag_str, str):
-                        rest_tags.extend([tag.strip() for tag in tag_str.split(',')])
-                
-                if rest_tags:
-                    tags_count = Counter(rest_tags).most_common(10)
-                    tags_df = pd.DataFrame(tags_count, columns=['Tag', 'Count'])
-                    
-                    fig = px.bar(
-                        tags_df,
-                        x='Tag', 
-                        y='Count',
-                        title="Top 10 Tags",
-                        color='Tag'
-                    )
+                fig = cached_figure("restaurant_tags", data_version,
+                                    lambda: restaurant_figures.tags_bar(restaurant_df),
+                                    restaurant=selected_restaurant)
+                if fig is not None:
                     st.plotly_chart(fig, use_container_width=True)
                 else:
                     st.info("No tags data available for this restaurant")
@@ -736,18 +940,65 @@ def main():
             # Table of non-compliant items
             st.subheader("Non-Compliant Items")
             
-            non_compliant = restaurant_df[restaurant_df['compliance_status'] == 'No']
+            non_compliant = dashboard_data.non_compliant_items(restaurant_df)
             if not non_compliant.empty:
-                display_columns = ['question', 'explanation']
-                if 'severity_level' in df.columns:
-                    display_columns.insert(1, 'severity_level')
-                if 'improvement_suggestions' in df.columns:
-                    display_columns.append('improvement_suggestions')
-                    
-                st.dataframe(non_compliant[display_columns], use_container_width=True)
+                st.dataframe(non_compliant, use_container_width=True)
             else:
                 st.success("No non-compliant items found for this restaurant!")
+
+            # Export this restaurant's records
+            st.subheader("Export Records")
+            render_export_controls(restaurant_df, "restaurant_analysis", (selected_restaurant,), data_version)
         
+        # Every restaurant side by side
+        elif dashboard_nav == "Comparison":
+            st.header("Restaurant Comparison")
+
+            comparison = dataset.comparison
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                ranking = st.selectbox("Rank by", list(dashboard_data.COMPARISON_RANKINGS), key="comparison_ranking")
+            with col2:
+                min_inspections = st.number_input("Minimum inspections", min_value=1, value=5, step=1,
+                                                  key="comparison_min_inspections")
+            with col3:
+                heatmap_rows = st.number_input("Restaurants in heatmap", min_value=5, max_value=100, value=25,
+                                               step=5, key="comparison_heatmap_rows")
+
+            ranked = dashboard_data.rank_restaurants(comparison, ranking, min_inspections)
+            st.caption(f"{len(ranked)} of {len(comparison)} restaurants have at least {min_inspections} "
+                       f"inspections. Click a column header to sort.")
+            rate_column = st.column_config.ProgressColumn(format="%.0f%%", min_value=0, max_value=100)
+            st.dataframe(ranked, hide_index=True, use_container_width=True, column_config={
+                'Compliance rate': rate_column,
+                'Critical rate': rate_column,
+                'Quality issue rate': rate_column,
+            })
+
+            def build_comparison_heatmap():
+                matrix = dashboard_data.heatmap_matrix(ranked.head(heatmap_rows))
+                if matrix.empty:
+                    return None
+                fig = px.imshow(
+                    matrix,
+                    text_auto=".0f",
+                    aspect="auto",
+                    color_continuous_scale="Reds",
+                    zmin=0,
+                    zmax=100,
+                    title=f"Share of inspections with each problem (%), top {len(matrix)} by {ranking.lower()}",
+                    labels={'x': 'Problem', 'y': 'Restaurant', 'color': '%'},
+                )
+                fig.update_layout(height=max(400, 28 * len(matrix) + 150))
+                return fig
+
+            fig = cached_figure("comparison_heatmap", data_version, build_comparison_heatmap,
+                                ranking=ranking, min_inspections=min_inspections, rows=heatmap_rows)
+            if fig is not None:
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("No restaurant has enough inspections to compare")
+
         # Individual Records View
         elif dashboard_nav == "Individual Records":
             st.header("Individual Inspection Records")
@@ -758,19 +1009,19 @@ def main():
             
             with col1:
                 # Restaurant filter
-                restaurants = sorted(df['cafeteria name'].unique())
-                selected_restaurant = st.selectbox("Restaurant", ["All"] + list(restaurants))
+                selected_restaurant = render_restaurant_picker(
+                    dataset.dimensions[RESTAURANT_COLUMN], "Restaurant", key="records_restaurant")
             
             with col2:
                 # Compliance status filter
-                compliance_options = ["All"] + sorted([status for status in df['compliance_status'].dropna().unique().tolist()])
-                selected_compliance = st.selectbox("Compliance Status", compliance_options)
+                selected_compliance = render_dimension_select(
+                    dataset.dimensions['compliance_status'], "Compliance Status", key="records_compliance")
             
             with col3:
                 # Severity filter if available
-                if 'severity_level' in df.columns:
-                    severity_options = ["All"] + sorted([severity for severity in df['severity_level'].dropna().unique().tolist()])
-                    selected_severity = st.selectbox("Severity Level", severity_options)
+                if 'severity_level' in dataset.dimensions:
+                    selected_severity = render_dimension_select(
+                        dataset.dimensions['severity_level'], "Severity Level", key="records_severity")
                 else:
                     selected_severity = "All"
             
@@ -783,82 +1034,108 @@ def main():
                     selected_quality = "All"
             
             # Apply filters
-            filtered_df = df.copy()
-            
-            if selected_restaurant != "All":
-                filtered_df = filtered_df[filtered_df['cafeteria name'] == selected_restaurant]
-            
-            if selected_compliance != "All":
-                filtered_df = filtered_df[filtered_df['compliance_status'] == selected_compliance]
-            
-            if selected_severity != "All" and 'severity_level' in df.columns:
-                filtered_df = filtered_df[filtered_df['severity_level'] == selected_severity]
-            
-            if selected_quality == "Has Issues" and 'image_quality_issues' in df.columns:
-                filtered_df = filtered_df[filtered_df['image_quality_issues'].str.contains('too_dark|too_blurry', na=False)]
-            elif selected_quality == "No Issues" and 'image_quality_issues' in df.columns:
-                filtered_df = filtered_df[~filtered_df['image_quality_issues'].str.contains('too_dark|too_blurry', na=False)]
+            filtered_df = dashboard_data.filter_records(
+                dataset.restaurant_slice(selected_restaurant) if selected_restaurant != "All" else df,
+                compliance=selected_compliance,
+                severity=selected_severity,
+                quality=selected_quality
+            )
             
             st.markdown(f"**Showing {len(filtered_df)} records**")
+
+            # Export the current filter selection
+            render_export_controls(
+                filtered_df,
+                "individual_records",
+                (selected_restaurant, selected_compliance, selected_severity, selected_quality),
+                data_version
+            )
             
-            # Display individual records
-            for idx, row in filtered_df.iterrows():
-                question_preview = row['question']
-                if len(question_preview) > 60:
-                    question_preview = question_preview[:60] + "..."
-                
-                with st.expander(f"{row['cafeteria name']} - {question_preview}"):
-                    cols = st.columns([1, 2])
-                    
-                    with cols[0]:
-                        st.subheader("Image")
-                        if 'upload_links (images)' in row and row['upload_links (images)']:
-                            img = display_image(row['upload_links (images)'])
-                            if img:
-                                st.image(img, use_container_width=True)
-                            else:
-                                st.info("No image available or could not be loaded")
-                        else:
-                            st.info("No image available")
-                    
-                    with cols[1]:
-                        st.subheader("Analysis Results")
-                        
-                        status_color = "green" if row['compliance_status'] == 'Yes' else "red" if row['compliance_status'] == 'No' else "orange"
-                        st.markdown(f"**Compliance Status:** <span style='color:{status_color};'>{row['compliance_status']}</span>", unsafe_allow_html=True)
-                        
-                        if 'severity_level' in row and pd.notna(row['severity_level']):
-                            severity_color = "red" if row['severity_level'] == 'Critical' else "orange" if row['severity_level'] == 'Major' else "yellow" if row['severity_level'] == 'Minor' else "green"
-                            st.markdown(f"**Severity Level:** <span style='color:{severity_color};'>{row['severity_level']}</span>", unsafe_allow_html=True)
-                        
-                        st.markdown(f"**Question:** {row['question']}")
-                        
-                        if 'explanation' in row and pd.notna(row['explanation']):
-                            st.markdown(f"**Explanation:** {row['explanation']}")
-                        
-                        if 'improvement_suggestions' in row and pd.notna(row['improvement_suggestions']):
-                            st.markdown(f"**Improvement Suggestions:** {row['improvement_suggestions']}")
-                        
-                        if 'image_quality_issues' in row and pd.notna(row['image_quality_issues']) and row['image_quality_issues'] != 'none':
-                            st.markdown(f"**Image Quality Issues:** {row['image_quality_issues']}")
-                        
-                        if 'quality_assessment' in row and pd.notna(row['quality_assessment']):
-                            st.markdown(f"**Quality Assessment:** {row['quality_assessment']}")
-                        
-                        if 'tags' in row and pd.notna(row['tags']):
-                            tags = [tag.strip() for tag in row['tags'].split(',')]
-                            st.markdown("**Tags:**")
-                            # Display tags as pills
-                            tags_html = ""
-                            for tag in tags:
-                                tags_html += f'<span class="tag-pill">{tag}</span>'
-                            st.markdown(tags_html, unsafe_allow_html=True)
-                        
-                        if 'analysis_date' in row and pd.notna(row['analysis_date']):
-                            st.markdown(f"**Analysis Date:** {row['analysis_date']}")
+            # Display individual records, one page per HTML block
+            page_df = render_records(
+                filtered_df,
+                (data_version, selected_restaurant, selected_compliance, selected_severity, selected_quality)
+            )
+
+            # Similar past findings of one record on the current page
+            if not page_df.empty and 'id' in page_df.columns:
+                page_records = page_df.set_index('id')
+                record_id = st.selectbox(
+                    "Find findings similar to", page_records.index.tolist(), key="records_similar_to",
+                    format_func=lambda record_id: f"#{record_id} · {page_records.at[record_id, 'cafeteria name']}"
+                                                  f" · {page_records.at[record_id, 'question']}")
+                record = page_records.loc[record_id]
+                display_similar_findings(
+                    " ".join(str(record[column]) for column in ('explanation', 'improvement_suggestions')
+                             if column in record and pd.notna(record[column])),
+                    key="records_similar", exclude_id=record_id)
+
+        # Dissatisfaction with the analyses, from the feedback table
+        elif dashboard_nav == "Feedback":
+            st.header("Feedback Analytics")
+
+            analytics = get_feedback_analytics()
+            try:
+                with timed("feedback.refresh"):
+                    analytics.refresh(
+                        lambda last_id: DEPENDENCIES['supabase'].call(fetch_feedback_since, supabase, last_id),
+                        dataset, force=refresh_data)
+            except Exception as e:
+                logger.error(f"Error loading feedback: {e}")
+                if not show_dependency_error("Loading feedback", e):
+                    st.error(f"Error loading feedback: {e}")
+
+            if not analytics.total:
+                st.info("No feedback has been submitted yet")
+            else:
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("Feedback", analytics.total)
+                with col2:
+                    st.metric("Dissatisfaction Rate", f"{analytics.dissatisfied / analytics.total:.1%}")
+                with col3:
+                    st.metric("Linked to Saved Analyses", f"{analytics.linked / analytics.total:.0%}")
+
+                col1, col2 = st.columns(2)
+                with col1:
+                    dimension = st.selectbox("Break down by", list(FEEDBACK_DIMENSIONS), key="feedback_dimension")
+                with col2:
+                    min_feedback = st.number_input("Minimum feedback", min_value=1, value=1, step=1,
+                                                   key="feedback_min_feedback")
+                breakdown = analytics.breakdown(dimension, min_feedback)
+                if breakdown.empty:
+                    st.info(f"No {dimension.lower()} has at least {min_feedback} feedback")
+                else:
+                    st.dataframe(breakdown, hide_index=True, use_container_width=True, column_config={
+                        'Dissatisfaction rate': st.column_config.ProgressColumn(
+                            format="%.0f%%", min_value=0, max_value=100),
+                    })
+
+                    def build_feedback_bar():
+                        top = breakdown.head(15)
+                        return px.bar(
+                            top,
+                            x='Dissatisfaction rate',
+                            y=dimension,
+                            orientation='h',
+                            title=f"Dissatisfaction by {dimension.lower()} (%)",
+                            hover_data=['Feedback', 'Dissatisfied'],
+                            color='Dissatisfaction rate',
+                            color_continuous_scale="Reds",
+                            range_color=[0, 100]
+                        ).update_yaxes(autorange="reversed")
+
+                    fig = cached_figure("feedback_breakdown", f"feedback-{analytics.revision}",
+                                        build_feedback_bar, dimension=dimension, min_feedback=min_feedback)
+                    st.plotly_chart(fig, use_container_width=True)
+                if dimension == "Tag":
+                    st.caption("Tags are known only for feedback linked to a saved analysis.")
+
+        record_span(f"dashboard.{dashboard_nav.lower().replace(' ', '_')}", time.perf_counter() - section_start)
     
     # Tab 2: Visual Analyzer
     with tab2:
+        analyzer_start = time.perf_counter()
         st.markdown('<div class="main-header">Food Safety Visual Analyzer</div>', unsafe_allow_html=True)
         st.markdown('<div class="sub-header">AI-powered compliance assessment for cafeteria operations</div>', unsafe_allow_html=True)
         
@@ -883,6 +1160,8 @@ def main():
                 question = st.text_area("Assessment Question", 
                                       placeholder="Enter your food safety question...",
                                       height=120)
+                multi_question = st.checkbox("Several questions (one per line)",
+                                             help="All questions are answered in one request, so the image is only sent once")
                 
             with col2:
                 uploaded_image = st.file_uploader("Upload Cafeteria Image", 
@@ -896,95 +1175,97 @@ def main():
             st.markdown("---")
             submitted = st.form_submit_button("Analyze Compliance", use_container_width=True)
 
+        if multi_question:
+            questions = [line.strip() for line in question.splitlines() if line.strip()]
+        else:
+            questions = [question.strip()] if question.strip() else []
+
         # Analysis Logic - Store results in session state to persist between interactions
         if submitted:
-            if not all([api_key, cafeteria_name, question, uploaded_image]):
+            st.session_state.pop('duplicate_match', None)
+            # Whitespace-only input leaves no questions to ask
+            if not all([api_key, cafeteria_name, questions, uploaded_image]):
                 st.error("⚠️ Please fill all required fields and upload an image")
             else:
-                try:
-                    with st.spinner("🔍 Analyzing image and preparing report..."):
-                        # Convert image to base64
-                        buffered = BytesIO()
-                        image.save(buffered, format="PNG")
-                        img_base64 = base64.b64encode(buffered.getvalue()).decode()
-                        
-                        # Save image in session state to persist after form submission
-                        if 'image' not in st.session_state:
-                            st.session_state.image = image
-                        
-                        # Create OpenAI client
-                        client = OpenAI(api_key=api_key)
-                        
-                        # Construct analysis prompt
-                        prompt = f"""
-                        You are a food safety manager analyzing a cafeteria image for compliance with food safety standards.
-                        Question to evaluate: {question}
-
-                        INSTRUCTIONS:
-                        1. Assess image quality (e.g., too dark, too blurry) and note its impact on your evaluation.
-                        2. If the question explicitly requires a blank, empty, or clean area (e.g., "Take a blank photo if not applicable" or "Is the area clear?") and the image shows this, mark as "Yes" (compliant).
-                        3. Dark or blurry images are compliant ONLY if:
-                           - The question requires documentation of an empty, vacant, or clear area, AND
-                           - Quality issues do not prevent confirming compliance.
-                        4. Otherwise, dark or blurry images without context are non-compliant ("No").
-
-                        OUTPUT:
-                        Return a JSON object with:
-                        - "criteria_met": "Yes" (compliant), "No" (non-compliant), or "Unable to determine" (quality prevents assessment)
-                        - "explanation": 2-3 sentences explaining your assessment
-                        - "improvements": Actionable recommendations if issues are found (empty string if none)
-                        - "severity": "Critical" (immediate health risk), "Major" (significant violation), "Minor" (small issue), or "None" (compliant)
-                        - "image_quality_issues": List of issues (e.g., ["too_dark", "too_blurry"], ["none"] if no issues)
-                        - "quality_assessment": Brief comment on how image quality affected your evaluation
-                        - "tags": List of 3-5 descriptive tags (e.g., kitchen, storage, cleanliness, etc.)
-                        """
-
-                        # API Call with logging
-                        logger.info("Making OpenAI API call")
-                        response = client.chat.completions.create(
-                            model="gpt-4o",
-                            messages=[{
-                                "role": "user",
-                                "content": [
-                                    {"type": "text", "text": prompt},
-                                    {"type": "image_url", 
-                                     "image_url": {"url": f"data:image/png;base64,{img_base64}"}
-                                    }
-                                ]
-                            }],
-                            response_format={"type": "json_object"}
-                        )
-                        logger.info("OpenAI API call completed successfully")
-
-                        # Process response
-                        result = json.loads(response.choices[0].message.content)
-                        analysis_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        
-                        # Store results in session state
-                        st.session_state.result = result
-                        st.session_state.cafeteria_name = cafeteria_name
-                        st.session_state.question = question
-                        st.session_state.analysis_date = analysis_date
-                        st.session_state.has_analysis = True
-                        
-                        logger.info(f"Analysis complete: {result}")
+                # Local image quality check before spending a model call
+                with timed("image_quality"):
+                    quality_report = measure_quality(image, QUALITY_SETTINGS)
 
-                except Exception as e:
-                    logger.error(f"Analysis failed: {str(e)}")
-                    st.error(f"Analysis failed: {str(e)}")
+                if should_reject(quality_report, QUALITY_SETTINGS):
+                    logger.info(f"Image rejected by local quality check: {quality_report}")
+                    st.error(f"⚠️ Photo rejected before analysis ({', '.join(quality_report['issues'])}). "
+                             "Please retake it with better lighting and a steady camera.")
+                    st.caption(describe_quality(quality_report))
                     st.session_state.has_analysis = False
+                else:
+                    with timed("image_hash"):
+                        image_hash = image_dhash(image)
+                    st.session_state.image_hash = image_hash
+                    st.session_state.quality_report = quality_report
+
+                    # Offer the analysis of a near-identical earlier photo before calling the model
+                    duplicates = get_duplicate_index(DUPLICATE_SETTINGS['index_path']).find(
+                        image_hash, DUPLICATE_SETTINGS['max_distance'], question=question, limit=1
+                    ) if len(questions) == 1 else []
+                    if duplicates:
+                        logger.info(f"Near-duplicate photo found at distance {duplicates[0]['distance']}")
+                        st.session_state.duplicate_match = duplicates[0]
+                        st.session_state.has_analysis = False
+                    else:
+                        run_vision_analysis(api_key, image, cafeteria_name, questions, quality_report)
+
+        duplicate_match = st.session_state.get('duplicate_match')
+        if duplicate_match:
+            duplicate_notice = st.empty()
+            with duplicate_notice.container():
+                previous = duplicate_match['result']
+                st.info(f"🔁 A near-identical photo was already analyzed for this question "
+                        f"({duplicate_match['cafeteria name']}, {duplicate_match['analysis_date']}; "
+                        f"{duplicate_match['distance']}/64 hash bits differ). "
+                        f"Previous result: {previous.criteria_met}, severity {previous.severity}.")
+                reuse_col, analyze_col = st.columns(2)
+                reuse = reuse_col.button("Use previous result", key="reuse_duplicate", use_container_width=True)
+                analyze = analyze_col.button("Analyze anyway", key="analyze_duplicate", use_container_width=True)
+            if reuse or analyze:
+                duplicate_notice.empty()
+                del st.session_state.duplicate_match
+            if reuse:
+                st.session_state.result = previous
+                st.session_state.question_results = [{'question': question, 'result': previous}]
+                st.session_state.cafeteria_name = cafeteria_name
+                st.session_state.question = question
+                st.session_state.analysis_date = duplicate_match['analysis_date']
+                st.session_state.has_analysis = True
+                st.session_state.pop('saved_analysis_ids', None)
+                st.session_state.pop('analysis_id', None)
+                if uploaded_image:
+                    st.session_state.image = image
+            elif analyze:
+                if uploaded_image:
+                    run_vision_analysis(api_key, image, cafeteria_name, [question], st.session_state.quality_report)
+                else:
+                    st.error("⚠️ Please upload the image again")
 
         # Check if we have analysis results in session state and display them
         # This section is outside the form to prevent refreshing
         if 'has_analysis' in st.session_state and st.session_state.has_analysis:
             # Display Results
             st.success("✅ Analysis Complete!")
+            question_results = st.session_state.get('question_results') or []
+            selected = display_question_set(question_results) if len(question_results) > 1 else 0
+            if question_results:
+                display_save_results(question_results, selected)
             display_vision_results(
                 st.session_state.result, 
                 st.session_state.cafeteria_name, 
                 st.session_state.question, 
-                st.session_state.analysis_date
+                st.session_state.analysis_date,
+                st.session_state.get('quality_report')
             )
+            display_similar_inspections(st.session_state.get('image_hash'), st.session_state.analysis_date)
+            display_similar_findings(
+                " ".join(filter(None, [st.session_state.result.explanation, st.session_state.result.improvements])),
+                key="analyzer_similar")
             
             # Add feedback section - outside the form to prevent refresh
             st.markdown("---")
@@ -1053,24 +1334,23 @@ CREATE TABLE IF NOT EXISTS public.feedback (
                     
                     # Upload image to Supabase feedback bucket with logging
                     logger.info(f"Uploading feedback image: {feedback_file_name}")
-                    feedback_image_url = upload_feedback_image_to_supabase(image_data, feedback_file_name)
+                    with timed("storage.upload"):
+                        feedback_image_url = upload_feedback_image_to_supabase(image_data, feedback_file_name)
                     
                     if feedback_image_url:
                         logger.info(f"Feedback image uploaded successfully: {feedback_image_url}")
                         
-                        # Prepare feedback data with analysis results
+                        # Prepare feedback data with analysis results; the feedback
+                        # table has the result columns of analysis_results except tags
+                        result_columns = st.session_state.result.to_columns()
+                        del result_columns['tags']
                         feedback_data = {
                             'satisfied': True if satisfied == "Yes" else False,
                             'feedback_text': feedback_text,
                             'image_url': feedback_image_url,
                             'cafeteria_name': st.session_state.cafeteria_name,
                             'question': st.session_state.question,
-                            'compliance_status': st.session_state.result.get('criteria_met', 'Unknown'),
-                            'explanation': st.session_state.result.get('explanation', ''),
-                            'improvement_suggestions': st.session_state.result.get('improvements', ''),
-                            'severity_level': st.session_state.result.get('severity', 'Unknown'),
-                            'image_quality_issues': ', '.join(st.session_state.result.get('image_quality_issues', ['none'])) if isinstance(st.session_state.result.get('image_quality_issues'), list) else st.session_state.result.get('image_quality_issues', 'none'),
-                            'quality_assessment': st.session_state.result.get('quality_assessment', ''),
+                            **result_columns,
                             'analysis_date': datetime.now().date().isoformat()
                         }
                         
@@ -1080,11 +1360,15 @@ CREATE TABLE IF NOT EXISTS public.feedback (
                         
                         # Insert feedback into Supabase with logging
                         logger.info(f"Inserting feedback data into Supabase: {feedback_data}")
-                        feedback_response = supabase.table('feedback').insert(feedback_data).execute()
+                        with timed("supabase.insert"):
+                            feedback_response = DEPENDENCIES['supabase'].call(
+                                supabase.table('feedback').insert(feedback_data).execute)
                         
                         if hasattr(feedback_response, 'data') and feedback_response.data:
                             logger.info(f"Feedback submitted successfully: {feedback_response.data}")
                             st.success("✅ Thank you for your feedback!")
+                            # The Feedback view fetches it on its next rerun
+                            get_feedback_analytics().invalidate()
                         else:
                             error_msg = "Failed to submit feedback - no data returned"
                             if hasattr(feedback_response, 'error'):
@@ -1097,116 +1381,23 @@ CREATE TABLE IF NOT EXISTS public.feedback (
                         
                 except Exception as e:
                     logger.error(f"Error submitting feedback: {str(e)}")
+                    if show_dependency_error("Feedback", e):
+                        return
                     st.error(f"Error submitting feedback: {str(e)}")
                     import traceback
                     trace = traceback.format_exc()
                     logger.error(f"Full error trace:\n{trace}")
                     st.error(f"Full error trace:\n{trace}")
             
-            # Option to save results - outside the form to prevent refresh
-            st.markdown("---")
-            save_col1, save_col2 = st.columns([3, 1])
-            
-            # with save_col1:
-            #     st.info("Would you like to add this analysis to your records?")
-            
-            # with save_col2:
-            #     if st.button("Save Analysis", key="save_analysis"):
-            #         try:
-            #             logger.info("Attempting to save analysis to database")
-            #             # First, handle the image upload
-            #             buffered = BytesIO()
-            #             st.session_state.image.save(buffered, format="PNG")
-            #             image_data = buffered.getvalue()
-                        
-            #             # Generate a unique filename
-            #             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            #             file_name = f"{st.session_state.cafeteria_name.replace(' ', '_')}_{timestamp}.png"
-                        
-            #             # Upload image to Supabase storage with logging
-            #             logger.info(f"Uploading analysis image: {file_name}")
-            #             image_url = upload_image_to_supabase(image_data, file_name)
-                        
-            #             if image_url:
-            #                 logger.info(f"Analysis image uploaded successfully: {image_url}")
-                            
-            #                 # Create a new row for the analysis
-            #                 new_data = {
-            #                     'question': st.session_state.question,
-            #                     'upload_links (images)': json.dumps([image_url]),  # Store the public URL
-            #                     'answer_type': 'boolean',
-            #                     'cafeteria name': st.session_state.cafeteria_name,  # Space in column name preserved
-            #                     'compliance_status': st.session_state.result.get('criteria_met', 'Unknown'),
-            #                     'explanation': st.session_state.result.get('explanation', ''),
-            #                     'improvement_suggestions': st.session_state.result.get('improvements', ''),
-            #                     'severity_level': st.session_state.result.get('severity', 'Unknown'),
-            #                     'image_quality_issues': ', '.join(st.session_state.result.get('image_quality_issues', ['none'])) if isinstance(st.session_state.result.get('image_quality_issues'), list) else st.session_state.result.get('image_quality_issues', 'none'),
-            #                     'quality_assessment': st.session_state.result.get('quality_assessment', ''),
-            #                     'tags': ', '.join(st.session_state.result.get('tags', [])) if isinstance(st.session_state.result.get('tags'), list) else st.session_state.result.get('tags', ''),
-            #                     'analysis_date': datetime.now().date().isoformat()
-            #                 }
-
-            #                 # Log the data being saved
-            #                 logger.info(f"Saving analysis data to Supabase: {new_data}")
-            #                 st.write("Attempting to save the following data:")
-            #                 st.json(new_data)
-
-            #                 try:
-            #                     # Insert data into Supabase with error handling
-            #                     logger.info("Executing Supabase insert operation")
-            #                     response = supabase.table('analysis_results').insert(new_data).execute()
-                                
-            #                     if hasattr(response, 'data') and response.data:
-            #                         logger.info(f"Analysis saved successfully: {response.data}")
-            #                         st.success("✅ Analysis saved to database successfully!")
-                                    
-            #                         # Show saved record ID and image URL
-            #                         record_id = response.data[0].get('id')
-            #                         # Store analysis_id in session state for feedback reference
-            #                         st.session_state.analysis_id = record_id
-                                    
-            #                         st.info(f"""
-            #                         Record saved with ID: {record_id}
-            #                         Image URL: {image_url}
-            #                         """)
-
-            #                         # Option to export to Excel
-            #                         if st.button("Export to Excel", key="export_excel"):
-            #                             # Fetch updated data
-            #                             df = load_data()
-            #                             if not df.empty:
-            #                                 # Save to Excel
-            #                                 temp_file = f"analysis_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            #                                 df.to_excel(temp_file, index=False)
-                                            
-            #                                 with open(temp_file, 'rb') as f:
-            #                                     st.download_button(
-            #                                         label="Download Excel Export",
-            #                                         data=f,
-            #                                         file_name=temp_file,
-            #                                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            #                                     )
-            #                     else:
-            #                         error_msg = "Failed to save analysis to database - no data returned"
-            #                         if hasattr(response, 'error'):
-            #                             error_msg += f": {response.error}"
-            #                         logger.error(error_msg)
-            #                         st.error(error_msg)
-                                    
-            #                 except Exception as e:
-            #                     logger.error(f"Database error: {str(e)}")
-            #                     st.error(f"Database error: {str(e)}")
-            #                     import traceback
-            #                     trace = traceback.format_exc()
-            #                     logger.error(f"Full error trace:\n{trace}")
-            #                     st.error(f"Full error trace:\n{trace}")
-            #             else:
-            #                 logger.error("Failed to upload image to storage")
-            #                 st.error("Failed to upload image to storage")
-                        
-            #         except Exception as e:
-            #             logger.error(f"Error preparing data: {str(e)}")
-            #             st.error(f"Error preparing data: {str(e)}")
+        record_span("visual_analyzer", time.perf_counter() - analyzer_start)
+
+    record_span("rerun", time.perf_counter() - rerun_start)
+
+    # Performance panel and metrics export
+    with st.sidebar:
+        st.markdown("---")
+        render_metrics_panel()
+    export_metrics(st.secrets.get("metrics", {}))
 
 # Add footer
 st.markdown("---")